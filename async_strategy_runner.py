@@ -3,24 +3,352 @@ from __future__ import annotations
 
 import argparse
 import asyncio
+import functools
 import hashlib
 import inspect
+import threading
 import time
 import os
 import gc
-import re
+import logging
 import pandas as pd
 
-from datetime import datetime
-from typing import Dict, Any
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Any, NamedTuple
 from utils.redis_connector import RedisSignalBus
-from config import Config
+from config import Config, setup_logging
 from execution_router import ExecutionRouter
 from risk_utils import calc_position_size
-from state_store import atomic_read_json, atomic_write_json, atomic_read_pickle
+from state_store import atomic_read_json, atomic_write_bytes, atomic_write_json, atomic_read_pickle, encode_json
 from trade_ledger import TradeLedger
 from notifier import TelegramAlerter
 
+logger = logging.getLogger(__name__)
+protections_log = logging.getLogger(f"{__name__}.protections")  # трейлинг / защитные выходы
+
+# финальные статусы ордера (cancelled нормализуется в canceled)
+_FINAL_STATUSES = frozenset(("filled", "canceled", "cancelled", "rejected", "failed"))
+_CANCELED_STATUSES = frozenset(("canceled", "cancelled"))
+_UNFILLED_FINAL_STATUSES = _FINAL_STATUSES - {"filled"}
+
+# ASCII-байты, которые не [A-Za-z0-9]: удаляются bytes.translate без regex-движка
+_NON_ALNUM_BYTES = bytes(c for c in range(128) if not chr(c).isalnum())
+
+
+def _alnum_prefix(x: str, n: int) -> str:
+    """Аналог re.sub(r"[^A-Za-z0-9]", "", x)[:n]; не-ASCII отбрасывается на encode."""
+    return x.encode("ascii", "ignore").translate(None, _NON_ALNUM_BYTES)[:n].decode("ascii")
+
+
+class _ExecResult(NamedTuple):
+    """Нормализованный ответ _router_execute_order: статус уже lower(), цена 0.0 если брокер её не вернул."""
+    order_id: str
+    status: str
+    price: float
+
+
+def _build_client_id(broker: str, symbol: str, role: str, signal_id: str) -> str:
+    raw = f"{broker}|{symbol}|{role}|{signal_id}"
+    # SHA-1 не менять: client_id хранится в ledger и на бирже, по нему идемпотентность reserve_order
+    h = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+    return f"{_alnum_prefix(broker, 6)}{_alnum_prefix(symbol, 10)}{_alnum_prefix(role, 6)}{h}"
+
+
+# client_id детерминирован по аргументам → безопасно мемоизировать
+_client_id_cached = functools.lru_cache(maxsize=4096)(_build_client_id)
+
+
+def _bind_execute_order(router):
+    """
+    Один раз (при смене роутера) выбираем, как звать execute_order:
+    напрямую, если он принимает client_id, иначе через обёртку, которая client_id отбрасывает.
+    """
+    try:
+        params = inspect.signature(router.execute_order).parameters
+    except (TypeError, ValueError, AttributeError):
+        params = {}
+    if "client_id" in params:
+        return router.execute_order
+
+    async def _execute_without_client_id(*, symbol, side, quantity, order_type, client_id=None):
+        return await router.execute_order(symbol=symbol, side=side, quantity=quantity, order_type=order_type)
+
+    return _execute_without_client_id
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _legacy_created_ms(prot: dict) -> int | None:
+    """
+    created_at_ms для старого persisted state: created_at_ts (float сек), иначе разбор ISO created_at (naive UTC).
+    Вызывается один раз при загрузке protections, не на тике.
+    """
+    ts = prot.get("created_at_ts")
+    if ts:
+        try:
+            return int(float(ts) * 1000)
+        except Exception:
+            pass
+    created_at = prot.get("created_at")
+    if not created_at:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(created_at).replace("Z", ""))
+    except Exception:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+# числовые поля protection: в памяти всегда float (или None = "не задано"), на тике без конверсий
+_PROT_FLOAT_FIELDS = (
+    "sl", "tp", "atr", "qty", "qty_expected", "sl_mult", "tp_mult",
+    "last_price", "entry_price", "max_price", "min_price", "trail_last_ts",
+)
+
+
+def _to_float(x, default: float = 0.0) -> float:
+    """Безопасная конверсия на границах (диск / ledger / брокер): мусор и NaN → default."""
+    try:
+        v = float(x)
+    except (TypeError, ValueError):
+        return default
+    return default if v != v else v
+
+
+def _migrate_protections(prots: dict) -> None:
+    """
+    Приводит загруженные с диска protections к текущему формату один раз при старте:
+    created_at_ms: int, числовые поля — float, trail_count — int.
+    """
+    for prot in prots.values():
+        if not isinstance(prot, dict):
+            continue
+        for key in _PROT_FLOAT_FIELDS:
+            v = prot.get(key)
+            if v is not None:
+                prot[key] = _to_float(v)
+        prot["trail_count"] = int(_to_float(prot.get("trail_count")))
+        if "created_at_ms" in prot:
+            continue
+        ms = _legacy_created_ms(prot)
+        if ms is not None:
+            prot["created_at_ms"] = ms
+        prot.pop("created_at_ts", None)
+        prot.pop("created_at", None)
+
+
+def _new_protection(mode: str, broker: str, trade_id, signal_id, *, last_price: float, **fields) -> dict:
+    """
+    Единая фабрика записи protection: канонические ключи и типы (числа — float, created_at_ms/trail_count — int).
+    Остаётся обычным dict: запись создаётся раз на сделку, персистится как JSON и читается через prot.get(...).
+    """
+    prot = {"mode": mode, "broker": broker, "trade_id": trade_id, "signal_id": signal_id, **fields}
+    for key in _PROT_FLOAT_FIELDS:
+        v = prot.get(key)
+        if v is not None:
+            prot[key] = float(v)
+    prot["last_price"] = float(last_price)
+    prot["created_at_ms"] = _now_ms()
+    prot["trail_count"] = 0
+    return prot
+
+
+def _open_pos_map(positions) -> dict[str, Any]:
+    """
+    symbol → Position только для реально открытых (quantity > 0) позиций, одним проходом.
+    Символ без позиции и с нулевой позицией дальше обрабатываются одинаково (pos is None).
+    """
+    out: dict[str, Any] = {}
+    for p in positions:
+        try:
+            if float(getattr(p, "quantity", 0.0) or 0.0) > 0:
+                out[str(p.symbol)] = p
+        except Exception:
+            continue
+    return out
+
+
+_TF_SECONDS = {"15m": 60 * 15, "1h": 3600, "4h": 3600 * 4, "1d": 86400}
+
+
+def _tf_seconds(tf_str: str) -> int:
+    """Секунды в баре таймфрейма (для TIME EXIT). Неизвестный таймфрейм — как раньше, 1h."""
+    sec = _TF_SECONDS.get(tf_str)
+    if sec is not None:
+        return sec
+    if "4h" in tf_str:
+        return 3600 * 4
+    if "15m" in tf_str:
+        return 60 * 15
+    if "1d" in tf_str:
+        return 86400
+    return 3600
+
+
+def _risk_per_trade(confidence: float, base_risk: float, max_risk: float, threshold: float) -> float:
+    """Линейный риск по уверенности сигнала: base_risk при threshold → max_risk при 1.0 (чистая float-математика)."""
+    scale = min(1.0, max(0.0, (confidence - threshold) / (1.0 - threshold + 1e-6)))
+    return max(base_risk, min(max_risk, base_risk + (max_risk - base_risk) * scale))
+
+
+def _cfg_float(name: str, default: float) -> float:
+    try:
+        v = float(getattr(Config, name, default))
+        return default if v != v else v  # NaN -> default
+    except Exception:
+        return default
+
+
+@dataclass(frozen=True, slots=True)
+class _TrailCfg:
+    """Снимок DYNAMIC_TRAIL_* из Config: читается один раз, а не getattr на символ × тик."""
+    enabled: bool = True
+    breakeven_atr: float = 1.0
+    breakeven_buffer_atr: float = 0.05
+    trigger_dist_atr: float = 2.5
+    trail_offset_atr: float = 0.8
+    min_step_atr: float = 0.10
+    cooldown_s: float = 5.0
+    min_gap_pct: float = 0.001  # 0.1%
+
+    @classmethod
+    def from_config(cls) -> "_TrailCfg":
+        return cls(
+            enabled=bool(getattr(Config, "DYNAMIC_TRAILING_ENABLED", True)),
+            breakeven_atr=_cfg_float("DYNAMIC_TRAIL_BREAKEVEN_ATR", 1.0),
+            breakeven_buffer_atr=_cfg_float("DYNAMIC_TRAIL_BREAKEVEN_BUFFER_ATR", 0.05),
+            trigger_dist_atr=_cfg_float("DYNAMIC_TRAIL_TRIGGER_ATR", 2.5),
+            trail_offset_atr=_cfg_float("DYNAMIC_TRAIL_OFFSET_ATR", 0.8),
+            min_step_atr=_cfg_float("DYNAMIC_TRAIL_MIN_STEP_ATR", 0.10),
+            cooldown_s=_cfg_float("DYNAMIC_TRAIL_COOLDOWN_S", 5.0),
+            min_gap_pct=_cfg_float("DYNAMIC_TRAIL_MIN_GAP_PCT", 0.001),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class _CycleCtx:
+    """Снимок Config для execute_trade: собирается один раз на run_strategy, а не на каждый символ."""
+    pullback_mult: float = 0.0
+    use_native: bool = True
+    strict: bool = False
+    strategy_id: str = "universal"
+    max_notional: float | None = None
+
+    @classmethod
+    def from_config(cls, strict: bool, params: dict | None = None) -> "_CycleCtx":
+        if params is None:
+            try:
+                params = Config.get_strategy_params()
+            except Exception:
+                params = {}
+        return cls(
+            pullback_mult=_to_float(params.get("pullback")),
+            use_native=bool(getattr(Config, "USE_NATIVE_PROTECTIONS", True)),
+            strict=strict,
+            strategy_id=getattr(Config, "STRATEGY_ID", "universal"),
+            max_notional=getattr(Config, "MAX_POSITION_NOTIONAL", None),
+        )
+
+
+def _compute_trail_sl(
+    cp: float,
+    sl_price: float,
+    atr: float,
+    qty: float,
+    entry_price: float,
+    tp_price: float,
+    watermark_price: float,
+    is_whale_active: bool,
+    breakeven_atr: float,
+    breakeven_buffer_atr: float,
+    trigger_dist_atr: float,
+    trail_offset_atr: float,
+    min_step_atr: float,
+    min_gap: float,
+) -> float | None:
+    """
+    Чистое ядро Moon Mode трейлинга: без I/O, без Config и без мутаций prot.
+
+    Возвращает новый SL или None, если двигать нечего (нет кандидата / шаг меньше min_step).
+    LONG (qty > 0) тянем только вверх, SHORT — только вниз.
+    """
+    is_long = qty > 0
+
+    # early-out: итоговый SL зажат между ценой (min_gap) и текущим SL (min_step) —
+    # если зазор cp↔sl не больше их суммы, улучшить SL невозможно, считать кандидатов незачем
+    room = (cp - sl_price) if is_long else (sl_price - cp)
+    if room <= min_gap + atr * min_step_atr:
+        return None
+
+    new_sl_candidate: float | None = None
+
+    # 1) breakeven стадия
+    if entry_price > 0:
+        profit = (cp - entry_price) if is_long else (entry_price - cp)
+        if (profit / atr) >= breakeven_atr:
+            if is_long:
+                # LONG: SL чуть выше entry
+                be_sl = min(entry_price + atr * breakeven_buffer_atr, cp - min_gap)
+                if be_sl > sl_price:
+                    new_sl_candidate = be_sl
+            else:
+                # SHORT: SL чуть ниже entry
+                be_sl = max(entry_price - atr * breakeven_buffer_atr, cp + min_gap)
+                if be_sl < sl_price:
+                    new_sl_candidate = be_sl
+
+    # 2) агрессивный трейл (SQUEEZE LOGIC)
+    if abs(cp - sl_price) > (atr * trigger_dist_atr):
+        # Если обнаружен КИТ (Whale), даем цене дышать (как в execution_core: 4.5 ATR вместо узкого стопа)
+        base_offset = atr * (4.5 if is_whale_active else trail_offset_atr)
+
+        # Если TP есть, считаем Squeeze (сжатие пружины), но не зажимаем кита
+        if tp_price > 0 and not is_whale_active:
+            if is_long:
+                dist_remain = tp_price - watermark_price
+                total_run = tp_price - entry_price
+            else:
+                dist_remain = watermark_price - tp_price  # watermark_price = min_price
+                total_run = entry_price - tp_price
+
+            squeeze_factor = 1.0 if total_run <= 0 else dist_remain / total_run
+            squeeze_factor = max(0.0, min(1.0, squeeze_factor))
+
+            # Динамический отступ: сужаем базу, но не меньше 10% от базы
+            dynamic_offset = max(base_offset * squeeze_factor, base_offset * 0.1)
+        else:
+            # Если TP нет (Moon Mode?), используем линейный отступ
+            dynamic_offset = base_offset
+
+        if is_long:
+            trail_sl = min(watermark_price - dynamic_offset, cp - min_gap)  # Защита от пересечения цены
+            new_sl_candidate = trail_sl if new_sl_candidate is None else max(new_sl_candidate, trail_sl)
+        else:
+            trail_sl = max(watermark_price + dynamic_offset, cp + min_gap)  # SL должен быть ВЫШЕ текущей цены
+            new_sl_candidate = trail_sl if new_sl_candidate is None else min(new_sl_candidate, trail_sl)
+
+    if new_sl_candidate is None:
+        return None
+
+    # --- финальные проверки: шаг и направление ---
+    min_step = atr * min_step_atr
+    if is_long:
+        # LONG: SL должен быть ниже цены, двигаем только вверх
+        new_sl = min(float(new_sl_candidate), cp - min_gap)
+        if new_sl <= (sl_price + min_step):
+            return None
+    else:
+        # SHORT: SL должен быть выше цены, двигаем только вниз
+        new_sl = max(float(new_sl_candidate), cp + min_gap)
+        if new_sl >= (sl_price - min_step):
+            return None
+    return new_sl
+
 
 class AsyncStrategyRunner:
     """
@@ -28,20 +356,98 @@ class AsyncStrategyRunner:
       - Ledger (SQLite) + idempotency на client_id
       - Atomic states: last_seen / snapshots / last_processed_ts
       - Protections: native (plan orders) если возможно, иначе synthetic fallback
+
+    __slots__: атрибуты читаются на каждом тике — без per-instance __dict__.
+    Новый атрибут нужно добавить в __slots__; наследники объявляют свои __slots__.
     """
 
+    __slots__ = (
+        "signals_file",
+        "signals",
+        "_last_rows",
+        "redis_bus",
+        "_signals_mtime",
+        "_signals_version",
+        "_signals_dirty",
+        "_signals_watch_interval_s",
+        "_signals_watch_task",
+        "_exec_impl",
+        "_router",
+        "_trading_lock",
+        "_symbol_locks",
+        "_exits_lock",
+        "_trade_locks",
+        "_trade_lock_users",
+        "_log_throttle",
+        "_kill_switch_active",
+        "_keep_running",
+        "_positions_cache",
+        "_positions_cache_ttl_s",
+        "_price_cache",
+        "_account_cache",
+        "_market_cache_ttl_s",
+        "assets_filter",
+        "_protections",
+        "_state_dir",
+        "_runner_state_file",
+        "_protections_file",
+        "_ledger_db",
+        "ledger",
+        "_runner_state",
+        "_dirty_state",
+        "_dirty_protections",
+        "_flush_interval_s",
+        "_protections_fsync",
+        "_flush_event",
+        "_flush_task",
+        "_persist_lock",
+        "_persist_seq",
+        "_persist_written",
+        "_ledger_flush_interval_s",
+        "_ledger_event",
+        "_ledger_flush_task",
+        "alerter",
+        "_heartbeat_file",
+        "_heartbeat_every_s",
+        "_last_heartbeat_ts",
+        "_heartbeat_pending",
+        "_heartbeat_task",
+        "_trail_cfg",
+    )
+
     def __init__(self,  router: ExecutionRouter | None = None, signals_file: str = "data_cache/production_signals_v1.pkl"):
         self.signals_file = signals_file
         self.signals: Dict[str, pd.DataFrame] = {}
+        self._last_rows: dict[str, tuple[pd.DataFrame, dict | None]] = {}
         self.redis_bus = RedisSignalBus()
+        # --- signals watch: фоновый таск сверяет версию Redis + mtime файла и ставит флаг ---
+        self._signals_mtime: float | None = None
+        self._signals_version: int | None = None
+        self._signals_dirty = False
+        self._signals_watch_interval_s = float(getattr(Config, "SIGNALS_WATCH_INTERVAL_S", 2.0) or 2.0)
+        self._signals_watch_task: asyncio.Task | None = None
         self.router = router if router is not None else ExecutionRouter()
 
         # LIVE safety: сериализуем торговые действия + блокируем новые ордера при kill-switch
-        self._trading_lock = asyncio.Lock()
+        self._trading_lock = asyncio.Lock()  # межсимвольные операции: kill-switch
+        self._symbol_locks: dict[str, asyncio.Lock] = {}  # cancel+replace SL по одному символу
+        self._exits_lock = asyncio.Lock()  # один _check_protective_exits за раз
+        self._trade_locks: dict[str, asyncio.Lock] = {}  # execute_trade по одному символу
+        self._trade_lock_users: dict[str, int] = {}  # сколько execute_trade держат/ждут lock символа
+        self._log_throttle: dict[str, float] = {}
         self._kill_switch_active = False
 
+        # короткий TTL-кеш позиций по брокеру (panic-close пачкой → один запрос к API)
+        self._positions_cache: dict[str, tuple[float, list]] = {}
+        self._positions_cache_ttl_s = float(getattr(Config, "POSITIONS_CACHE_TTL_S", 0.5) or 0.0)
+        # per-cycle кеш market-data: (broker, symbol) → (ts, price), broker → (ts, AccountState)
+        self._price_cache: dict[tuple[str, str], tuple[float, float]] = {}
+        self._account_cache: dict[str, tuple[float, Any]] = {}
+        self._market_cache_ttl_s = float(getattr(Config, "MARKET_CACHE_TTL_S", 2.0) or 0.0)
+
         self.assets_filter: list[str] | None = None
         self._protections: dict[str, dict] = {}
+        self._trail_cfg = _TrailCfg.from_config()
 
         self._state_dir = getattr(Config, "STATE_DIR", "state")
         self._runner_state_file = getattr(Config, "RUNNER_STATE_FILE", os.path.join(self._state_dir, "runner_state.json"))
@@ -55,6 +461,23 @@ class AsyncStrategyRunner:
             self._runner_state_file,
             {"last_seen": {}, "snapshots": {}, "last_processed_ts": {}},
         )
+
+        # --- coalesced persistence: _persist_* только помечают dirty, пишет _flush_loop ---
+        self._dirty_state = False
+        self._dirty_protections = False
+        self._flush_interval_s = float(getattr(Config, "PERSIST_FLUSH_INTERVAL_S", 0.2) or 0.2)
+        self._protections_fsync = bool(getattr(Config, "PROTECTIONS_FSYNC", True))
+        self._flush_event = asyncio.Event()
+        self._flush_task: asyncio.Task | None = None
+        # снимки сериализуются в event loop, а пишутся в потоке; seq не даёт старому снимку перетереть новый
+        self._persist_lock = threading.Lock()
+        self._persist_seq = 0
+        self._persist_written: dict[str, int] = {}
+
+        # --- ledger: mark_order_* / close_trade и т.п. копятся в очереди леджера, пишет _ledger_flush_loop ---
+        self._ledger_flush_interval_s = float(getattr(Config, "LEDGER_FLUSH_INTERVAL_S", 0.05) or 0.05)
+        self._ledger_event = asyncio.Event()
+        self._ledger_flush_task: asyncio.Task | None = None
        
         # --- alerts ---
         self.alerter = TelegramAlerter(
@@ -68,7 +491,19 @@ class AsyncStrategyRunner:
             Config, "HEARTBEAT_FILE", os.path.join(self._state_dir, "runner_heartbeat.json")
         )
         self._heartbeat_every_s = float(getattr(Config, "HEARTBEAT_EVERY_S", 5.0) or 5.0)
-        self._last_heartbeat_ts = 0.0
+        self._last_heartbeat_ts = 0.0  # time.monotonic() последней записи (fallback без фонового таска)
+        self._heartbeat_pending: tuple[float, str, str, dict | None] | None = None
+        self._heartbeat_task: asyncio.Task | None = None
+
+    @property
+    def router(self) -> ExecutionRouter:
+        return self._router
+
+    @router.setter
+    def router(self, value: ExecutionRouter) -> None:
+        # signature execute_order разбираем один раз при смене роутера, а не на каждый ордер
+        self._router = value
+        self._exec_impl = _bind_execute_order(value)
 
     # --- Сверка позиций ---
     async def reconcile_state(self):
@@ -76,7 +511,7 @@ class AsyncStrategyRunner:
         Критически важная функция. Синхронизирует память бота с реальностью (брокером).
         Вызывается ПЕРЕД началом торгов.
         """
-        print("🔄 [RECONCILE] Starting state reconciliation...")
+        logger.info("🔄 [RECONCILE] Starting state reconciliation...")
         try:
             # 1. Запрашиваем у брокера (Bitget или Simulator), что у нас открыто
             # Важно: router.broker должен быть уже инициализирован
@@ -85,11 +520,12 @@ class AsyncStrategyRunner:
             # 2. Очищаем память роутера о позициях
             self.router._active_positions = {} 
             
-            count = 0
+            restored: list[str] = []
+            now = datetime.utcnow()
             for pos in real_positions:
                 # Фильтруем мусорные остатки (пыль)
                 if abs(pos.quantity) > 0:
-                    print(f"   Found existing position: {pos.symbol} Size: {pos.quantity:.4f} @ {pos.avg_price}")
+                    restored.append(f"{pos.symbol} {pos.quantity:.4f}@{pos.avg_price}")
                     
                     # 3. Восстанавливаем позицию в структуру роутера
                     # Структура должна совпадать с тем, что ждет execute_trade
@@ -97,20 +533,32 @@ class AsyncStrategyRunner:
                         'size': pos.quantity,
                         'entry_price': pos.avg_price, 
                         'side': 'long' if pos.quantity > 0 else 'short',
-                        'last_update': datetime.utcnow()
+                        'last_update': now
                     }
-                    count += 1
                     
-            print(f"✅ [RECONCILE] Complete. Restored {count} active positions.")
+            logger.info(
+                "✅ [RECONCILE] Complete. Restored %d active positions%s",
+                len(restored),
+                f": {', '.join(restored)}" if restored else ".",
+            )
             
         except Exception as e:
-            print(f"❌ [RECONCILE FATAL ERROR]: {e}")
+            logger.error("❌ [RECONCILE FATAL ERROR]: %s", e)
             # Если сверка упала — лучше не торговать, иначе наломаем дров
             raise e
 
     async def initialize(self) -> None:
         await self.router.initialize()
         self.load_signals()
+
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        if self._ledger_flush_task is None:
+            self._ledger_flush_task = asyncio.create_task(self._ledger_flush_loop())
+        if self._heartbeat_task is None:
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+        if self._signals_watch_task is None:
+            self._signals_watch_task = asyncio.create_task(self._signals_watch_loop())
         
         # --- Reconcile Router Memory ---
         # Сначала восстанавливаем память роутера, чтобы он знал о позициях
@@ -118,10 +566,16 @@ class AsyncStrategyRunner:
         
         # --- Reconcile Protections ---
         self._protections = atomic_read_json(self._protections_file, {}) or {}
+        _migrate_protections(self._protections)
         self._reconcile_protections()
 
         # (4) reconcile ledger (это старый метод, он сверяет базу данных сделок)
         await self._reconcile_on_startup()
+
+        # Всё, что загружено при старте (модули, сигналы, конфиг), живёт до конца процесса:
+        # убираем это в permanent generation, чтобы плановые сборки GC не обходили его каждый раз.
+        gc.collect()
+        gc.freeze()
     
     def _reconcile_protections(self) -> None:
         """
@@ -131,56 +585,73 @@ class AsyncStrategyRunner:
         """
         if not self._protections:
             return
-        
-        # Получаем символы с реальными позициями
-        active_symbols = set(self.router._active_positions.keys())
-        protection_symbols = set(self._protections.keys())
-        
-        # 1) Удаляем "мёртвые" protections (позиция закрылась на бирже)
-        orphaned_protections = protection_symbols - active_symbols
-        for sym in orphaned_protections:
-            prot = self._protections.pop(sym, {})
-            print(f"🧹 [RECONCILE] Removed orphaned protection for {sym} (position closed on exchange)")
-            
-            # Закрываем trade в ledger если есть
-            trade_id = prot.get("trade_id")
-            if trade_id:
-                try:
-                    # Используем 0.0 как exit_price т.к. не знаем реальную цену закрытия
-                    self.ledger.close_trade(trade_id, 0.0, "reconcile_protection_orphaned")
-                except Exception as e:
-                    print(f"   [WARN] Failed to close trade {trade_id}: {e}")
-        
-        # 2) Предупреждаем о позициях без protections
-        unprotected_positions = active_symbols - protection_symbols
-        for sym in unprotected_positions:
-            pos_info = self.router._active_positions.get(sym, {})
-            print(f"⚠️  [RECONCILE] Position {sym} has NO protections! Size: {pos_info.get('size', '?')}")
-            # TODO: можно автоматически поставить synthetic SL на основе ATR
-        
-        # 3) Синхронизируем qty/entry_price в существующих protections
-        for sym in (protection_symbols & active_symbols):
-            pos_info = self.router._active_positions.get(sym, {})
-            prot = self._protections.get(sym, {})
-            
-            real_qty = pos_info.get('size', 0.0)
-            real_entry = pos_info.get('entry_price', 0.0)
-            
-            # Обновляем если есть расхождение
+
+        prots = self._protections
+        positions = self.router._active_positions
+
+        orphaned: list[str] = []
+        unprotected: list[str] = []
+        synced: list[str] = []
+
+        # один проход по объединению символов: orphaned / unprotected / sync
+        for sym in prots.keys() | positions.keys():
+            pos_info = positions.get(sym)
+            if pos_info is None:
+                # 1) "мёртвая" protection (позиция закрылась на бирже)
+                prot = prots.pop(sym, None) or {}
+                orphaned.append(sym)
+
+                # Закрываем trade в ledger если есть
+                trade_id = prot.get("trade_id")
+                if trade_id:
+                    try:
+                        # Используем 0.0 как exit_price т.к. не знаем реальную цену закрытия
+                        self.ledger.close_trade(trade_id, 0.0, "reconcile_protection_orphaned")
+                    except Exception as e:
+                        logger.warning("[RECONCILE] Failed to close trade %s: %s", trade_id, e)
+                continue
+
+            prot = prots.get(sym)
+            if prot is None:
+                # 2) позиция без protections
+                # TODO: можно автоматически поставить synthetic SL на основе ATR
+                unprotected.append(f"{sym}(size={pos_info.get('size', '?')})")
+                continue
+
+            # 3) синхронизируем qty/entry_price
+            real_qty = _to_float(pos_info.get('size', 0.0))
+            real_entry = _to_float(pos_info.get('entry_price', 0.0))
+            changed = False
             if prot.get("qty") != real_qty:
-                print(f"🔄 [RECONCILE] {sym}: qty {prot.get('qty')} -> {real_qty}")
                 prot["qty"] = real_qty
-            
+                changed = True
             if real_entry > 0 and prot.get("entry_price", 0) != real_entry:
-                print(f"🔄 [RECONCILE] {sym}: entry_price {prot.get('entry_price')} -> {real_entry}")
                 prot["entry_price"] = real_entry
-        
+                changed = True
+            if changed:
+                synced.append(sym)
+
         # 4) Сохраняем очищенные protections
-        if orphaned_protections:
+        if orphaned:
             self._persist_protections()
-            print(f"🛡️  Reconciled protections: {len(self._protections)} active")
-        elif self._protections:
-            print(f"🛡️  Restored protections: {len(self._protections)}")
+
+        # одна сводная строка вместо строки на символ
+        level = logging.WARNING if (orphaned or unprotected) else logging.INFO
+        logger.log(
+            level,
+            "🛡️  [RECONCILE] protections active=%d orphaned_removed=%d synced=%d unprotected=%d%s%s%s",
+            len(prots),
+            len(orphaned),
+            len(synced),
+            len(unprotected),
+            f" | removed: {', '.join(orphaned)}" if orphaned else "",
+            f" | synced: {', '.join(synced)}" if synced else "",
+            f" | NO protections: {', '.join(unprotected)}" if unprotected else "",
+        )
+
+    def reload_config(self) -> None:
+        """Перечитать закешированные Config-настройки (если Config поменяли на лету, напр. из GUI)."""
+        self._trail_cfg = _TrailCfg.from_config()
 
     def set_assets(self, assets: list[str]):
         self.assets_filter = list(assets) if assets else None
@@ -200,6 +671,7 @@ class AsyncStrategyRunner:
         except Exception:
             ts = last_row.get("timestamp") or last_row.get("ts")
         raw = "|".join([symbol, self._safe_ts(ts), str(last_row.get("p_long", "")), str(last_row.get("p_short", ""))])
+        # SHA-1 не менять: signal_id хранится в runner_state (dedupe last_seen) и ledger
         h = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
         return f"{symbol}-{h}"
 
@@ -208,23 +680,62 @@ class AsyncStrategyRunner:
         return "tr-" + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
 
     def _make_client_id(self, broker: str, symbol: str, role: str, signal_id: str) -> str:
-        raw = f"{broker}|{symbol}|{role}|{signal_id}"
-        h = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
-        b = re.sub(r"[^A-Za-z0-9]", "", broker)[:6]
-        s = re.sub(r"[^A-Za-z0-9]", "", symbol)[:10]
-        r = re.sub(r"[^A-Za-z0-9]", "", role)[:6]
-        return f"{b}{s}{r}{h}"
+        return _build_client_id(broker, symbol, role, signal_id)
+
+    def _cached_client_id(self, broker: str, symbol: str, role: str, signal_id: str) -> str:
+        """
+        То же, что _make_client_id, но с LRU-кешем: для sl/tp/exit protection-путей,
+        где (broker, symbol, role, signal_id) повторяются каждый тик.
+        Трейлинг (slt, signal_id кодирует уровень SL) — только через _make_client_id.
+        """
+        return _client_id_cached(broker, symbol, role, signal_id)
 
     async def _router_execute_order(self, *, symbol: str, side: str, quantity: float, order_type: str, client_id: str | None = None):
-        if getattr(self, "_kill_switch_active", False):
+        if self._kill_switch_active:
             raise RuntimeError("KILL-SWITCH active: new orders blocked")    
         
-        fn = getattr(self.router, "execute_order")
-        sig = inspect.signature(fn)
-        kwargs = {"symbol": symbol, "side": side, "quantity": quantity, "order_type": order_type}
-        if client_id and "client_id" in sig.parameters:
-            kwargs["client_id"] = client_id
-        return await fn(**kwargs)
+        try:
+            res = await self._exec_impl(
+                symbol=symbol, side=side, quantity=quantity, order_type=order_type, client_id=client_id or None
+            )
+            # нормализуем ответ брокера один раз: дальше обычный доступ к полям без getattr/str/lower
+            return _ExecResult(
+                order_id=str(getattr(res, "order_id", None) or ""),
+                status=str(getattr(res, "status", None) or "").lower(),
+                price=float(getattr(res, "price", None) or 0.0),
+            )
+        finally:
+            # ордер меняет баланс/позиции (и, возможно, цену) — кеши по нему больше не верны
+            self._account_cache.clear()
+            self._positions_cache.clear()
+            for key in [k for k in self._price_cache if k[1] == symbol]:
+                self._price_cache.pop(key, None)
+
+    @staticmethod
+    def _broker_key(broker) -> str:
+        return getattr(broker, "name", broker.__class__.__name__).lower()
+
+    async def _get_price_cached(self, broker, symbol: str) -> float:
+        """Текущая цена с коротким TTL: в пределах тика один REST-запрос на символ."""
+        key = (self._broker_key(broker), symbol)
+        now_mono = time.monotonic()
+        cached = self._price_cache.get(key)
+        if cached is not None and (now_mono - cached[0]) < self._market_cache_ttl_s:
+            return cached[1]
+        px = float(await broker.get_current_price(symbol))
+        self._price_cache[key] = (now_mono, px)
+        return px
+
+    async def _get_account_cached(self, broker):
+        """AccountState брокера с коротким TTL; сбрасывается после каждого ордера."""
+        key = self._broker_key(broker)
+        now_mono = time.monotonic()
+        cached = self._account_cache.get(key)
+        if cached is not None and (now_mono - cached[0]) < self._market_cache_ttl_s:
+            return cached[1]
+        state = await broker.get_account_state()
+        self._account_cache[key] = (now_mono, state)
+        return state
     
     @staticmethod
     def _mode_value() -> str:
@@ -236,6 +747,51 @@ class AsyncStrategyRunner:
         strict = bool(getattr(Config, "STRICT_PROTECTIONS_LIVE", True))
         return self._mode_value() == "live" and strict
 
+    async def _get_symbol_position(self, symbol: str):
+        """
+        Открытая long-позиция по одному символу (или None).
+        - брокер умеет get_position(symbol) → спрашиваем только этот символ;
+        - иначе list_open_positions() брокера этого символа с коротким TTL-кешем,
+          чтобы пачка panic-close подряд делила один запрос;
+        - если брокер не резолвится — старый путь через router.list_all_positions().
+        """
+        def _is_open(x) -> bool:
+            return x is not None and x.symbol == symbol and float(getattr(x, "quantity", 0.0) or 0.0) > 0
+
+        try:
+            broker = await self.router.get_broker_for_symbol(symbol)
+        except Exception:
+            broker = None
+
+        if broker is not None and hasattr(broker, "get_position"):
+            try:
+                p = await broker.get_position(symbol)
+                return p if _is_open(p) else None
+            except Exception:
+                pass
+
+        positions = None
+        if broker is not None:
+            key = self.router.get_broker_name_for_symbol(symbol)
+            now_mono = time.monotonic()
+            cached = self._positions_cache.get(key)
+            if cached is not None and (now_mono - cached[0]) < self._positions_cache_ttl_s:
+                positions = cached[1]
+            else:
+                try:
+                    positions = await broker.list_open_positions()
+                    self._positions_cache[key] = (now_mono, positions)
+                except Exception:
+                    positions = None
+
+        if positions is None:
+            try:
+                positions = await self.router.list_all_positions()
+            except Exception:
+                positions = []
+
+        return next((x for x in positions if _is_open(x)), None)
+
     async def _panic_close_unprotected(
         self,
         *,
@@ -250,30 +806,29 @@ class AsyncStrategyRunner:
         Пытаемся закрыть позицию немедленно и корректно записать это в ledger.
         """
         # (1) узнаём реальный объём позиции
-        try:
-            positions = await self.router.list_all_positions()
-        except Exception:
-            positions = []
-
-        p = next((x for x in positions if x.symbol == symbol and float(getattr(x, "quantity", 0.0) or 0.0) > 0), None)
+        p = await self._get_symbol_position(symbol)
         if p is None:
-            print(f"ℹ️  PANIC-CLOSE: позиции уже нет {symbol}")
+            logger.info("ℹ️  PANIC-CLOSE: позиции уже нет %s", symbol)
             self._protections.pop(symbol, None)
             self._persist_protections()
             return
 
         qty_to_close = float(getattr(p, "quantity", 0.0) or 0.0)
         if qty_to_close <= 0:
-            print(f"ℹ️  PANIC-CLOSE: qty=0 {symbol}")
+            logger.info("ℹ️  PANIC-CLOSE: qty=0 %s", symbol)
             self._protections.pop(symbol, None)
             self._persist_protections()
             return
 
         # (2) идемпотентный client_id на аварийный выход
-        sid = (signal_id or (self.ledger.get_open_trade(broker_name, symbol) or {}).get("signal_id") or "panic")
+        if not signal_id:
+            ot = await self.ledger.run_read(self.ledger.get_open_trade, broker_name, symbol)
+            signal_id = (ot or {}).get("signal_id")
+        sid = signal_id or "panic"
         exit_client_id = self._make_client_id(broker_name, symbol, "pxit", sid)
 
-        if not self.ledger.reserve_order(
+        if not await self.ledger.run_write(
+            self.ledger.reserve_order,
             exit_client_id,
             broker=broker_name,
             symbol=symbol,
@@ -281,10 +836,11 @@ class AsyncStrategyRunner:
             side="sell",
             payload={"reason": reason, "qty": qty_to_close},
         ):
-            print(f"🧾 Ledger: PANIC EXIT уже делали (client_id={exit_client_id}) → пропуск")
+            logger.info("🧾 Ledger: PANIC EXIT уже делали (client_id=%s) → пропуск", exit_client_id)
             return
 
         # (3) MARKET SELL
+        self._positions_cache.clear()
         try:
             res = await self._router_execute_order(
                 symbol=symbol,
@@ -294,30 +850,35 @@ class AsyncStrategyRunner:
                 client_id=exit_client_id,
             )
         except Exception as e:
-            self.ledger.mark_order_final(exit_client_id, "failed", payload={"error": str(e), "reason": reason})
-            print(f"❌ PANIC EXIT submit failed {symbol}: {e}")
+            await self.ledger.run_write(
+                self.ledger.mark_order_final, exit_client_id, "failed", payload={"error": str(e), "reason": reason}
+            )
+            logger.error("❌ PANIC EXIT submit failed %s: %s", symbol, e)
             return
 
-        self.ledger.mark_order_submitted(
-            exit_client_id, str(getattr(res, "order_id", "")), payload={"qty": qty_to_close, "reason": reason}
-        )
+        st = res.status
+        px = res.price
 
-        st = (str(getattr(res, "status", "")) or "").lower()
-        px = float(getattr(res, "price", 0.0) or 0.0)
+        st2 = None
+        if st in _FINAL_STATUSES:
+            st2 = "canceled" if st in _CANCELED_STATUSES else st
 
-        final_statuses = {"filled", "canceled", "cancelled", "rejected", "failed"}
+        # submitted + final + close_trade — одним commit
+        await self.ledger.run_write(
+            self.ledger.record_order_result,
+            exit_client_id,
+            res.order_id,
+            submitted_payload={"qty": qty_to_close, "reason": reason},
+            final_status=st2,
+            final_payload={"price": px, "reason": reason},
+            close_trade_id=trade_id if st2 == "filled" else None,
+            exit_price=px,
+            exit_reason=reason,
+        )
 
-        if st in final_statuses:
-            st2 = "canceled" if st in {"canceled", "cancelled"} else st
-            self.ledger.mark_order_final(exit_client_id, st2, payload={"price": px, "reason": reason})
-            if st2 == "filled":
-                try:
-                    self.ledger.close_trade(trade_id, px, reason)
-                except Exception:
-                    pass
-        else:
+        if st2 is None:
             # pending/unknown — reconcile добьёт
-            print(f"⏳ PANIC EXIT {symbol}: status={st or 'unknown'} → ждём reconcile")
+            logger.info("⏳ PANIC EXIT %s: status=%s → ждём reconcile", symbol, st or "unknown")
 
         # локально гасим/чистим защиты
         if symbol in self._protections:
@@ -325,15 +886,20 @@ class AsyncStrategyRunner:
             self._persist_protections()
 
     def load_signals(self) -> None:
+        # версию фиксируем ДО чтения: публикация между ними даст лишний reload, а не пропуск
+        self._signals_version = self.redis_bus.get_version()
+        self._signals_dirty = False
+
         # Пробуем читать из Redis
         redis_signals = self.redis_bus.get_signals()
+        self._last_rows.clear()
         
         if redis_signals:
             self.signals = redis_signals
-            print(f"📊 [REDIS] Signals loaded for {len(self.signals)} assets")
+            logger.info("📊 [REDIS] Signals loaded for %s assets", len(self.signals))
         else:
             # Fallback на файл, если Redis пуст
-            print("⚠️ [REDIS] Empty, falling back to file...")
+            logger.warning("⚠️ [REDIS] Empty, falling back to file...")
             self.signals = atomic_read_pickle(self.signals_file, {}) or {}
             
         try:
@@ -341,56 +907,210 @@ class AsyncStrategyRunner:
         except Exception:
             self._signals_mtime = None
 
-    def _maybe_reload_signals(self) -> None:
+    def _last_row(self, symbol: str) -> dict | None:
+        """
+        Последняя строка сигналов символа как dict; кеш живёт, пока self.signals[symbol] — тот же DataFrame.
+        """
+        df = self.signals.get(symbol)
+        if df is None:
+            return None
+        cached = self._last_rows.get(symbol)
+        if cached is not None and cached[0] is df:
+            return cached[1]
+        try:
+            row = df.iloc[-1].to_dict() if not df.empty else None
+        except Exception:
+            row = None
+        self._last_rows[symbol] = (df, row)
+        return row
+
+    def _signals_changed(self) -> bool:
         """
-        Читаем свежие сигналы из Redis на каждом цикле.
-        Это быстро, так как Redis in-memory.
+        Проверка "появились ли новые сигналы": версия в Redis или mtime файла.
+        Блокирующая (Redis RTT + stat) → зовётся из _signals_watch_loop через to_thread.
         """
-        # Просто вызываем load_signals, который теперь ходит в Redis
-        # Можно добавить проверку флага или TTL, но чтение из Redis дешевое.
-        new_signals = self.redis_bus.get_signals()
-        if new_signals:
-            self.signals = new_signals
+        version = self.redis_bus.get_version()
+        if version is not None and version != self._signals_version:
+            return True
+        # без счётчика (старый publisher / Redis недоступен) решает только mtime файла
         try:
             mtime = os.path.getmtime(self.signals_file)
         except Exception:
+            return False
+        return self._signals_mtime is None or mtime > self._signals_mtime
+
+    async def _signals_watch_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._signals_watch_interval_s)
+            try:
+                if await asyncio.to_thread(self._signals_changed):
+                    self._signals_dirty = True
+            except Exception as e:
+                logger.warning("signals watch failed: %s", e)
+
+    def _maybe_reload_signals(self) -> None:
+        """
+        Перечитываем сигналы, только если _signals_watch_loop заметил изменение.
+        На горячем пути — проверка флага, без Redis RTT и stat().
+        """
+        if self._signals_watch_task is None or self._signals_watch_task.done():
+            # фоновый watcher не запущен (run_strategy без initialize) — проверяем синхронно
+            if self._signals_changed():
+                self.load_signals()
             return
-        if getattr(self, "_signals_mtime", None) is None:
-            self._signals_mtime = mtime
-            return
-        if mtime > self._signals_mtime:
+        if self._signals_dirty:
             self.load_signals()
 
     def _persist_state(self) -> None:
-        atomic_write_json(self._runner_state_file, self._runner_state)
+        self._dirty_state = True
+        self._schedule_flush()
+
+    def _should_log(self, key: str, interval: float = 1.0) -> bool:
+        """Троттлинг повторяющихся сообщений: не чаще одного на key за interval секунд."""
+        now = time.monotonic()
+        if now - self._log_throttle.get(key, -interval) < interval:
+            return False
+        self._log_throttle[key] = now
+        return True
+
+    def _lock_for(self, symbol: str) -> asyncio.Lock:
+        lock = self._symbol_locks.get(symbol)
+        if lock is None:
+            lock = self._symbol_locks[symbol] = asyncio.Lock()
+        return lock
 
     def _touch_heartbeat(self, status: str, *, note: str = "", extra: dict | None = None) -> None:
         """
-        Пишем heartbeat-файл, который внешний watchdog может мониторить.
+        Отмечаем heartbeat, который внешний watchdog может мониторить.
         status: alive/ok/error/stopped
+
+        Сам файл пишет _heartbeat_loop раз в HEARTBEAT_EVERY_S (последняя отметка побеждает),
+        здесь только запоминаем отметку — без I/O в торговом цикле.
         """
-        now_ts = time.time()
-        if (now_ts - float(getattr(self, "_last_heartbeat_ts", 0.0) or 0.0)) < self._heartbeat_every_s:
-            return
+        self._heartbeat_pending = (time.time(), str(status), str(note or ""), extra)
 
-        self._last_heartbeat_ts = now_ts
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            now_mono = time.monotonic()
+            if (now_mono - self._last_heartbeat_ts) < self._heartbeat_every_s:
+                return
+            self._last_heartbeat_ts = now_mono
+            self._write_heartbeat()
+
+    def _write_heartbeat(self) -> None:
+        pending = self._heartbeat_pending
+        if pending is None:
+            return
+        self._heartbeat_pending = None
+        ts, status, note, extra = pending
 
         payload = {
-            "updated_at": datetime.utcnow().isoformat(),
-            "ts": now_ts,
+            "updated_at": datetime.utcfromtimestamp(ts).isoformat(),
+            "ts": ts,
             "pid": os.getpid(),
-            "status": str(status),
-            "note": str(note or ""),
+            "status": status,
+            "note": note,
             "mode": self._mode_value(),
             "universe": str(getattr(Config, "UNIVERSE_MODE", "")),
         }
         if extra:
             payload["extra"] = extra
 
-        atomic_write_json(self._heartbeat_file, payload)
+        # stale heartbeat после краша не страшен → без fsync, только tmp + os.replace
+        atomic_write_json(self._heartbeat_file, payload, fsync=False)
 
-    def _persist_protections(self) -> None:
-        atomic_write_json(self._protections_file, self._protections)
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._heartbeat_every_s)
+            try:
+                self._write_heartbeat()
+            except Exception as e:
+                logger.warning("heartbeat write failed: %s", e)
+
+    def _persist_protections(self, *, force: bool = False) -> None:
+        """
+        Помечает protections dirty; пишет _flush_loop не чаще PERSIST_FLUSH_INTERVAL_S.
+        force=True — записать немедленно (SL на бирже уже изменён, а strict-режим не прощает потерю).
+        """
+        self._dirty_protections = True
+        if force:
+            self.flush_now()
+            return
+        self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        # без фонового flush-таска (initialize не вызывали) пишем сразу, как раньше
+        if self._flush_task is None or self._flush_task.done():
+            self.flush_now()
+            return
+        self._flush_event.set()
+
+    def flush_now(self) -> None:
+        """
+        Синхронно сбрасывает на диск всё, что помечено dirty.
+        Вызывается из _flush_loop и напрямую на критических путях (kill-switch, остановка).
+        """
+        self._write_snapshots(self._take_snapshots())
+        self.ledger.flush_pending()
+
+    def _take_snapshots(self) -> list[tuple[str, bytes, bool, int]]:
+        """Сериализует dirty-файлы в bytes (в потоке event loop — единственном, кто мутирует эти dict'ы)."""
+        snaps: list[tuple[str, bytes, bool, int]] = []
+        if not (self._dirty_protections or self._dirty_state):
+            return snaps
+        self._persist_seq += 1
+        seq = self._persist_seq
+        if self._dirty_protections:
+            self._dirty_protections = False
+            snaps.append((self._protections_file, encode_json(self._protections), self._protections_fsync, seq))
+        if self._dirty_state:
+            self._dirty_state = False
+            snaps.append((self._runner_state_file, encode_json(self._runner_state), True, seq))
+        return snaps
+
+    def _write_snapshots(self, snaps: list[tuple[str, bytes, bool, int]]) -> None:
+        if not snaps:
+            return
+        with self._persist_lock:
+            for path, data, fsync, seq in snaps:
+                if seq <= self._persist_written.get(path, 0):
+                    continue  # уже записан более свежий снимок (force-flush обогнал фоновый)
+                atomic_write_bytes(path, data, fsync=fsync)
+                self._persist_written[path] = seq
+
+    def _ledger_submit(self, method: str, *args, **kwargs) -> None:
+        """
+        Fire-and-forget запись в ledger (mark_order_* / set_trade_entry / close_trade / abort_trade).
+        reserve_order сюда НЕ идёт: он решает, можно ли отправлять ордер, поэтому его ждём через ledger.run_write.
+        """
+        self.ledger.submit(method, *args, **kwargs)
+        if self._ledger_flush_task is None or self._ledger_flush_task.done():
+            # фоновый writer не запущен — пишем сразу, как раньше
+            self.ledger.flush_pending()
+            return
+        self._ledger_event.set()
+
+    async def _ledger_flush_loop(self) -> None:
+        """Копим записи LEDGER_FLUSH_INTERVAL_S и применяем пачкой (один commit) в writer-потоке леджера."""
+        while True:
+            await self._ledger_event.wait()
+            self._ledger_event.clear()
+            await asyncio.sleep(self._ledger_flush_interval_s)
+            try:
+                await self.ledger.run_write(self.ledger.flush_pending)
+            except Exception as e:
+                logger.warning("ledger flush failed: %s", e)
+
+    async def _flush_loop(self) -> None:
+        """Коалесцирует все _persist_* за интервал в одну запись каждого файла."""
+        while True:
+            await self._flush_event.wait()
+            self._flush_event.clear()
+            await asyncio.sleep(self._flush_interval_s)
+            try:
+                # json/fsync — в поток, чтобы тик не ждал диск; ledger сбрасывает свой _ledger_flush_loop
+                await asyncio.to_thread(self._write_snapshots, self._take_snapshots())
+            except Exception as e:
+                logger.warning("persist flush failed: %s", e)
 
     def _read_kill_switch(self) -> dict:
         path = getattr(Config, "KILL_SWITCH_FILE", os.path.join(self._state_dir, "kill_switch.json"))
@@ -402,13 +1122,17 @@ class AsyncStrategyRunner:
 
     async def _handle_kill_switch(self, reason: str = "manual") -> None:
         await self.alerter.send(f"🧯 KILL-SWITCH: {reason}")
-        print(f"🧯 KILL-SWITCH ENABLED: {reason}")
+        logger.warning("🧯 KILL-SWITCH ENABLED: %s", reason)
 
         # 0) блокируем любые новые ордера из стратегии/защит
         self._kill_switch_active = True
 
         # 1) сериализуем действия (защиты/закрытия) — чтобы не было гонок
         async with self._trading_lock:
+            # дожидаемся трейлов, которые уже начали cancel+replace (новые увидят _kill_switch_active)
+            for lock in list(self._symbol_locks.values()):
+                async with lock:
+                    pass
             try:
                 # (A) сначала гасим НАТИВНЫЕ plan-ордера (SL/TP)
                 if self._protections:
@@ -419,7 +1143,7 @@ class AsyncStrategyRunner:
                             br = await self.router.get_broker_for_symbol(sym)
                             await self._cancel_native_protections(sym, br, prot)
                         except Exception as e:
-                            print(f"[WARN] kill-switch: cancel native protections failed for {sym}: {e}")
+                            logger.warning("kill-switch: cancel native protections failed for %s: %s", sym, e)
 
                 # (B) затем закрываем позиции (router сам отменяет обычные активные ордера)
                 await self.router.close_all_positions(reason=reason)
@@ -427,6 +1151,7 @@ class AsyncStrategyRunner:
             finally:
                 self._protections = {}
                 self._persist_protections()
+                self.flush_now()
 
     async def _cancel_native_protections(self, symbol: str, broker, prot: dict) -> None:
         """
@@ -444,9 +1169,9 @@ class AsyncStrategyRunner:
             if hasattr(broker, "cancel_plan_order"):
                 try:
                     await broker.cancel_plan_order(order_id=str(od))
-                    print(f"🧹 native {symbol} {leg} cancelled: {od}")
+                    protections_log.info("🧹 native %s %s cancelled: %s", symbol, leg, od)
                 except Exception as e:
-                    print(f"[WARN] cancel_plan_order failed {symbol} {leg}: {e}")
+                    protections_log.warning("cancel_plan_order failed %s %s: %s", symbol, leg, e)
 
     async def _reconcile_on_startup(self) -> None:
         """
@@ -461,32 +1186,43 @@ class AsyncStrategyRunner:
             positions = []
         pos_map = {p.symbol: p for p in positions}
 
-        open_trades = self.ledger.list_open_trades()
+        open_trades = await self.ledger.run_read(self.ledger.list_open_trades)
 
         # 1) ledger open, но позиции нет -> закрыть
+        missing: list[dict] = []
         for t in open_trades:
             sym = t.get("symbol")
-            broker_name = (t.get("broker") or "").lower()
             if not sym:
                 continue
             p = pos_map.get(sym)
             if not p or float(getattr(p, "quantity", 0.0) or 0.0) <= 0:
-                # закрываем “как факт”: позиции нет
-                try:
-                    br = await self.router.get_broker_for_symbol(sym)
-                    px = float(await br.get_current_price(sym))
-                except Exception:
-                    px = float(t.get("entry_price") or 0.0)
-                self.ledger.close_trade(t["trade_id"], px, "reconcile_missing_position")
-                self._protections.pop(sym, None)
+                missing.append(t)
+
+        # цены тянем параллельно (семафор — чтобы не упереться в rate limit брокера)
+        sem = asyncio.Semaphore(int(getattr(Config, "RECONCILE_PRICE_CONCURRENCY", 10) or 10))
+
+        async def _price(sym: str) -> float:
+            async with sem:
+                br = await self.router.get_broker_for_symbol(sym)
+                return float(await br.get_current_price(sym))
+
+        prices = await asyncio.gather(*(_price(t["symbol"]) for t in missing), return_exceptions=True)
+
+        for t, px in zip(missing, prices):
+            # закрываем “как факт”: позиции нет
+            if isinstance(px, BaseException):
+                px = float(t.get("entry_price") or 0.0)
+            await self.ledger.run_write(self.ledger.close_trade, t["trade_id"], px, "reconcile_missing_position")
+            self._protections.pop(t["symbol"], None)
 
         # 2) позиция есть, но ledger open trade нет -> создать orphan trade
+        orphans: list[str] = []
         for sym, p in pos_map.items():
 
             self._protections.pop(sym, None)
 
             broker_name = (getattr(p, "broker", "") or "").lower() or "router"
-            if self.ledger.has_open_trade(broker_name, sym):
+            if await self.ledger.run_read(self.ledger.has_open_trade, broker_name, sym):
                 continue
             qty = float(getattr(p, "quantity", 0.0) or 0.0)
             if qty <= 0:
@@ -494,7 +1230,8 @@ class AsyncStrategyRunner:
 
             trade_id = f"reconcile-{broker_name}-{sym}-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
             entry_client_id = f"reconcile-entry-{broker_name}-{sym}"
-            self.ledger.upsert_trade(
+            await self.ledger.run_write(
+                self.ledger.upsert_trade,
                 trade_id=trade_id,
                 strategy_id=getattr(Config, "STRATEGY_ID", "universal"),
                 broker=broker_name,
@@ -503,8 +1240,18 @@ class AsyncStrategyRunner:
                 signal_id="reconcile_orphan_position",
                 entry_client_id=entry_client_id,
             )
-            self.ledger.set_trade_entry(trade_id, float(getattr(p, "avg_price", 0.0) or 0.0), qty)
-            print(f"🧾 Reconcile: created orphan trade for {broker_name}:{sym} qty={qty}")
+            await self.ledger.run_write(
+                self.ledger.set_trade_entry, trade_id, float(getattr(p, "avg_price", 0.0) or 0.0), qty
+            )
+            orphans.append(f"{broker_name}:{sym} qty={qty}")
+
+        if missing or orphans:
+            logger.info(
+                "🧾 Reconcile ledger: closed %d trades without position, created %d orphan trades%s",
+                len(missing),
+                len(orphans),
+                f" ({', '.join(orphans)})" if orphans else "",
+            )
 
         self._persist_protections()
 
@@ -512,10 +1259,7 @@ class AsyncStrategyRunner:
     def _compute_risk_per_trade(confidence: float, base_risk: float, max_risk: float, threshold: float) -> float:
         if confidence is None:
             return base_risk
-        scale = (confidence - threshold) / (1.0 - threshold + 1e-6)
-        scale = max(0.0, min(1.0, scale))
-        risk = base_risk + (max_risk - base_risk) * scale
-        return max(base_risk, min(max_risk, risk))
+        return _risk_per_trade(confidence, base_risk, max_risk, threshold)
     
     async def _update_dynamic_trailing(self, symbol: str, current_price: float, prot: dict, is_whale_active: bool = False) -> bool:
         """
@@ -545,56 +1289,37 @@ class AsyncStrategyRunner:
         if not trade_id:
             return False
 
-        # --- safe float helper ---
-        def _f(x, default: float = 0.0) -> float:
-            try:
-                v = float(x)
-                if v != v:  # NaN
-                    return default
-                return v
-            except Exception:
-                return default
-
-        cp = _f(current_price, 0.0)
-        if cp <= 0:
+        # числовые поля prot канонизированы при записи/загрузке (_migrate_protections) → без конверсий
+        cp = current_price
+        if not cp > 0:  # заодно отсекает NaN
             return False
 
-        sl_price = _f(prot.get("sl"), 0.0)
-        atr = _f(prot.get("atr"), 0.0)
-        qty = _f(prot.get("qty"), 0.0)
+        sl_price = prot.get("sl") or 0.0
+        atr = prot.get("atr") or 0.0
+        qty = prot.get("qty") or 0.0
 
         # без SL/ATR/qty двигать нечего
-        if sl_price <= 0 or atr <= 0 or qty <= 0:
+        if not (sl_price > 0 and atr > 0 and qty > 0):  # форма "not >" пропускает и NaN
             return False
 
-        # --- config knobs (все с дефолтами, чтобы не падать если нет в Config) ---
-        enabled = bool(getattr(Config, "DYNAMIC_TRAILING_ENABLED", True))
-        if not enabled:
+        # --- config knobs: снимок Config (_TrailCfg), собирается в __init__ / reload_config ---
+        cfg = self._trail_cfg
+        if not cfg.enabled:
             return False
 
-        breakeven_atr = _f(getattr(Config, "DYNAMIC_TRAIL_BREAKEVEN_ATR", 1.0), 1.0)
-        breakeven_buffer_atr = _f(getattr(Config, "DYNAMIC_TRAIL_BREAKEVEN_BUFFER_ATR", 0.05), 0.05)
-
-        trigger_dist_atr = _f(getattr(Config, "DYNAMIC_TRAIL_TRIGGER_ATR", 2.5), 2.5)
-        trail_offset_atr = _f(getattr(Config, "DYNAMIC_TRAIL_OFFSET_ATR", 0.8), 0.8)
-
-        min_step_atr = _f(getattr(Config, "DYNAMIC_TRAIL_MIN_STEP_ATR", 0.10), 0.10)
-        cooldown_s = _f(getattr(Config, "DYNAMIC_TRAIL_COOLDOWN_S", 5.0), 5.0)
-
         # минимальный зазор от текущей цены (спрэд/шум)
-        min_gap_pct = _f(getattr(Config, "DYNAMIC_TRAIL_MIN_GAP_PCT", 0.001), 0.001)  # 0.1%
-        min_gap = max(cp * min_gap_pct, atr * 0.05)
+        min_gap = max(cp * cfg.min_gap_pct, atr * 0.05)
 
         # --- anti-chatter: cooldown ---
         now_ts = time.time()
-        last_ts = _f(prot.get("trail_last_ts"), 0.0)
-        if cooldown_s > 0 and last_ts > 0 and (now_ts - last_ts) < cooldown_s:
+        last_ts = prot.get("trail_last_ts") or 0.0
+        if cfg.cooldown_s > 0 and last_ts > 0 and (now_ts - last_ts) < cfg.cooldown_s:
             return False
 
         # --- local price watermark (max for LONG, min for SHORT) ---
         if qty > 0:
             # LONG: отслеживаем максимум цены
-            prev_max = _f(prot.get("max_price"), 0.0)
+            prev_max = prot.get("max_price") or 0.0
             if prev_max <= 0:
                 prev_max = cp
             max_price = max(prev_max, cp)
@@ -602,19 +1327,24 @@ class AsyncStrategyRunner:
             watermark_price = max_price
         else:
             # SHORT: отслеживаем минимум цены
-            prev_min = _f(prot.get("min_price"), 0.0)
+            prev_min = prot.get("min_price") or 0.0
             if prev_min <= 0:
                 prev_min = cp
             min_price = min(prev_min, cp)
             prot["min_price"] = min_price
             watermark_price = min_price
 
+        # --- early-out: до похода в ledger за entry_price (та же проверка, что в _compute_trail_sl) ---
+        room = (cp - sl_price) if qty > 0 else (sl_price - cp)
+        if room <= min_gap + atr * cfg.min_step_atr:
+            return False
+
         # --- entry price: кешируем из prot / ledger / open_trade ---
-        entry_price = _f(prot.get("entry_price"), 0.0)
+        entry_price = prot.get("entry_price") or 0.0
 
         if entry_price <= 0 and hasattr(self.ledger, "get_trade_entry_price"):
             try:
-                entry_price = _f(self.ledger.get_trade_entry_price(trade_id), 0.0)
+                entry_price = _to_float(await self.ledger.run_read(self.ledger.get_trade_entry_price, trade_id))
             except Exception:
                 entry_price = 0.0
 
@@ -622,142 +1352,38 @@ class AsyncStrategyRunner:
             broker_name_guess = (str(prot.get("broker") or "")).lower().strip()
             if broker_name_guess and hasattr(self.ledger, "get_open_trade"):
                 try:
-                    ot = self.ledger.get_open_trade(broker_name_guess, symbol) or {}
-                    entry_price = _f(ot.get("entry_price"), 0.0)
+                    ot = await self.ledger.run_read(self.ledger.get_open_trade, broker_name_guess, symbol) or {}
+                    entry_price = _to_float(ot.get("entry_price"))
                 except Exception:
                     entry_price = 0.0
 
         if entry_price > 0:
             prot["entry_price"] = entry_price
 
-        # --- stage logic: выбираем лучший кандидат SL (только вверх) ---
-        new_sl_candidate: float | None = None
+        # --- stage logic: чистый расчёт нового SL (breakeven / squeeze trail / шаг) ---
+        if is_whale_active and abs(cp - sl_price) > (atr * cfg.trigger_dist_atr):
+            if self._should_log(f"whale:{symbol}", 60.0):
+                protections_log.info("🐋 WHALE DETECTED on %s: Widening trail to 4.5 ATR", symbol)
 
-        # 1) breakeven стадия
-        if entry_price > 0:
-            if qty > 0:
-                # LONG: профит = цена выросла
-                profit = cp - entry_price
-            else:
-                # SHORT: профит = цена упала
-                profit = entry_price - cp
-            
-            profit_atr = (profit / atr) if atr > 0 else 0.0
-            
-            if profit_atr >= breakeven_atr:
-                if qty > 0:
-                    # LONG: SL чуть выше entry
-                    be_sl = entry_price + (atr * breakeven_buffer_atr)
-                    be_sl = min(be_sl, cp - min_gap)
-                    if be_sl > sl_price:
-                        new_sl_candidate = be_sl
-                else:
-                    # SHORT: SL чуть ниже entry
-                    be_sl = entry_price - (atr * breakeven_buffer_atr)
-                    be_sl = max(be_sl, cp + min_gap)
-                    if be_sl < sl_price:
-                        new_sl_candidate = be_sl
-
-        # 2) агрессивный трейл (SQUEEZE LOGIC)
-        current_dist = abs(cp - sl_price)
-        if current_dist > (atr * trigger_dist_atr):
-            
-            # Достаем TP из protections
-            tp_price_val = _f(prot.get("tp"), 0.0)
-            # [FIX START] Логика ширины трейлинга
-            # Дефолтный отступ
-            base_offset = atr * trail_offset_atr
-            
-            # Если обнаружен КИТ (Whale), даем цене дышать (как в execution_core: 4.5 ATR вместо узкого стопа)
-            if is_whale_active:
-                # В execution_core было: current_trail_mult = 4.5
-                # Здесь мы динамически расширяем оффсет
-                base_offset = atr * 4.5 
-                print(f"🐋 WHALE DETECTED on {symbol}: Widening trail to 4.5 ATR")
-            
-            # Если TP есть, считаем Squeeze (сжатие пружины), но не зажимаем кита
-            if tp_price_val > 0 and not is_whale_active:
-                if qty > 0:  # LONG
-                    dist_remain = tp_price_val - watermark_price
-                    total_run = tp_price_val - entry_price
-                else:  # SHORT
-                    dist_remain = watermark_price - tp_price_val  # watermark_price = min_price
-                    total_run = entry_price - tp_price_val
-                
-                if total_run <= 0: squeeze_factor = 1.0
-                else: squeeze_factor = dist_remain / total_run
-                
-                # Клиппинг фактора (0..1)
-                squeeze_factor = max(0.0, min(1.0, squeeze_factor))
-                
-                # Динамический отступ: сужаем базу, но не меньше 10% от базы
-                dynamic_offset = base_offset * squeeze_factor
-                dynamic_offset = max(dynamic_offset, base_offset * 0.1)
-            else:
-                # Если TP нет (Moon Mode?), используем линейный отступ
-                dynamic_offset = base_offset
-
-            if qty > 0:  # LONG
-                trail_sl = watermark_price - dynamic_offset
-                trail_sl = min(trail_sl, cp - min_gap)  # Защита от пересечения цены
-                if new_sl_candidate is None:
-                    new_sl_candidate = trail_sl
-                else:
-                    new_sl_candidate = max(new_sl_candidate, trail_sl)
-            
-            else:  # SHORT
-                trail_sl = watermark_price + dynamic_offset  # watermark_price = min_price для SHORT
-                trail_sl = max(trail_sl, cp + min_gap)  # SL должен быть ВЫШЕ текущей цены
-                if new_sl_candidate is None:
-                    new_sl_candidate = trail_sl
-                else:
-                    new_sl_candidate = min(new_sl_candidate, trail_sl)
-
-            # Защита: стоп не должен пересекать цену (gap)
-            if qty > 0:
-                trail_sl = min(trail_sl, cp - min_gap)
-            else:
-                trail_sl = max(trail_sl, cp + min_gap)
-
-            if new_sl_candidate is None:
-                new_sl_candidate = trail_sl
-            else:
-                # Для лонга тянем вверх (max), для шорта тянем вниз (min)
-                if qty > 0:
-                    new_sl_candidate = max(new_sl_candidate, trail_sl)
-                else:
-                    new_sl_candidate = min(new_sl_candidate, trail_sl)
-
-        if new_sl_candidate is None:
+        new_sl = _compute_trail_sl(
+            cp, sl_price, atr, qty, entry_price, prot.get("tp") or 0.0, watermark_price, is_whale_active,
+            cfg.breakeven_atr, cfg.breakeven_buffer_atr, cfg.trigger_dist_atr, cfg.trail_offset_atr,
+            cfg.min_step_atr, min_gap,
+        )
+        if new_sl is None:
             return False
 
-        # --- финальные проверки: шаг и направление ---
-        new_sl = float(new_sl_candidate)
-        
-        if qty > 0:
-            # LONG: SL должен быть ниже цены, двигаем только вверх
-            new_sl = min(new_sl, cp - min_gap)  # не в упор к цене
-            min_step = atr * min_step_atr
-            if new_sl <= (sl_price + min_step):
-                return False
-        else:
-            # SHORT: SL должен быть выше цены, двигаем только вниз
-            new_sl = max(new_sl, cp + min_gap)  # не в упор к цене
-            min_step = atr * min_step_atr
-            if new_sl >= (sl_price - min_step):
-                return False
-
         # =========================
         # MODE: SYNTHETIC
         # =========================
         if mode == "synthetic":
             prot["sl"] = new_sl
             prot["trail_last_ts"] = now_ts
-            prot["trail_count"] = int(_f(prot.get("trail_count"), 0.0)) + 1
+            prot["trail_count"] = int(prot.get("trail_count") or 0) + 1
 
-            print(
-                f"🚀 MOON MODE {symbol} [synthetic {'SHORT' if qty < 0 else 'LONG'}]: SL {sl_price:.6f} -> {new_sl:.6f} "
-                f"(cp={cp:.6f}, atr={atr:.6f}, wm={watermark_price:.6f})"
+            protections_log.info(
+                "🚀 MOON MODE %s [synthetic %s]: SL %.6f -> %.6f (cp=%.6f, atr=%.6f, wm=%.6f)",
+                symbol, "SHORT" if qty < 0 else "LONG", sl_price, new_sl, cp, atr, watermark_price,
             )
             
             # CRITICAL: Немедленный persist после изменения SL
@@ -772,21 +1398,26 @@ class AsyncStrategyRunner:
         if self._mode_value() != "live":
             prot["sl"] = new_sl
             prot["trail_last_ts"] = now_ts
-            prot["trail_count"] = int(_f(prot.get("trail_count"), 0.0)) + 1
-            print(
-                f"🚀 MOON MODE {symbol} [native-sim {'SHORT' if qty < 0 else 'LONG'}]: SL {sl_price:.6f} -> {new_sl:.6f} (no-broker, mode={self._mode_value()})"
+            prot["trail_count"] = int(prot.get("trail_count") or 0) + 1
+            protections_log.info(
+                "🚀 MOON MODE %s [native-sim %s]: SL %.6f -> %.6f (no-broker, mode=%s)",
+                symbol, "SHORT" if qty < 0 else "LONG", sl_price, new_sl, self._mode_value(),
             )
             # CRITICAL: Немедленный persist после изменения SL
             self._persist_protections()
             return True
 
-        # LIVE native: cancel+replace SL только под lock (чтобы не было гонок с kill-switch/exit)
-        async with self._trading_lock:
+        # LIVE native: cancel+replace SL под lock СИМВОЛА — трейлы разных символов не ждут друг друга.
+        # Kill-switch дожидается всех символьных lock'ов, поэтому флаг проверяем уже под lock'ом.
+        async with self._lock_for(symbol):
+            if self._kill_switch_active:
+                return False
+
             # 1) получаем брокера
             try:
                 broker = await self.router.get_broker_for_symbol(symbol)
             except Exception as e:
-                print(f"[WARN] {symbol}: native trail skipped (broker resolve failed): {e}")
+                protections_log.warning("%s: native trail skipped (broker resolve failed): %s", symbol, e)
                 return False
 
             broker_name = (str(getattr(broker, "name", "")) or str(prot.get("broker") or "router")).lower().strip()
@@ -809,7 +1440,8 @@ class AsyncStrategyRunner:
 
             # reserve (если не прошло — значит уже пытались этот конкретный шаг)
             try:
-                ok = self.ledger.reserve_order(
+                ok = await self.ledger.run_write(
+                    self.ledger.reserve_order,
                     new_sl_client_id,
                     broker=broker_name,
                     symbol=symbol,
@@ -831,24 +1463,25 @@ class AsyncStrategyRunner:
                     old_client_id = prot.get("sl_client_id")
                     if old_client_id:
                         try:
-                            self.ledger.mark_order_final(old_client_id, "canceled", payload={"replaced_by": new_sl_client_id})
+                            self._ledger_submit("mark_order_final", old_client_id, "canceled", payload={"replaced_by": new_sl_client_id})
                         except Exception:
                             pass
                 except Exception as e:
                     try:
-                        self.ledger.mark_order_final(new_sl_client_id, "failed", payload={"error": f"cancel_old_sl_failed: {e}"})
+                        self._ledger_submit("mark_order_final", new_sl_client_id, "failed", payload={"error": f"cancel_old_sl_failed: {e}"})
                     except Exception:
                         pass
-                    print(f"[WARN] {symbol}: native trail cancel_old_sl failed: {e}")
+                    protections_log.warning("%s: native trail cancel_old_sl failed: %s", symbol, e)
                     return False
 
             # 6) ставим новый SL (tp_price=None — чтобы TP остался как был)
             if not hasattr(broker, "place_protection_orders"):
                 try:
-                    self.ledger.mark_order_final(new_sl_client_id, "failed", payload={"error": "broker_has_no_place_protection_orders"})
+                    self._ledger_submit("mark_order_final", new_sl_client_id, "failed", payload={"error": "broker_has_no_place_protection_orders"})
                 except Exception:
                     pass
-                print(f"[WARN] {symbol}: native trail skipped (broker has no place_protection_orders)")
+                if self._should_log(f"no_ppo:{symbol}", 60.0):
+                    protections_log.warning("%s: native trail skipped (broker has no place_protection_orders)", symbol)
                 return False
 
             # qty normalize (как у тебя в entry)
@@ -874,7 +1507,7 @@ class AsyncStrategyRunner:
                     raise RuntimeError("Native SL placement returned empty order_id")
 
                 try:
-                    self.ledger.mark_order_submitted(new_sl_client_id, new_order_id, payload={"sl": new_sl, "qty": qty_n})
+                    self._ledger_submit("mark_order_submitted", new_sl_client_id, new_order_id, payload={"sl": new_sl, "qty": qty_n})
                 except Exception:
                     pass
 
@@ -882,28 +1515,28 @@ class AsyncStrategyRunner:
                 prot["sl"] = float(new_sl)
                 prot["sl_client_id"] = new_sl_client_id
                 prot["trail_last_ts"] = now_ts
-                prot["trail_count"] = int(_f(prot.get("trail_count"), 0.0)) + 1
+                prot["trail_count"] = int(prot.get("trail_count") or 0) + 1
 
                 prot["native"] = prot.get("native", {}) or {}
                 prot["native"]["sl"] = {
                     "order_id": str(new_order_id),
                     "prev_order_id": str(old_sl_order_id) if old_sl_order_id else None,
-                    "updated_at": datetime.utcnow().isoformat(),
+                    "updated_at_ms": _now_ms(),
                 }
 
-                print(
-                    f"🚀 MOON MODE {symbol} [native {'SHORT' if qty < 0 else 'LONG'}]: SL {sl_price:.6f} -> {new_sl:.6f} "
-                    f"(cp={cp:.6f}, atr={atr:.6f}, wm={watermark_price:.6f}, oid={new_order_id})"
+                protections_log.info(
+                    "🚀 MOON MODE %s [native %s]: SL %.6f -> %.6f (cp=%.6f, atr=%.6f, wm=%.6f, oid=%s)",
+                    symbol, "SHORT" if qty < 0 else "LONG", sl_price, new_sl, cp, atr, watermark_price, new_order_id,
                 )
                 
-                # CRITICAL: Немедленный persist после изменения SL на бирже
-                self._persist_protections()
+                # CRITICAL: SL на бирже уже изменён — в strict-режиме пишем немедленно, иначе через flush-loop
+                self._persist_protections(force=self._strict_protections_enabled())
                 
                 return True
 
             except Exception as e:
                 try:
-                    self.ledger.mark_order_final(new_sl_client_id, "failed", payload={"error": str(e), "sl": new_sl})
+                    self._ledger_submit("mark_order_final", new_sl_client_id, "failed", payload={"error": str(e), "sl": new_sl})
                 except Exception:
                     pass
 
@@ -920,74 +1553,127 @@ class AsyncStrategyRunner:
                     except Exception:
                         pass
 
-                print(f"[WARN] {symbol}: native trail failed: {e}")
+                protections_log.warning("%s: native trail failed: %s", symbol, e)
                 return False
 
-    async def _check_protective_exits(self) -> None:
-        if not self._protections:
+    async def _check_protective_exits(self, *, wait: bool = True) -> None:
+        """
+        Один проход по protections за раз: execute_trade по разным символам идут параллельно,
+        и self-heal из pending-ветки не должен гоняться с основным проходом тика.
+        wait=False — если проход уже идёт, просто пропускаем (он и так подхватит символ).
+        """
+        if not wait and self._exits_lock.locked():
             return
+        async with self._exits_lock:
+            await self._scan_protections()
+
+    async def _scan_protections(self) -> None:
+        protections = self._protections
+        if not protections:
+            return
+
+        # Инварианты тика — в локальные переменные (меньше LOAD_ATTR в теле цикла)
+        router = self.router
+        ledger = self.ledger
+        submit = self._ledger_submit
+        cached_cid = self._cached_client_id
+        should_log = self._should_log
+        last_row_of = self._last_row
+        update_trailing = self._update_dynamic_trailing
+        strict = self._strict_protections_enabled()
+        pending_max_age_s = float(getattr(Config, "PENDING_ENTRY_MAX_AGE_S", 120.0) or 120.0)
 
         try:
-            positions = await self.router.list_all_positions()
+            positions = await router.list_all_positions()
         except Exception:
             positions = []
-        pos_map = {p.symbol: p for p in positions}
+        pos_map = _open_pos_map(positions)
 
         to_remove: list[str] = []
+        to_set: dict[str, dict] = {}  # pending→native/synthetic: применяем после цикла
         dirty = False
 
-        for symbol, prot in list(self._protections.items()):
+        # Фаза A: broker + current_price для всех символов сразу (цены — одним gather, O(RTT) вместо O(N·RTT)).
+        # Брокеров резолвим последовательно: обычно это dict-lookup, а ленивый init не должен гоняться сам с собой.
+        broker_map: dict[str, Any] = {}
+        for symbol in list(protections):
+            try:
+                broker_map[symbol] = await router.get_broker_for_symbol(symbol)
+            except Exception:
+                continue
+
+        price_results = await asyncio.gather(
+            *(b.get_current_price(sym) for sym, b in broker_map.items()), return_exceptions=True
+        )
+        price_map: dict[str, float] = {}
+        now_mono = time.monotonic()
+        for sym, px in zip(broker_map, price_results):
+            if isinstance(px, BaseException):
+                continue
+            try:
+                price_map[sym] = float(px)
+            except Exception:
+                continue
+            # свежие цены — в общий кеш: execute_trade в этом же тике не пойдёт за ними повторно
+            self._price_cache[(self._broker_key(broker_map[sym]), sym)] = (now_mono, price_map[sym])
+
+        # TIME EXIT: параметры одинаковы для всех символов → считаем один раз на тик
+        try:
+            max_hold_bars = int(Config.get_strategy_params().get("max_hold", 48))
+            max_seconds: float | None = max_hold_bars * _tf_seconds(getattr(Config, "TIMEFRAME_LTF", "4h"))
+        except Exception as e:
+            max_seconds = None
+            if should_log("time_exit_params", 60.0):
+                protections_log.warning("Time Exit params unavailable: %s", e)
+
+        now_ms = _now_ms()
+
+        # Фаза B: оцениваем protections по готовым ценам.
+        # Идём по price_map (уже готовый снимок символов фазы A) вместо list(protections.items()):
+        # panic-close внутри цикла может удалить ключ, поэтому prot берём через get().
+        for symbol, current_price in price_map.items():
+            prot = protections.get(symbol)
+            if prot is None:
+                continue
             mode = prot.get("mode", "synthetic")
             broker_name = (prot.get("broker") or "").lower() or "router"
             trade_id = prot.get("trade_id")
 
             pos = pos_map.get(symbol)
-            qty_pos = float(getattr(pos, "quantity", 0.0) or 0.0)
+            qty_pos = float(pos.quantity) if pos is not None else 0.0
 
-            # 1) ВСЕГДА получаем broker + current_price в начале цикла
-            try:
-                broker = await self.router.get_broker_for_symbol(symbol)
-                current_price = float(await broker.get_current_price(symbol))
-            except Exception:
-                continue
+            # 1) broker + current_price из фазы A (символы без цены в этот тик в price_map не попали)
+            broker = broker_map[symbol]
 
             # [FIX START] Пытаемся понять, есть ли след кита на последней свече
+            # (последняя строка сигналов кешируется до следующего reload, без iloc[-1] на каждый тик)
             is_whale = False
-            # Ищем символ в загруженных сигналах (self.signals)
-            if symbol in self.signals and not self.signals[symbol].empty:
+            last_row = last_row_of(symbol)
+            if last_row:
                 try:
-                    # Берем последнюю строку
-                    last_row = self.signals[symbol].iloc[-1]
                     # Проверяем флаг (если он есть в features_lib)
-                    if last_row.get('whale_footprint', 0) > 0:
-                        is_whale = True
+                    is_whale = bool(last_row.get('whale_footprint', 0) > 0)
                 except Exception:
                     pass
 
             # [FIX] Вызов динамического трейлинга
-            if await self._update_dynamic_trailing(symbol, current_price, prot):
+            if await update_trailing(symbol, current_price, prot):
                 dirty = True
 
-            # сохраняем last_price (полезно для reconcile/логов)
+            # сохраняем last_price (полезно для reconcile/логов); на диск — только при движении > 1 б.п.
+            prev_price = float(prot.get("last_price") or 0.0)
             prot["last_price"] = current_price
-            dirty = True
+            if prev_price <= 0 or abs(current_price - prev_price) > prev_price * 1e-4:
+                dirty = True
 
             # --- PENDING ENTRY MODE ---
             if mode == "pending_entry":
                 # пока позиции нет — просто ждём
                 if qty_pos <= 0:
-                    created_at = prot.get("created_at")
-                    if created_at:
-                        try:
-                            created_dt = datetime.fromisoformat(str(created_at).replace("Z", ""))
-                        except Exception:
-                            created_dt = None
-                    else:
-                        created_dt = None
-
-                    age_s = (datetime.utcnow() - created_dt).total_seconds() if created_dt else 0.0
+                    created_ms = prot.get("created_at_ms")
+                    age_s = (now_ms - created_ms) / 1000.0 if created_ms is not None else 0.0
 
-                    if age_s > float(getattr(Config, "PENDING_ENTRY_MAX_AGE_S", 120.0) or 120.0):
+                    if age_s > pending_max_age_s:
                         entry_client_id = prot.get("entry_client_id")
                         order_id = prot.get("order_id")
 
@@ -1005,20 +1691,20 @@ class AsyncStrategyRunner:
                         except Exception:
                             final_status = None
 
-                        if entry_client_id and final_status in {"canceled", "cancelled", "rejected", "failed"}:
-                            st2 = "canceled" if final_status in {"canceled", "cancelled"} else final_status
+                        if entry_client_id and final_status in _UNFILLED_FINAL_STATUSES:
+                            st2 = "canceled" if final_status in _CANCELED_STATUSES else final_status
                             try:
-                                self.ledger.mark_order_final(entry_client_id, st2, payload={"reason": "pending_entry_ttl"})
+                                submit("mark_order_final", entry_client_id, st2, payload={"reason": "pending_entry_ttl"})
                             except Exception:
                                 pass
 
                         if trade_id:
                             try:
-                                self.ledger.abort_trade(trade_id, f"pending_entry_timeout:{final_status or 'unknown'}")
+                                submit("abort_trade", trade_id, f"pending_entry_timeout:{final_status or 'unknown'}")
                             except Exception:
                                 pass
 
-                        print(f"⚠️  {symbol}: pending_entry TTL exceeded ({age_s:.0f}s) → abort trade & drop protections")
+                        protections_log.warning("⚠️  %s: pending_entry TTL exceeded (%.0fs) → abort trade & drop protections", symbol, age_s)
                         to_remove.append(symbol)
 
                     continue
@@ -1031,14 +1717,15 @@ class AsyncStrategyRunner:
 
                 if trade_id:
                     try:
-                        self.ledger.set_trade_entry(trade_id, entry_price, entry_qty)
+                        submit("set_trade_entry", trade_id, entry_price, entry_qty)
                     except Exception as e:
-                        print(f"[WARN] pending_entry: set_trade_entry failed {symbol}: {e}")
+                        protections_log.warning("pending_entry: set_trade_entry failed %s: %s", symbol, e)
 
                 # аккуратно финализируем entry ордер как filled (инференс по позиции)
                 if entry_client_id:
                     try:
-                        self.ledger.mark_order_final(
+                        submit(
+                            "mark_order_final",
                             entry_client_id,
                             "filled",
                             payload={"price": entry_price, "filled_qty": entry_qty, "_inferred_from_position": True},
@@ -1059,7 +1746,7 @@ class AsyncStrategyRunner:
 
                 if not (sl_price or tp_price):
                     # LIVE: без SL/TP нельзя оставлять позицию открытой
-                    if self._strict_protections_enabled():
+                    if strict:
                         await self._panic_close_unprotected(
                             symbol=symbol,
                             broker_name=broker_name2,
@@ -1068,7 +1755,7 @@ class AsyncStrategyRunner:
                             signal_id=signal_id2,
                         )
                     else:
-                        print(f"[WARN] {symbol}: pending entry finalized, but no SL/TP (atr={atr}) → protections skipped")
+                        protections_log.warning("%s: pending entry finalized, but no SL/TP (atr=%s) → protections skipped", symbol, atr)
                     to_remove.append(symbol)
                     continue
 
@@ -1076,20 +1763,23 @@ class AsyncStrategyRunner:
 
                 # пробуем native protections
                 if use_native and hasattr(broker, "place_protection_orders"):
-                    sl_client_id = self._make_client_id(broker_name2, symbol, "sl", signal_id2) if sl_price else None
-                    tp_client_id = self._make_client_id(broker_name2, symbol, "tp", signal_id2) if tp_price else None
+                    sl_client_id = cached_cid(broker_name2, symbol, "sl", signal_id2) if sl_price else None
+                    tp_client_id = cached_cid(broker_name2, symbol, "tp", signal_id2) if tp_price else None
 
                     if sl_client_id:
-                        self.ledger.reserve_order(
+                        await ledger.run_write(
+                            ledger.reserve_order,
                             sl_client_id, broker=broker_name2, symbol=symbol, role="sl", side="sell",
                             payload={"sl": sl_price, "qty": entry_qty},
                         )
                     if tp_client_id:
-                        self.ledger.reserve_order(
+                        await ledger.run_write(
+                            ledger.reserve_order,
                             tp_client_id, broker=broker_name2, symbol=symbol, role="tp", side="sell",
                             payload={"tp": tp_price, "qty": entry_qty},
                         )
 
+                    r = None
                     try:
                         r = await broker.place_protection_orders(
                             symbol,
@@ -1107,44 +1797,44 @@ class AsyncStrategyRunner:
                             raise RuntimeError("Native TP placement returned empty order_id")
 
                         if sl_client_id:
-                            self.ledger.mark_order_submitted(
+                            submit(
+                                "mark_order_submitted",
                                 sl_client_id, str(((r or {}).get("sl") or {}).get("order_id") or ""),
                                 payload={"sl": sl_price, "qty": entry_qty},
                             )
                         if tp_client_id:
-                            self.ledger.mark_order_submitted(
+                            submit(
+                                "mark_order_submitted",
                                 tp_client_id, str(((r or {}).get("tp") or {}).get("order_id") or ""),
                                 payload={"tp": tp_price, "qty": entry_qty},
                             )
 
                         native_ok = True
-                        self._protections[symbol] = {
-                            "mode": "native",
-                            "broker": broker_name2,
-                            "trade_id": trade_id,
-                            "signal_id": signal_id2,
-                            "qty": entry_qty,
-                            "sl": sl_price,
-                            "tp": tp_price,
-                            "sl_client_id": sl_client_id,
-                            "tp_client_id": tp_client_id,
-                            "native": r or {},
-                            "last_price": current_price,
-                            "created_at": datetime.utcnow().isoformat(),
-                        }
+                        to_set[symbol] = _new_protection(
+                            "native", broker_name2, trade_id, signal_id2,
+                            last_price=current_price,
+                            qty=entry_qty,
+                            sl=sl_price,
+                            tp=tp_price,
+                            sl_client_id=sl_client_id,
+                            tp_client_id=tp_client_id,
+                            native=r or {},
+                        )
                         dirty = True
-                        print(f"🛡️  {symbol}: pending→native protections placed (SL={sl_price}, TP={tp_price})")
+                        protections_log.info("🛡️  %s: pending→native protections placed (SL=%s, TP=%s)", symbol, sl_price, tp_price)
 
                     except Exception as e:
+                        # нога, которая всё же получила order_id, не должна остаться живой на бирже
+                        await self._cancel_native_protections(symbol, broker, {"mode": "native", "native": r or {}})
                         if sl_client_id:
-                            self.ledger.mark_order_final(sl_client_id, "failed", payload={"error": str(e)})
+                            submit("mark_order_final", sl_client_id, "failed", payload={"error": str(e)})
                         if tp_client_id:
-                            self.ledger.mark_order_final(tp_client_id, "failed", payload={"error": str(e)})
+                            submit("mark_order_final", tp_client_id, "failed", payload={"error": str(e)})
                         native_ok = False
-                        print(f"⚠️  {symbol}: pending native protections failed → fallback synthetic. err={e}")
+                        protections_log.warning("⚠️  %s: pending native protections failed → fallback synthetic. err=%s", symbol, e)
 
                         # LIVE strict: если брокер умеет native SL/TP и они не поставились — закрываем позицию
-                        if self._strict_protections_enabled() and hasattr(broker, "place_protection_orders"):
+                        if strict and hasattr(broker, "place_protection_orders"):
                             await self._panic_close_unprotected(
                                 symbol=symbol,
                                 broker_name=broker_name2,
@@ -1157,21 +1847,17 @@ class AsyncStrategyRunner:
 
                 # fallback synthetic
                 if not native_ok:
-                    self._protections[symbol] = {
-                        "mode": "synthetic",
-                        "broker": broker_name2,
-                        "trade_id": trade_id,
-                        "signal_id": signal_id2,
-                        "qty": entry_qty,
-                        "sl": sl_price,
-                        "tp": tp_price,
-                        "sl_client_id": self._make_client_id(broker_name2, symbol, "sl", signal_id2) if sl_price else None,
-                        "tp_client_id": self._make_client_id(broker_name2, symbol, "tp", signal_id2) if tp_price else None,
-                        "last_price": current_price,
-                        "created_at": datetime.utcnow().isoformat(),
-                    }
+                    to_set[symbol] = _new_protection(
+                        "synthetic", broker_name2, trade_id, signal_id2,
+                        last_price=current_price,
+                        qty=entry_qty,
+                        sl=sl_price,
+                        tp=tp_price,
+                        sl_client_id=cached_cid(broker_name2, symbol, "sl", signal_id2) if sl_price else None,
+                        tp_client_id=cached_cid(broker_name2, symbol, "tp", signal_id2) if tp_price else None,
+                    )
                     dirty = True
-                    print(f"🛡️  {symbol}: pending→synthetic protections armed (SL={sl_price}, TP={tp_price})")
+                    protections_log.info("🛡️  %s: pending→synthetic protections armed (SL=%s, TP=%s)", symbol, sl_price, tp_price)
 
                 continue
 
@@ -1180,7 +1866,7 @@ class AsyncStrategyRunner:
                 # если позиции уже нет -> считаем что выход случился
                 if qty_pos <= 0:
                     if trade_id:
-                        self.ledger.close_trade(trade_id, float(current_price), "native_exit_reconcile")
+                        submit("close_trade", trade_id, float(current_price), "native_exit_reconcile")
                     to_remove.append(symbol)
                     continue
 
@@ -1189,17 +1875,16 @@ class AsyncStrategyRunner:
                 tp_id = (native.get("tp") or {}).get("order_id")
 
                 fired = None
-                try:
-                    if hasattr(broker, "get_plan_sub_order"):
-                        for oid, tag in ((sl_id, "sl"), (tp_id, "tp")):
-                            if not oid:
-                                continue
-                            subs = await broker.get_plan_sub_order(str(oid))
-                            if subs:
-                                fired = tag
-                                break
-                except Exception:
-                    fired = None
+                if hasattr(broker, "get_plan_sub_order"):
+                    # SL и TP опрашиваем параллельно: 1·RTT вместо 2·RTT на символ
+                    probes = [(tag, oid) for tag, oid in (("sl", sl_id), ("tp", tp_id)) if oid]
+                    results = await asyncio.gather(
+                        *(broker.get_plan_sub_order(str(oid)) for _, oid in probes), return_exceptions=True
+                    )
+                    for (tag, _), subs in zip(probes, results):
+                        if subs and not isinstance(subs, BaseException):
+                            fired = tag
+                            break
 
                 if fired:
                     # отменяем остаточные защиты (чтобы не осталось висящих планов)
@@ -1209,7 +1894,7 @@ class AsyncStrategyRunner:
                         pass
 
                     if trade_id:
-                        self.ledger.close_trade(trade_id, float(current_price), f"native_{fired}")
+                        submit("close_trade", trade_id, float(current_price), f"native_{fired}")
                     to_remove.append(symbol)
                 continue
 
@@ -1224,35 +1909,25 @@ class AsyncStrategyRunner:
 
             # === [PATCH 3 START] TIME EXIT ===
             try:
-                strat_params = Config.get_strategy_params()
-                max_hold_bars = int(strat_params.get("max_hold", 48))
-                
-                # Определяем секунды в баре
-                tf_str = getattr(Config, "TIMEFRAME_LTF", "4h")
-                tf_seconds = 3600 # Default 1h
-                if "4h" in tf_str: tf_seconds = 3600 * 4
-                elif "15m" in tf_str: tf_seconds = 60 * 15
-                elif "1d" in tf_str: tf_seconds = 86400
-                
-                max_seconds = max_hold_bars * tf_seconds
-                
-                created_at_str = prot.get("created_at")
-                if created_at_str:
-                    created_dt = datetime.fromisoformat(created_at_str.replace("Z", ""))
-                    age_seconds = (datetime.utcnow() - created_dt).total_seconds()
+                created_ms = prot.get("created_at_ms")
+                if created_ms is not None and max_seconds is not None:
+                    age_seconds = (now_ms - created_ms) / 1000.0
                     
                     if age_seconds > max_seconds:
-                        print(f"⏰ {symbol}: TIME EXIT triggered (Age: {age_seconds/3600:.1f}h > {max_seconds/3600:.1f}h)")
-                        exit_client_id = self._make_client_id(broker_name, symbol, "exit_time", prot.get("signal_id", "na"))
+                        protections_log.info(
+                            "⏰ %s: TIME EXIT triggered (Age: %.1fh > %.1fh)", symbol, age_seconds / 3600, max_seconds / 3600
+                        )
+                        exit_client_id = cached_cid(broker_name, symbol, "exit_time", prot.get("signal_id", "na"))
                         
-                        if self.ledger.reserve_order(exit_client_id, broker=broker_name, symbol=symbol, role="time_exit", side="sell", payload={"reason": "time_exit"}):
+                        if await ledger.run_write(ledger.reserve_order, exit_client_id, broker=broker_name, symbol=symbol, role="time_exit", side="sell", payload={"reason": "time_exit"}):
                             await self._router_execute_order(symbol=symbol, side="sell", quantity=qty, order_type="market", client_id=exit_client_id)
-                            if trade_id: self.ledger.close_trade(trade_id, current_price, "time_exit")
+                            if trade_id: submit("close_trade", trade_id, current_price, "time_exit")
                             to_remove.append(symbol)
                             dirty = True
                             continue 
             except Exception as e:
-                print(f"[WARN] Time Exit check failed for {symbol}: {e}")
+                if should_log(f"time_exit_err:{symbol}", 60.0):
+                    protections_log.warning("Time Exit check failed for %s: %s", symbol, e)
             # === [PATCH 3 END] ===
 
             hit_sl = sl > 0 and current_price <= sl
@@ -1262,12 +1937,13 @@ class AsyncStrategyRunner:
 
             reason = "sl" if hit_sl else "tp"
             role = reason
-            exit_client_id = prot.get(f"{reason}_client_id") or self._make_client_id(
+            exit_client_id = prot.get(f"{reason}_client_id") or cached_cid(
                 broker_name, symbol, role, prot.get("signal_id", "na")
             )
 
             # если reserve не прошёл — НЕ удаляем protection (иначе останешься без защиты)
-            if not self.ledger.reserve_order(
+            if not await ledger.run_write(
+                ledger.reserve_order,
                 exit_client_id,
                 broker=broker_name,
                 symbol=symbol,
@@ -1281,31 +1957,45 @@ class AsyncStrategyRunner:
                 res = await self._router_execute_order(
                     symbol=symbol, side="sell", quantity=qty, order_type="market", client_id=exit_client_id
                 )
-                self.ledger.mark_order_submitted(exit_client_id, str(getattr(res, "order_id", "")), payload={"qty": qty})
+                submit("mark_order_submitted", exit_client_id, res.order_id, payload={"qty": qty})
 
-                st = (str(getattr(res, "status", "")) or "").lower()
-                px = float(getattr(res, "price", 0.0) or current_price)
+                st = res.status
+                px = res.price or current_price
 
                 # финал пишем только если статус финальный
-                if st in {"filled", "canceled", "cancelled", "rejected", "failed"}:
-                    st2 = "canceled" if st in {"canceled", "cancelled"} else st
-                    self.ledger.mark_order_final(exit_client_id, st2, payload={"price": px})
+                if st in _FINAL_STATUSES:
+                    st2 = "canceled" if st in _CANCELED_STATUSES else st
+                    submit("mark_order_final", exit_client_id, st2, payload={"price": px})
 
                 if st == "filled":
                     if trade_id:
-                        self.ledger.close_trade(trade_id, px, reason)
+                        submit("close_trade", trade_id, px, reason)
                     to_remove.append(symbol)
-                    print(f"🛡️  {symbol}: {reason.upper()} hit → закрыли MARKET (qty={qty}, price={px})")
+                    protections_log.info("🛡️  %s: %s hit → закрыли MARKET (qty=%s, price=%s)", symbol, reason.upper(), qty, px)
                 else:
-                    print(f"⚠️  {symbol}: protective exit not filled (status={st or 'unknown'}) → ждём reconcile")
+                    if should_log(f"exit_pending:{symbol}"):
+                        protections_log.warning("⚠️  %s: protective exit not filled (status=%s) → ждём reconcile", symbol, st or "unknown")
 
             except Exception as e:
-                self.ledger.mark_order_final(exit_client_id, "failed", payload={"error": str(e)})
-                print(f"⚠️  {symbol}: protective exit failed: {e}")
+                submit("mark_order_final", exit_client_id, "failed", payload={"error": str(e)})
+                protections_log.warning("⚠️  %s: protective exit failed: %s", symbol, e)
+
+        # kill-switch мог заменить dict во время await'ов — тогда отложенные записи не воскрешаем
+        if to_set and self._protections is protections:
+            protections.update(to_set)
+            dirty = True
 
         if to_remove:
+            # self._protections, а не локальный protections: kill-switch мог заменить dict во время await'ов
+            current = self._protections
+            if len(to_remove) > len(current) // 4:
+                rem = set(to_remove)
+                self._protections = {k: v for k, v in current.items() if k not in rem}
+            else:
+                for s in to_remove:
+                    current.pop(s, None)
             for s in to_remove:
-                self._protections.pop(s, None)
+                self._drop_trade_lock(s)
             dirty = True
 
         if dirty:
@@ -1316,7 +2006,7 @@ class AsyncStrategyRunner:
         self._maybe_reload_signals()
 
         if not self.signals:
-            print("❌ Нет сигналов для торговли")
+            logger.warning("❌ Нет сигналов для торговли")
             return
 
         try:
@@ -1329,78 +2019,95 @@ class AsyncStrategyRunner:
         max_risk = float(getattr(Config, "MAX_RISK_PER_TRADE", 0.03) or 0.03)
         tp_mult = float(params.get("tp", 3.5) or 3.5)
         sl_mult = float(params.get("sl", 2.0) or 2.0)
+        # остальные Config-настройки execute_trade — один раз на цикл, общий снимок для всех символов
+        ctx = _CycleCtx.from_config(self._strict_protections_enabled(), params)
 
         try:
             positions = await self.router.list_all_positions()
         except Exception:
             positions = []
-        pos_map = {p.symbol: p for p in positions}
+        # один проход: pos_map сразу содержит только открытые позиции и служит базой для open_symbols
+        pos_map = _open_pos_map(positions)
         # (LIVE safety) MAX_OPEN_POSITIONS: считаем текущие открытые слоты (позиции ∪ open-trades)
         max_pos = int(getattr(Config, "MAX_OPEN_POSITIONS", 0) or 0)
 
-        open_symbols: set[str] = set()
-        for p in positions:
-            try:
-                if float(getattr(p, "quantity", 0.0) or 0.0) > 0:
-                    open_symbols.add(str(getattr(p, "symbol", "")))
-            except Exception:
-                pass
+        open_symbols: set[str] = set(pos_map)
 
         try:
-            for t in self.ledger.list_open_trades():
+            for t in await self.ledger.run_read(self.ledger.list_open_trades):
                 sym = str((t or {}).get("symbol") or "")
                 if sym:
                     open_symbols.add(sym)
         except Exception:
             pass
 
-        open_count = len({s for s in open_symbols if s})
+        open_symbols.discard("")
+        open_count = len(open_symbols)
 
-        for symbol, df in self.signals.items():
-            if df is None or df.empty:
-                continue
-            if self.assets_filter and symbol not in self.assets_filter:
-                continue
+        cycle_ms = _now_ms()  # одна метка на цикл для всех snapshots вместо datetime на символ
+
+        # символы независимы → execute_trade по ним идут параллельно, семафор ограничивает нагрузку на брокеров
+        sem = asyncio.Semaphore(max(1, int(getattr(Config, "MAX_CONCURRENT_SYMBOLS", 8) or 8)))
+
+        async def _run_symbol(symbol: str, df: pd.DataFrame) -> None:
+            nonlocal open_count
 
             last_signal = df.iloc[-1]
             signal_id = self._make_signal_id(symbol, df, last_signal)
 
             if self._runner_state.get("last_seen", {}).get(symbol) == signal_id:
-                continue
+                return
 
             p_long = float(last_signal.get("p_long", 0.0) or 0.0)
             p_short = float(last_signal.get("p_short", 0.0) or 0.0)
             confidence = max(p_long, p_short)
-            risk_this_trade = self._compute_risk_per_trade(confidence, base_risk, max_risk, threshold)
+            # confidence здесь всегда float → сразу чистое ядро, без None-проверки
+            risk_this_trade = _risk_per_trade(confidence, base_risk, max_risk, threshold)
 
             pos = pos_map.get(symbol)
-            pos_qty = float(getattr(pos, "quantity", 0.0) or 0.0)
+            pos_qty = float(pos.quantity) if pos is not None else 0.0
 
-            if p_long > threshold and pos_qty <= 0:
+            want_buy = p_long > threshold and pos_qty <= 0
+            want_sell = p_short > threshold and pos_qty > 0
+            # брокер резолвим один раз на символ и только если будет сделка; его же имя — ключ ledger
+            broker = await self.router.get_broker_for_symbol(symbol) if (want_buy or want_sell) else None
+
+            if want_buy:
                 if max_pos > 0 and open_count >= max_pos:
-                    print(f"⛔ MAX_OPEN_POSITIONS={max_pos} reached (open={open_count}) → skip BUY {symbol}")
+                    logger.info("⛔ MAX_OPEN_POSITIONS=%s reached (open=%s) → skip BUY %s", max_pos, open_count, symbol)
                 else:
-                    await self.execute_trade(
-                        symbol=symbol,
-                        side="buy",
-                        probability=p_long,
-                        risk_per_trade=risk_this_trade,
-                        signal_id=signal_id,
-                        signal_data=last_signal,
-                        sl_mult=sl_mult,
-                        tp_mult=tp_mult,
-                    )
-                    # если trade реально стал open (включая pending_entry) — считаем слот занятым
+                    # слот занимаем ДО первого await: между проверкой и инкрементом нет переключения задач,
+                    # поэтому параллельные BUY не превысят MAX_OPEN_POSITIONS (отдельный Lock не нужен)
+                    open_count += 1
+                    opened = False
                     try:
-                        broker_guess = (self.router.get_broker_name_for_symbol(symbol) or "").lower() or "router"
-                        if self.ledger.has_open_trade(broker_guess, symbol):
+                        async with sem:
+                            await self.execute_trade(
+                                symbol=symbol,
+                                side="buy",
+                                probability=p_long,
+                                risk_per_trade=risk_this_trade,
+                                signal_id=signal_id,
+                                signal_data=last_signal,
+                                sl_mult=sl_mult,
+                                tp_mult=tp_mult,
+                                broker=broker,
+                                ctx=ctx,
+                            )
+                        # если trade реально стал open (включая pending_entry) — слот остаётся занятым
+                        try:
+                            opened = bool(await self.ledger.run_read(self.ledger.has_open_trade, self._broker_key(broker), symbol))
+                        except Exception:
+                            pass
+                    finally:
+                        if opened and symbol not in open_symbols:
                             open_symbols.add(symbol)
-                            open_count = len({s for s in open_symbols if s})
-                    except Exception:
-                        pass
-                    
-            if p_short > threshold and pos_qty > 0:
-                await self.execute_trade(symbol=symbol, side="sell", probability=p_short, risk_per_trade=risk_this_trade, signal_id=signal_id, signal_data=last_signal, sl_mult=sl_mult, tp_mult=tp_mult)
+                        else:
+                            open_count -= 1
+
+            if want_sell:
+                async with sem:
+                    await self.execute_trade(symbol=symbol, side="sell", probability=p_short, risk_per_trade=risk_this_trade, signal_id=signal_id, signal_data=last_signal, sl_mult=sl_mult, tp_mult=tp_mult, pos_map=pos_map, broker=broker, ctx=ctx)
 
             self._runner_state.setdefault("last_seen", {})[symbol] = signal_id
             try:
@@ -1412,36 +2119,87 @@ class AsyncStrategyRunner:
                 "p_short": p_short,
                 "confidence": confidence,
                 "position_qty": pos_qty,
-                "updated_at": datetime.utcnow().isoformat(),
+                "updated_at_ms": cycle_ms,
             }
 
+        symbols = [
+            (symbol, df)
+            for symbol, df in self.signals.items()
+            if df is not None and not df.empty and (not self.assets_filter or symbol in self.assets_filter)
+        ]
+        results = await asyncio.gather(*(_run_symbol(sym, df) for sym, df in symbols), return_exceptions=True)
+        first_error: BaseException | None = None
+        for (symbol, _), r in zip(symbols, results):
+            if isinstance(r, BaseException):
+                logger.error("❌ %s: ошибка обработки сигнала: %s", symbol, r)
+                if first_error is None:
+                    first_error = r
+
         self._persist_state()
-        # [FIX] Принудительная очистка мусора после цикла
-        gc.collect()
 
-    async def execute_trade(self, *, symbol: str, side: str, probability: float, risk_per_trade: float, signal_id: str, signal_data: pd.Series, sl_mult: float, tp_mult: float) -> None:
-        broker = await self.router.get_broker_for_symbol(symbol)
-        broker_name = getattr(broker, "name", broker.__class__.__name__).lower()
-        strategy_id = getattr(Config, "STRATEGY_ID", "universal")
+        # остальные символы уже отработали; ошибку пробрасываем в run_forever — там счётчик consecutive_errors и auto kill-switch
+        if first_error is not None:
+            raise first_error
+
+    async def execute_trade(self, *, symbol: str, **kwargs) -> None:
+        """
+        Сделка по одному символу (параметры — см. _execute_trade).
+        run_strategy обрабатывает символы параллельно, поэтому reserve_order → upsert_trade → ордер → protections
+        по ОДНОМУ символу сериализуем. Lock отдельный от _lock_for (трейлинг): self-heal из pending-ветки
+        может трейлить этот же символ, а asyncio.Lock не реентерабелен.
+        """
+        lock = self._trade_locks.get(symbol)
+        if lock is None:
+            lock = self._trade_locks[symbol] = asyncio.Lock()
+        users = self._trade_lock_users
+        users[symbol] = users.get(symbol, 0) + 1
+        try:
+            async with lock:
+                await self._execute_trade(symbol=symbol, **kwargs)
+        finally:
+            users[symbol] -= 1
+            self._drop_trade_lock(symbol)
+
+    def _drop_trade_lock(self, symbol: str) -> None:
+        """
+        Убираем lock символа, когда сделки по нему нет и lock никому не нужен — иначе _trade_locks растёт
+        со всеми символами, которые когда-либо торговались. locked() мало: разбуженный ожидающий
+        ещё не захватил lock, поэтому смотрим на счётчик держателей/ожидающих.
+        """
+        if symbol in self._protections or self._trade_lock_users.get(symbol, 0) > 0:
+            return
+        self._trade_lock_users.pop(symbol, None)
+        self._trade_locks.pop(symbol, None)
+
+    async def _execute_trade(self, *, symbol: str, side: str, probability: float, risk_per_trade: float, signal_id: str, signal_data: pd.Series, sl_mult: float, tp_mult: float, pos_map: dict[str, Any] | None = None, broker=None, ctx: _CycleCtx | None = None) -> None:
+        if ctx is None:
+            ctx = _CycleCtx.from_config(self._strict_protections_enabled())
+        if broker is None:
+            broker = await self.router.get_broker_for_symbol(symbol)
+        broker_name = self._broker_key(broker)
 
-        current_price = float(await broker.get_current_price(symbol))
+        current_price = await self._get_price_cached(broker, symbol)
 
         if side == "sell":
-            positions = await self.router.list_all_positions()
-            p = next((x for x in positions if x.symbol == symbol and float(x.quantity or 0.0) > 0), None)
+            # pos_map из run_strategy (только открытые позиции) → O(1) без повторного запроса к брокеру
+            if pos_map is not None:
+                p = pos_map.get(symbol)
+            else:
+                p = _open_pos_map(await self.router.list_all_positions()).get(symbol)
             if p is None:
-                print(f"ℹ️  SELL skip: позиции уже нет {symbol}")
+                logger.info("ℹ️  SELL skip: позиции уже нет %s", symbol)
                 return
 
             qty_to_close = float(p.quantity)
 
-            open_trade = self.ledger.get_open_trade(broker_name, symbol)
+            open_trade = await self.ledger.run_read(self.ledger.get_open_trade, broker_name, symbol)
             trade_id = (open_trade or {}).get("trade_id") or self._make_trade_id(broker_name, symbol, signal_id)
-            exit_client_id = self._make_client_id(
+            exit_client_id = self._cached_client_id(
                 broker_name, symbol, "exit", (open_trade or {}).get("signal_id") or signal_id
             )
 
-            if not self.ledger.reserve_order(
+            if not await self.ledger.run_write(
+                self.ledger.reserve_order,
                 exit_client_id,
                 broker=broker_name,
                 symbol=symbol,
@@ -1449,7 +2207,7 @@ class AsyncStrategyRunner:
                 side="sell",
                 payload={"reason": "signal_exit", "qty": qty_to_close, "signal_id": signal_id},
             ):
-                print(f"🧾 Ledger: EXIT уже делали (client_id={exit_client_id}) → пропуск")
+                logger.info("🧾 Ledger: EXIT уже делали (client_id=%s) → пропуск", exit_client_id)
                 return
 
             # 1) отправляем EXIT
@@ -1463,32 +2221,33 @@ class AsyncStrategyRunner:
                 )
             except Exception as e:
                 # важно: если submit упал — не закрываем trade
-                self.ledger.mark_order_final(exit_client_id, "failed", payload={"error": str(e)})
-                print(f"❌ EXIT submit failed {symbol}: {e}")
+                self._ledger_submit("mark_order_final", exit_client_id, "failed", payload={"error": str(e)})
+                logger.error("❌ EXIT submit failed %s: %s", symbol, e)
                 return
 
-            self.ledger.mark_order_submitted(
-                exit_client_id, str(getattr(res, "order_id", "")), payload={"qty": qty_to_close}
+            self._ledger_submit(
+                "mark_order_submitted",
+                exit_client_id, res.order_id, payload={"qty": qty_to_close}
             )
 
-            st = (str(getattr(res, "status", "")) or "").lower()
-            px = float(getattr(res, "price", 0.0) or current_price)
+            st = res.status
+            px = res.price or current_price
 
             # 2) финализируем только если статус финальный
-            if st in {"filled", "canceled", "cancelled", "rejected", "failed"}:
-                st2 = "canceled" if st in {"canceled", "cancelled"} else st
-                self.ledger.mark_order_final(exit_client_id, st2, payload={"price": px})
+            if st in _FINAL_STATUSES:
+                st2 = "canceled" if st in _CANCELED_STATUSES else st
+                self._ledger_submit("mark_order_final", exit_client_id, st2, payload={"price": px})
             else:
                 # pending/unknown — НЕ закрываем trade, ждём reconcile
-                print(f"⏳ EXIT {symbol}: status={st or 'unknown'} → ждём reconcile")
+                logger.info("⏳ EXIT %s: status=%s → ждём reconcile", symbol, st or "unknown")
                 return
 
             # 3) trade закрываем только если реально filled
             if st != "filled":
-                print(f"⚠️  EXIT {symbol}: not filled (status={st}) → trade НЕ закрыт")
+                logger.warning("⚠️  EXIT %s: not filled (status=%s) → trade НЕ закрыт", symbol, st)
                 return
 
-            self.ledger.close_trade(trade_id, px, "signal_exit")
+            self._ledger_submit("close_trade", trade_id, px, "signal_exit")
 
             # 4) после успешного EXIT — гасим/чистим защиты (native/synthetic)
             if symbol in self._protections:
@@ -1496,20 +2255,16 @@ class AsyncStrategyRunner:
                 try:
                     await self._cancel_native_protections(symbol, broker, prot)
                 except Exception as e:
-                    print(f"[WARN] native protections cancel failed {symbol}: {e}")
+                    logger.warning("native protections cancel failed %s: %s", symbol, e)
                 self._protections.pop(symbol, None)
                 self._persist_protections()
 
-            print(f"✅ EXIT {symbol} done (qty={qty_to_close}, price={px})")
+            logger.info("✅ EXIT %s done (qty=%s, price=%s)", symbol, qty_to_close, px)
             return
 
         # === [PATCH 1 START] PULLBACK LOGIC ===
         # Эмуляция лимитного входа. Если цена хуже расчетной - пропускаем цикл.
-        try:
-            strat_params = Config.get_strategy_params()
-            pullback_mult = float(strat_params.get("pullback", 0.0))
-        except:
-            pullback_mult = 0.0
+        pullback_mult = ctx.pullback_mult
 
         atr_val = float(signal_data.get("atr", 0.0) or 0.0)
 
@@ -1522,22 +2277,22 @@ class AsyncStrategyRunner:
                 target_price = sig_close - (atr_val * pullback_mult)
                 # Если мы ВЫШЕ цели (дороже) -> ждем
                 if current_price > target_price:
-                    print(f"⏳ {symbol} PULLBACK: Curr {current_price:.4f} > Target {target_price:.4f} (Wait)")
+                    logger.info("⏳ %s PULLBACK: Curr %.4f > Target %.4f (Wait)", symbol, current_price, target_price)
                     return # Выходим, не отправляя ордер
             
             elif side == "sell":
                 target_price = sig_close + (atr_val * pullback_mult)
                 # Если мы НИЖЕ цели (дешевле) -> ждем
                 if current_price < target_price:
-                    print(f"⏳ {symbol} PULLBACK: Curr {current_price:.4f} < Target {target_price:.4f} (Wait)")
+                    logger.info("⏳ %s PULLBACK: Curr %.4f < Target %.4f (Wait)", symbol, current_price, target_price)
                     return
         # === [PATCH 1 END] ===
 
-        broker_state = await broker.get_account_state()
+        broker_state = await self._get_account_cached(broker)
         equity = float(getattr(broker_state, "equity", 0.0) or 0.0)
 
         atr_value = float(signal_data.get("atr", 0.0) or 0.0)
-        max_notional = getattr(Config, "MAX_POSITION_NOTIONAL", None)
+        max_notional = ctx.max_notional
 
         ps = calc_position_size(
             equity=equity,
@@ -1551,86 +2306,83 @@ class AsyncStrategyRunner:
         qty = float(getattr(broker, "normalize_qty", lambda s, q, p=None: q)(symbol, qty_raw, current_price))
 
         if qty <= 0:
-            print(f"⚠️  {symbol}: qty=0 после нормализации → skip")
+            logger.warning("⚠️  %s: qty=0 после нормализации → skip", symbol)
             return
 
         trade_id = self._make_trade_id(broker_name, symbol, signal_id)
         entry_client_id = self._make_client_id(broker_name, symbol, "entry", signal_id)
 
-        if not self.ledger.reserve_order(entry_client_id, broker=broker_name, symbol=symbol, role="entry", side="buy", payload={"qty": qty, "price": current_price, "signal_id": signal_id, "p": probability}):
-            print(f"🧾 Ledger: ENTRY уже делали (client_id={entry_client_id}) → пропуск")
+        if not await self.ledger.run_write(self.ledger.reserve_order, entry_client_id, broker=broker_name, symbol=symbol, role="entry", side="buy", payload={"qty": qty, "price": current_price, "signal_id": signal_id, "p": probability}):
+            logger.info("🧾 Ledger: ENTRY уже делали (client_id=%s) → пропуск", entry_client_id)
             return
 
-        self.ledger.upsert_trade(trade_id=trade_id, strategy_id=strategy_id, broker=broker_name, symbol=symbol, side="buy", signal_id=signal_id, entry_client_id=entry_client_id)
+        await self.ledger.run_write(self.ledger.upsert_trade, trade_id=trade_id, strategy_id=ctx.strategy_id, broker=broker_name, symbol=symbol, side="buy", signal_id=signal_id, entry_client_id=entry_client_id)
 
         try:
             res = await self._router_execute_order(
                 symbol=symbol, side="buy", quantity=qty, order_type="market", client_id=entry_client_id
             )
-            self.ledger.mark_order_submitted(entry_client_id, str(getattr(res, "order_id", "")), payload={"qty": qty})
+            self._ledger_submit("mark_order_submitted", entry_client_id, res.order_id, payload={"qty": qty})
 
-            st = (str(getattr(res, "status", "")) or "").lower()
-            fill_price = float(getattr(res, "price", 0.0) or current_price)
-
-            final_statuses = {"filled", "canceled", "cancelled", "rejected", "failed"}
+            st = res.status
+            fill_price = res.price or current_price
 
             # 1) если статус финальный — фиксируем его в ledger
-            if st in final_statuses:
-                st2 = "canceled" if st in {"canceled", "cancelled"} else st
-                self.ledger.mark_order_final(entry_client_id, st2, payload={"price": fill_price})
+            if st in _FINAL_STATUSES:
+                st2 = "canceled" if st in _CANCELED_STATUSES else st
+                self._ledger_submit("mark_order_final", entry_client_id, st2, payload={"price": fill_price})
 
                 # финально НЕ filled -> абортим trade (это реально не зашли)
                 if st2 != "filled":
-                    self.ledger.abort_trade(trade_id, f"entry_not_filled:{st2}")
-                    print(f"⚠️  ENTRY {symbol}: not filled (status={st2}) → abort trade")
+                    self._ledger_submit("abort_trade", trade_id, f"entry_not_filled:{st2}")
+                    logger.warning("⚠️  ENTRY %s: not filled (status=%s) → abort trade", symbol, st2)
                     return
 
                 # filled -> фиксируем entry
-                self.ledger.set_trade_entry(trade_id, fill_price, qty)
+                self._ledger_submit("set_trade_entry", trade_id, fill_price, qty)
 
             else:
                 # 2) pending/unknown: НЕ abort'им! Позиция могла исполниться, но confirm не дошёл.
                 # Ставим "pending_entry" и даём reconcile/следующему циклу поставить защиты.
-                self._protections[symbol] = {
-                    "mode": "pending_entry",
-                    "broker": broker_name,
-                    "trade_id": trade_id,
-                    "signal_id": signal_id,
-                    "entry_client_id": entry_client_id,
-                    "order_id": str(getattr(res, "order_id", "")) or None,
-                    "qty_expected": float(qty),
-                    "atr": float(atr_value),
-                    "sl_mult": float(sl_mult),
-                    "tp_mult": float(tp_mult),
-                    "use_native": bool(getattr(Config, "USE_NATIVE_PROTECTIONS", True)),
-                    "last_price": float(current_price),
-                    "created_at": datetime.utcnow().isoformat(),
-                }
+                self._protections[symbol] = _new_protection(
+                    "pending_entry", broker_name, trade_id, signal_id,
+                    last_price=current_price,
+                    entry_client_id=entry_client_id,
+                    order_id=res.order_id or None,
+                    qty_expected=qty,
+                    atr=atr_value,
+                    sl_mult=sl_mult,
+                    tp_mult=tp_mult,
+                    use_native=ctx.use_native,
+                )
                 self._persist_protections()
 
                 # попытка “самовылечиться” сразу: вдруг позиция уже появилась в брокере
                 try:
-                    await self._check_protective_exits()
+                    await self._check_protective_exits(wait=False)
                 except Exception:
                     pass
 
-                print(f"⏳ ENTRY {symbol}: status={st or 'unknown'} → ждём подтверждения; защиты поставятся при появлении позиции")
+                logger.info("⏳ ENTRY %s: status=%s → ждём подтверждения; защиты поставятся при появлении позиции", symbol, st or "unknown")
                 return
 
-            self.ledger.set_trade_entry(trade_id, fill_price, qty)
+            self._ledger_submit("set_trade_entry", trade_id, fill_price, qty)
 
         except Exception as e:
-            self.ledger.mark_order_final(entry_client_id, "failed", payload={"error": str(e)})
-            self.ledger.abort_trade(trade_id, f"entry_failed: {e}")
-            print(f"❌ ENTRY failed {symbol}: {e}")
+            self._ledger_submit("mark_order_final", entry_client_id, "failed", payload={"error": str(e)})
+            self._ledger_submit("abort_trade", trade_id, f"entry_failed: {e}")
+            logger.error("❌ ENTRY failed %s: %s", symbol, e)
             return
 
-        base_price = float(self.ledger.get_trade_entry_price(trade_id) or current_price) if hasattr(self.ledger, "get_trade_entry_price") else fill_price
+        if hasattr(self.ledger, "get_trade_entry_price"):
+            base_price = float(await self.ledger.run_read(self.ledger.get_trade_entry_price, trade_id) or current_price)
+        else:
+            base_price = fill_price
         sl_price = (base_price - atr_value * float(sl_mult)) if atr_value > 0 else None
         tp_price = (base_price + atr_value * float(tp_mult)) if atr_value > 0 else None
 
         # LIVE strict: без SL/TP нельзя оставлять позицию открытой
-        if not (sl_price or tp_price) and self._strict_protections_enabled():
+        if not (sl_price or tp_price) and ctx.strict:
             await self._panic_close_unprotected(
                 symbol=symbol,
                 broker_name=broker_name,
@@ -1640,18 +2392,21 @@ class AsyncStrategyRunner:
             )
             return
 
-        use_native = bool(getattr(Config, "USE_NATIVE_PROTECTIONS", True))
+        use_native = ctx.use_native
         native_ok = False
 
+        # sl/tp client_id считаем один раз (общий LRU с protective exits) — и для native, и для synthetic-fallback
+        sl_client_id = self._cached_client_id(broker_name, symbol, "sl", signal_id) if sl_price else None
+        tp_client_id = self._cached_client_id(broker_name, symbol, "tp", signal_id) if tp_price else None
+
         if use_native and hasattr(broker, "place_protection_orders") and (sl_price or tp_price):
-            sl_client_id = self._make_client_id(broker_name, symbol, "sl", signal_id) if sl_price else None
-            tp_client_id = self._make_client_id(broker_name, symbol, "tp", signal_id) if tp_price else None
 
             if sl_client_id:
-                self.ledger.reserve_order(sl_client_id, broker=broker_name, symbol=symbol, role="sl", side="sell", payload={"sl": sl_price, "qty": qty})
+                await self.ledger.run_write(self.ledger.reserve_order, sl_client_id, broker=broker_name, symbol=symbol, role="sl", side="sell", payload={"sl": sl_price, "qty": qty})
             if tp_client_id:
-                self.ledger.reserve_order(tp_client_id, broker=broker_name, symbol=symbol, role="tp", side="sell", payload={"tp": tp_price, "qty": qty})
+                await self.ledger.run_write(self.ledger.reserve_order, tp_client_id, broker=broker_name, symbol=symbol, role="tp", side="sell", payload={"tp": tp_price, "qty": qty})
 
+            r = None
             try:
                 r = await broker.place_protection_orders(symbol, qty=float(qty), sl_price=float(sl_price) if sl_price else None, tp_price=float(tp_price) if tp_price else None, sl_client_oid=sl_client_id, tp_client_oid=tp_client_id)
                 # sanity: если брокер вернул пустой order_id — считаем что защита не поставилась
@@ -1660,29 +2415,31 @@ class AsyncStrategyRunner:
                 if tp_price and not str(((r or {}).get("tp") or {}).get("order_id") or "").strip():
                     raise RuntimeError("Native TP placement returned empty order_id")
                 if sl_client_id:
-                    self.ledger.mark_order_submitted(sl_client_id, str(((r or {}).get("sl") or {}).get("order_id") or ""), payload={"sl": sl_price, "qty": qty})
+                    self._ledger_submit("mark_order_submitted", sl_client_id, str(((r or {}).get("sl") or {}).get("order_id") or ""), payload={"sl": sl_price, "qty": qty})
                 if tp_client_id:
-                    self.ledger.mark_order_submitted(tp_client_id, str(((r or {}).get("tp") or {}).get("order_id") or ""), payload={"tp": tp_price, "qty": qty})
+                    self._ledger_submit("mark_order_submitted", tp_client_id, str(((r or {}).get("tp") or {}).get("order_id") or ""), payload={"tp": tp_price, "qty": qty})
 
                 native_ok = True
-                self._protections[symbol] = {"mode": "native", "broker": broker_name, "trade_id": trade_id, "signal_id": signal_id, "qty": qty, "sl": sl_price, "tp": tp_price, "sl_client_id": sl_client_id, "tp_client_id": tp_client_id, "native": r or {}, "last_price": current_price, "created_at": datetime.utcnow().isoformat()}
+                self._protections[symbol] = _new_protection("native", broker_name, trade_id, signal_id, last_price=current_price, qty=qty, sl=sl_price, tp=tp_price, sl_client_id=sl_client_id, tp_client_id=tp_client_id, native=r or {})
                 self._persist_protections()
-                print(f"🛡️  {symbol}: native protections placed (SL={sl_price}, TP={tp_price})")
+                logger.info("🛡️  %s: native protections placed (SL=%s, TP=%s)", symbol, sl_price, tp_price)
             except Exception as e:
+                # нога, которая всё же получила order_id, не должна остаться живой на бирже
+                await self._cancel_native_protections(symbol, broker, {"mode": "native", "native": r or {}})
                 if sl_client_id:
-                    self.ledger.mark_order_final(sl_client_id, "failed", payload={"error": str(e)})
+                    self._ledger_submit("mark_order_final", sl_client_id, "failed", payload={"error": str(e)})
                 if tp_client_id:
-                    self.ledger.mark_order_final(tp_client_id, "failed", payload={"error": str(e)})
+                    self._ledger_submit("mark_order_final", tp_client_id, "failed", payload={"error": str(e)})
                 native_ok = False
-                print(f"⚠️  {symbol}: native protections failed → fallback synthetic. err={e}")
+                logger.warning("⚠️  %s: native protections failed → fallback synthetic. err=%s", symbol, e)
 
         if not native_ok and (sl_price or tp_price):
-            self._protections[symbol] = {"mode": "synthetic", "broker": broker_name, "trade_id": trade_id, "signal_id": signal_id, "qty": qty, "sl": sl_price, "tp": tp_price, "sl_client_id": self._make_client_id(broker_name, symbol, "sl", signal_id) if sl_price else None, "tp_client_id": self._make_client_id(broker_name, symbol, "tp", signal_id) if tp_price else None, "last_price": current_price, "created_at": datetime.utcnow().isoformat()}
+            self._protections[symbol] = _new_protection("synthetic", broker_name, trade_id, signal_id, last_price=current_price, qty=qty, sl=sl_price, tp=tp_price, sl_client_id=sl_client_id, tp_client_id=tp_client_id)
             self._persist_protections()
-            print(f"🛡️  {symbol}: synthetic protections armed (SL={sl_price}, TP={tp_price})")
+            logger.info("🛡️  %s: synthetic protections armed (SL=%s, TP=%s)", symbol, sl_price, tp_price)
 
         # LIVE strict: если брокер умеет native SL/TP и они не поставились — закрываем позицию
-        if self._strict_protections_enabled() and hasattr(broker, "place_protection_orders") and (sl_price or tp_price) and not native_ok:
+        if ctx.strict and hasattr(broker, "place_protection_orders") and (sl_price or tp_price) and not native_ok:
             await self._panic_close_unprotected(
                 symbol=symbol,
                 broker_name=broker_name,
@@ -1692,7 +2449,7 @@ class AsyncStrategyRunner:
             )
             return
 
-        print(f"✅ ENTRY {symbol}: qty={qty} price≈{current_price} p={probability:.3f} risk={risk_per_trade:.4f}")
+        logger.info("✅ ENTRY %s: qty=%s price≈%s p=%.3f risk=%.4f", symbol, qty, current_price, probability, risk_per_trade)
 
     def request_stop(self):
             """
@@ -1711,19 +2468,27 @@ class AsyncStrategyRunner:
         max_errors = int(getattr(Config, "RUNNER_MAX_CONSECUTIVE_ERRORS", 5) or 5)
         if max_errors < 1: 
             max_errors = 1
-        consecutive_errors = 0
-        
+
         kill_path = getattr(Config, "KILL_SWITCH_FILE", os.path.join(self._state_dir, "kill_switch.json"))
-        os.makedirs(os.path.dirname(kill_path) or ".", exist_ok=True)
+        await asyncio.to_thread(os.makedirs, os.path.dirname(kill_path) or ".", exist_ok=True)
         
-        print(f"🧯 Auto kill-switch armed: {max_errors} consecutive errors → close all & exit")
+        logger.info("🧯 Auto kill-switch armed: %s consecutive errors → close all & exit", max_errors)
+
+        try:
+            await self._run_forever_loop(risk_per_trade, sleep_interval, max_errors, kill_path)
+        finally:
+            self.flush_now()
+            self._write_heartbeat()
+
+    async def _run_forever_loop(self, risk_per_trade: float | None, sleep_interval: float, max_errors: int, kill_path: str) -> None:
+        consecutive_errors = 0
 
         while self._keep_running:
             # 1. Heartbeat (начало цикла)
             self._touch_heartbeat("alive", note="loop_top")
 
-            # 2. Kill-Switch Check
-            if self._kill_switch_enabled():
+            # 2. Kill-Switch Check (чтение файла — в потоке, не в event loop)
+            if await asyncio.to_thread(self._kill_switch_enabled):
                 self._touch_heartbeat("stopped", note="kill_switch_enabled")
                 await self._handle_kill_switch(reason="manual_or_guard")
                 return
@@ -1746,12 +2511,13 @@ class AsyncStrategyRunner:
                 await self.alerter.send(f"🔴 Runner ERROR ({consecutive_errors}/{max_errors}): {e}")
                 consecutive_errors += 1
                 self._touch_heartbeat("error", note="cycle_error", extra={"error": str(e), "consecutive_errors": consecutive_errors})
-                print(f"[FATAL] runner loop error ({consecutive_errors}/{max_errors}): {e}")
+                logger.error("[FATAL] runner loop error (%s/%s): %s", consecutive_errors, max_errors, e)
 
                 # Если превышен лимит ошибок -> Kill Switch
                 if consecutive_errors >= max_errors:
                     reason = f"auto_max_consecutive_errors:{consecutive_errors}"
-                    atomic_write_json(
+                    await asyncio.to_thread(
+                        atomic_write_json,
                         kill_path,
                         {
                             "enabled": True,
@@ -1777,7 +2543,6 @@ class AsyncStrategyRunner:
 
 async def _amain():
     # [FIX] Включаем логирование
-    from config import setup_logging
     setup_logging()
 
     parser = argparse.ArgumentParser(description="Async Strategy Runner")
@@ -1799,59 +2564,13 @@ async def _amain():
     )
 
     if not args.loop:
-        await runner.run_strategy(risk_per_trade=args.risk_level)
-        return
-    max_errors = int(getattr(Config, "RUNNER_MAX_CONSECUTIVE_ERRORS", 5) or 5)
-    if max_errors < 1:
-        max_errors = 1
-    consecutive_errors = 0
-
-    kill_path = getattr(Config, "KILL_SWITCH_FILE", os.path.join(runner._state_dir, "kill_switch.json"))
-    os.makedirs(os.path.dirname(kill_path) or ".", exist_ok=True)
-    print(f"🧯 Auto kill-switch armed: {max_errors} consecutive errors → close all & exit")
-
-    while True:
-        # HEARTBEAT: раннер жив (начало цикла)
-        runner._touch_heartbeat("alive", note="loop_top")
-
-        # (2) kill-switch: если включили — закрываем всё и выходим
-        if runner._kill_switch_enabled():
-            runner._touch_heartbeat("stopped", note="kill_switch_enabled")
-            await runner._handle_kill_switch(reason="manual_or_guard")
-            return
-
         try:
             await runner.run_strategy(risk_per_trade=args.risk_level)
-            consecutive_errors = 0  # успех → сброс
-            runner._touch_heartbeat("ok", note="cycle_ok", extra={"consecutive_errors": consecutive_errors})
-        except asyncio.CancelledError:
-            runner._touch_heartbeat("stopped", note="cancelled")
-            raise
-        except Exception as e:
-            await runner.alerter.send(f"🔴 Runner ERROR ({consecutive_errors}/{max_errors}): {e}")
-            consecutive_errors += 1
-            runner._touch_heartbeat("error", note="cycle_error", extra={"error": str(e), "consecutive_errors": consecutive_errors})
-            print(f"[FATAL] runner loop error ({consecutive_errors}/{max_errors}): {e}")
-
-            if consecutive_errors >= max_errors:
-                reason = f"auto_max_consecutive_errors:{consecutive_errors}"
-                atomic_write_json(
-                    kill_path,
-                    {
-                        "enabled": True,
-                        "reason": reason,
-                        "enabled_at": datetime.utcnow().isoformat(),
-                        "consecutive_errors": consecutive_errors,
-                        "last_error": str(e),
-                    },
-                )
-                runner._touch_heartbeat("stopped", note="auto_kill_switch", extra={"reason": reason})
-                await runner._handle_kill_switch(reason=reason)
-                return
-
-        # HEARTBEAT: перед сном тоже отметимся (полезно при большом sleep)
-        runner._touch_heartbeat("alive", note="sleeping", extra={"sleep_s": float(args.sleep)})
-        await asyncio.sleep(float(args.sleep))
+        finally:
+            runner.flush_now()
+        return
+    # run_forever: тот же цикл (heartbeat, kill-switch, авто-стоп), плюс финальный flush состояния
+    await runner.run_forever(risk_per_trade=args.risk_level, sleep_interval=float(args.sleep))
 
 
 if __name__ == "__main__":
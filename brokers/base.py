@@ -1,9 +1,10 @@
 # brokers/base.py
 from __future__ import annotations
 
+import asyncio
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Literal, Optional, List
+from typing import Dict, Literal, Optional, List
 from datetime import datetime
 
 import pandas as pd
@@ -120,6 +121,15 @@ class BrokerAPI(ABC):
         """
         ...
 
+    async def get_current_prices(self, symbols: List[str]) -> Dict[str, float]:
+        """
+        Цены нескольких инструментов: symbol -> price.
+        По умолчанию — параллельные get_current_price; брокер может переопределить одним запросом.
+        """
+        syms = list(dict.fromkeys(symbols))
+        prices = await asyncio.gather(*(self.get_current_price(s) for s in syms))
+        return dict(zip(syms, prices))
+
     # --- Аккаунт / портфель ---
 
     @abstractmethod
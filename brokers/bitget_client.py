@@ -2,25 +2,142 @@
 from __future__ import annotations
 
 import asyncio
-import base64
-import hashlib
+import binascii
 import hmac
 import json
 import logging
 import random
 import time
 from datetime import datetime
+from functools import lru_cache
+from operator import itemgetter
+from urllib.parse import urlencode
 from rate_limiter import AsyncTokenBucket
 from typing import List, Dict, Any, Optional, Literal, Union
 from decimal import Decimal, ROUND_DOWN
 
 import aiohttp
+import numpy as np
 import pandas as pd
 
 from .base import BrokerAPI, OrderRequest, OrderResult, Position, AccountState
 
+try:
+    import orjson  # опционально: быстрый сериализатор тела signed-запросов
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+_KLINE_COLUMNS = [
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "taker_buy_base",
+    "funding_rate",
+    "imbalance",
+]
+
+# Маппинг внутренних таймфреймов на granularity Bitget
+_INTERVAL_MAP: Dict[str, str] = {
+    "1m": "1min",
+    "3m": "3min",
+    "5m": "5min",
+    "15m": "15min",
+    "30m": "30min",
+    "1h": "1h",
+    "4h": "4h",
+    "6h": "6h",
+    "12h": "12h",
+    "1d": "1day",
+    "1day": "1day",
+    "3d": "3day",
+    "1w": "1week",
+    "1wk": "1week",
+    "1week": "1week",
+    "1mo": "1M",
+    "1mth": "1M",
+}
+
+# Квантайзеры по умолчанию (qty: 4 знака, price: 6 знаков), если символа нет в правилах
+_DEFAULT_QTY_Q = Decimal(1).scaleb(-4)
+_DEFAULT_PX_Q = Decimal(1).scaleb(-6)
+# precision -> квантайзер, для _q_str с произвольной точностью
+_QUANT_CACHE: Dict[int, Decimal] = {4: _DEFAULT_QTY_Q, 6: _DEFAULT_PX_Q}
+
+# Статус ордера Bitget -> внутренний статус OrderResult
+_STATUS_NORM: Dict[str, str] = {
+    "filled": "filled",
+    "cancelled": "canceled",
+    "canceled": "canceled",
+    "rejected": "rejected",
+    "live": "submitted",
+    "partially_filled": "submitted",
+}
+_FINAL_ORDER_STATUSES = frozenset({"filled", "cancelled", "canceled", "rejected"})
+
+# HTTP-коды, на которых запрос повторяем с backoff
+_RETRYABLE_HTTP = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+# Статусы в списках открытых ордеров (unfilled-orders)
+_OPEN_ORDER_STATUS_MAP: Dict[str, str] = {
+    "new": "new",
+    "partially_filled": "partial",
+    "filled": "filled",
+    "cancelled": "canceled",
+}
+
+# Поля записи unfilled-orders, которые разбираем (порядок важен для распаковки)
+_OPEN_ORDER_FIELDS = itemgetter("orderId", "side", "size", "priceAvg", "price", "status", "cTime")
+
+_SIDE_MAP: Dict[str, str] = {"buy": "buy", "sell": "sell"}
+_ORDER_TYPE_MAP: Dict[str, str] = {"limit": "limit", "market": "market"}
+
+
+def _dumps_body(data: Dict[str, Any]) -> bytes:
+    """Компактный JSON с отсортированными ключами; эти же bytes и подписываются, и уходят в запрос."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(data, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+def _to_float(v: Any, default: float = 0.0) -> float:
+    """
+    Число из поля ответа Bitget без исключений на штатном пути:
+    None/"" → default, числа — как есть, строки — после дешёвой синтаксической проверки.
+    """
+    if v is None:
+        return default
+    if isinstance(v, (int, float)):
+        return float(v)
+    s = str(v).strip()
+    if not s:
+        return default
+    if s.lstrip("-").replace(".", "", 1).isdigit():
+        return float(s)
+    try:  # редкие форматы ("1e-8", "inf") и мусор
+        return float(s)
+    except ValueError:
+        return default
+
+
+@lru_cache(maxsize=256)
+def _ms_to_datetime(ts_ms: int) -> datetime | None:
+    """cTime ордера -> datetime; при опросе одни и те же ордера приходят снова — кэшируем."""
+    return datetime.fromtimestamp(ts_ms / 1000.0) if ts_ms > 0 else None
+
+
+def _loads_body(raw: bytes) -> Any:
+    """Разбор ответа прямо из bytes (orjson), без промежуточной str."""
+    if orjson is not None:
+        return orjson.loads(raw)  # orjson.JSONDecodeError — подкласс json.JSONDecodeError
+    return json.loads(raw)
+
+
 class BitgetHTTPError(RuntimeError):
     def __init__(self, status: int, body: str, *, retry_after_s: float | None = None):
         super().__init__(f"Bitget HTTP {status}: {body}")
@@ -36,6 +153,41 @@ class BitgetAPIError(RuntimeError):
         self.msg = str(msg)
 
 
+class _FastInflight:
+    """
+    Лёгкий лимит одновременных запросов: счётчик + одно Event вместо asyncio.Semaphore.
+
+    Без конкуренции acquire/release — только инкремент/декремент без корутины-ожидания.
+    При упоре в лимит ожидающие просыпаются по Event и перепроверяют счётчик
+    (FIFO не гарантируется — для REST-запросов это не важно).
+    """
+
+    __slots__ = ("_n", "_cap", "_evt")
+
+    def __init__(self, cap: int):
+        self._n = 0
+        self._cap = max(1, int(cap))
+        self._evt = asyncio.Event()
+        self._evt.set()
+
+    async def acquire(self) -> bool:
+        while self._n >= self._cap:
+            self._evt.clear()
+            await self._evt.wait()
+        self._n += 1
+        return True
+
+    def release(self) -> None:
+        self._n -= 1
+        self._evt.set()
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+
 class BitgetBroker(BrokerAPI):
     """
     Async-брокер для Bitget (SPOT, V2 API).
@@ -57,6 +209,9 @@ class BitgetBroker(BrokerAPI):
     def __init__(self, config: Dict[str, Any]):
         self.api_key: str = config.get("api_key", "")
         self.api_secret: str = config.get("api_secret", "")
+        self._api_secret_bytes: bytes = self.api_secret.encode("utf-8")  # ключ HMAC кодируем один раз
+        self._base_headers: Dict[str, str] = {"Content-Type": "application/json", "Locale": "en-US"}
+        self._sig_prefix_cache: Dict[tuple[str, str], bytes] = {}  # (method, path) -> b"METHOD/path"
         self.passphrase: str = config.get("passphrase", "")
         self.base_url: str = config.get("base_url", "https://api.bitget.com")
 
@@ -74,18 +229,41 @@ class BitgetBroker(BrokerAPI):
         max_inflight = int(config.get("http_max_inflight", 4) or 4)
 
         self._rl = AsyncTokenBucket(rate_per_sec=rps, burst=burst)
-        self._inflight = asyncio.Semaphore(max_inflight)
+        self._inflight = _FastInflight(max_inflight)
+        self._max_inflight = max_inflight
 
         # [NEW] Хранилище правил торговли: symbol -> precision (int)
         self._symbol_rules: Dict[str, int] = {}
         self._price_rules: Dict[str, int] = {}       # price precision
+        # готовые квантайзеры Decimal под эти же точности (строятся при загрузке правил)
+        self._qty_q: Dict[str, Decimal] = {}
+        self._px_q: Dict[str, Decimal] = {}
+        self._symbol_rules_ttl_s: float = float(config.get("symbol_rules_ttl_s", 3600.0) or 3600.0)
+        self._symbol_rules_expiry: float = 0.0
+        self._rules_refresh_task: Optional[asyncio.Task] = None
+
+        # Короткий TTL-кэш тикеров: symbol -> (price, monotonic ts)
+        self._price_ttl_s: float = float(config.get("price_ttl_s", 0.5) or 0.0)
+        self._price_cache: Dict[str, tuple[float, float]] = {}
+
+        # Общие polling-таски wait_for_order_final: (order_id, client_id, symbol) -> Task
+        self._wait_tasks: Dict[tuple[str, str, str], asyncio.Task] = {}
     # ------------------------------------------------------------------
     # Lifecycle
     # ------------------------------------------------------------------
 
     async def initialize(self) -> None:
         if self.session is None:
-            self.session = aiohttp.ClientSession(timeout=self.timeout)
+            # Один хост: держим keep-alive пул под наш in-flight лимит и кэшируем DNS
+            pool = max(2, self._max_inflight * 2)
+            connector = aiohttp.TCPConnector(
+                limit=pool,
+                limit_per_host=pool,
+                ttl_dns_cache=300,
+                keepalive_timeout=75,
+                enable_cleanup_closed=True,
+            )
+            self.session = aiohttp.ClientSession(timeout=self.timeout, connector=connector)
             logger.info("BitgetBroker: async session initialized.")
         
         # [FIX] Загружаем правила торговли при старте
@@ -108,11 +286,30 @@ class BitgetBroker(BrokerAPI):
 
                 self._symbol_rules[s] = p_qty
                 self._price_rules[s] = p_px
-            
+                # "or" — как и прежде: нулевая точность трактуется как дефолтная
+                self._qty_q[s] = Decimal(1).scaleb(-(p_qty or 4))
+                self._px_q[s] = Decimal(1).scaleb(-(p_px or 6))
+
+            self._symbol_rules_expiry = time.monotonic() + self._symbol_rules_ttl_s
             logger.info(f"Bitget: loaded rules for {len(self._symbol_rules)} symbols")
         except Exception as e:
             logger.error(f"Bitget: failed to load symbol rules: {e}")
 
+    def _maybe_refresh_symbol_rules(self) -> None:
+        """Правила протухли — перезагружаем их фоном при первом обращении (без отдельного планировщика)."""
+        if time.monotonic() < self._symbol_rules_expiry:
+            return
+        task = self._rules_refresh_task
+        if task is not None and not task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        # до завершения загрузки пользуемся старыми правилами; повторно не дёргаем
+        self._symbol_rules_expiry = time.monotonic() + self._symbol_rules_ttl_s
+        self._rules_refresh_task = loop.create_task(self._refresh_symbol_rules())
+
     async def close(self) -> None:
         if self.session is not None:
             await self.session.close()
@@ -137,35 +334,14 @@ class BitgetBroker(BrokerAPI):
         Маппинг внутренних таймфреймов на granularity Bitget.
         """
         normalized = interval.lower()
-
-        mapping = {
-            "1m": "1min",
-            "3m": "3min",
-            "5m": "5min",
-            "15m": "15min",
-            "30m": "30min",
-            "1h": "1h",
-            "4h": "4h",
-            "6h": "6h",
-            "12h": "12h",
-            "1d": "1day",
-            "1day": "1day",
-            "3d": "3day",
-            "1w": "1week",
-            "1wk": "1week",
-            "1week": "1week",
-            "1mo": "1M",
-            "1mth": "1M",
-        }
-
-        return mapping.get(normalized, normalized)
+        return _INTERVAL_MAP.get(normalized, normalized)
 
     def _generate_signature(
         self,
         method: str,
         path: str,
         query: str,
-        body: str,
+        body: bytes,
         timestamp: str,
     ) -> str:
         """
@@ -173,17 +349,20 @@ class BitgetBroker(BrokerAPI):
           sign = base64( HMAC_SHA256( secret, ts + method + requestPath + body ) )
         где requestPath = path + '?' + query (если есть query).
         """
-        request_path = path
-        if query:
-            request_path = f"{path}?{query}"
+        # method+path повторяются (orderInfo, assets...) — их bytes-префикс кэшируем
+        prefix = self._sig_prefix_cache.get((method, path))
+        if prefix is None:
+            prefix = f"{method.upper()}{path}".encode("utf-8")
+            self._sig_prefix_cache[(method, path)] = prefix
 
-        message = f"{timestamp}{method.upper()}{request_path}{body}"
-        mac = hmac.new(
-            self.api_secret.encode("utf-8"),
-            message.encode("utf-8"),
-            digestmod=hashlib.sha256,
-        )
-        return base64.b64encode(mac.digest()).decode("utf-8")
+        if query:
+            message = b"".join((timestamp.encode("ascii"), prefix, b"?", query.encode("utf-8"), body))
+        else:
+            message = b"".join((timestamp.encode("ascii"), prefix, body))
+        # one-shot hmac.digest → прямой вызов OpenSSL HMAC(), без inner/outer объектов hmac.HMAC
+        mac = hmac.digest(self._api_secret_bytes, message, "sha256")
+        # binascii напрямую: base64.b64encode — лишь Python-обёртка над тем же C-кодом
+        return binascii.b2a_base64(mac, newline=False).decode("ascii")
 
     async def _raw_request_once(
         self,
@@ -202,47 +381,45 @@ class BitgetBroker(BrokerAPI):
         assert self.session is not None
 
         url = f"{self.base_url}{endpoint}"
-        ts = str(int(time.time() * 1000))
+        method = method.upper()
+        # целые миллисекунды без float-умножения; эта же строка идёт и в заголовок, и в подпись
+        ts = str(time.time_ns() // 1_000_000)
 
-        headers = {
-            "Content-Type": "application/json",
-            "Locale": "en-US",
-        }
+        headers = self._base_headers  # только читается aiohttp; для signed ниже — копия с ACCESS-*
 
-        body_str = ""
+        body = b""
         query_str = ""
 
         params_list = None
         if params:
-            from urllib.parse import urlencode
-            params_list = [(str(k), str(v)) for k, v in sorted(params.items(), key=lambda x: x[0])]
+            # ключи dict уникальны — кортежи сортируются по ключу и без key=lambda
+            params_list = [(str(k), str(v)) for k, v in sorted(params.items())]
             query_str = urlencode(params_list)
 
         if data:
-            body_str = json.dumps(data, separators=(",", ":"), sort_keys=True)
+            body = _dumps_body(data)
 
         if signed:
             if not (self.api_key and self.api_secret and self.passphrase):
                 raise ValueError("BitgetBroker: API credentials missing for signed request.")
-            signature = self._generate_signature(method, endpoint, query_str, body_str, ts)
-            headers.update(
-                {
-                    "ACCESS-KEY": self.api_key,
-                    "ACCESS-SIGN": signature,
-                    "ACCESS-TIMESTAMP": ts,
-                    "ACCESS-PASSPHRASE": self.passphrase,
-                }
-            )
+            signature = self._generate_signature(method, endpoint, query_str, body, ts)
+            headers = {
+                **self._base_headers,
+                "ACCESS-KEY": self.api_key,
+                "ACCESS-SIGN": signature,
+                "ACCESS-TIMESTAMP": ts,
+                "ACCESS-PASSPHRASE": self.passphrase,
+            }
 
         try:
             async with self.session.request(
-                method.upper(),
+                method,
                 url,
-                params=params_list if method.upper() == "GET" else None,
-                data=body_str if method.upper() in {"POST", "DELETE"} else None,
+                params=params_list if method == "GET" else None,
+                data=body if method in {"POST", "DELETE"} else None,
                 headers=headers,
             ) as resp:
-                text = await resp.text()
+                raw = await resp.read()
 
                 if resp.status != 200:
                     retry_after = None
@@ -252,9 +429,11 @@ class BitgetBroker(BrokerAPI):
                             retry_after = float(ra)
                     except Exception:
                         retry_after = None
+                    # текст тела нужен только для ошибки — декодируем лишь здесь
+                    text = raw.decode("utf-8", "replace")
                     raise BitgetHTTPError(resp.status, text, retry_after_s=retry_after)
 
-                payload = json.loads(text)
+                payload = _loads_body(raw)
                 return payload
 
         except (aiohttp.ClientError, asyncio.TimeoutError) as e:
@@ -298,7 +477,6 @@ class BitgetBroker(BrokerAPI):
         - retry/backoff на сетевые/таймаут ошибки
         """
         max_retries = int(getattr(self, "http_max_retries", 4) or 4)
-        retryable_http = {408, 425, 429, 500, 502, 503, 504}
 
         last_err: Exception | None = None
 
@@ -306,7 +484,8 @@ class BitgetBroker(BrokerAPI):
             try:
                 await self._inflight.acquire()
                 try:
-                    await self._rl.acquire()  # <= вот он, “глушитель 429”
+                    if not self._rl.try_acquire():  # токен есть — без лишнего переключения задачи
+                        await self._rl.acquire()  # <= вот он, “глушитель 429”
                     payload = await self._raw_request_once(
                         method, endpoint, params=params, data=data, signed=signed
                     )
@@ -327,7 +506,7 @@ class BitgetBroker(BrokerAPI):
 
             except BitgetHTTPError as e:
                 last_err = e
-                if e.status in retryable_http and attempt < max_retries:
+                if e.status in _RETRYABLE_HTTP and attempt < max_retries:
                     sleep_s = self._calc_backoff_s(attempt, retry_after_s=getattr(e, "retry_after_s", None))
                     logger.warning(f"Bitget HTTP {e.status} retry in {sleep_s:.2f}s (endpoint={endpoint})")
                     await asyncio.sleep(sleep_s)
@@ -387,90 +566,67 @@ class BitgetBroker(BrokerAPI):
         )
 
         if not data or (isinstance(data, list) and len(data) == 0):
-            return pd.DataFrame(
-                columns=[
-                    "open",
-                    "high",
-                    "low",
-                    "close",
-                    "volume",
-                    "taker_buy_base",
-                    "funding_rate",
-                    "imbalance",
-                ]
-            )
+            return pd.DataFrame(columns=_KLINE_COLUMNS)
 
-        rows = []
-        for item in data:
-            if isinstance(item, dict):
-                ts_raw = item.get("ts")
-                ts_ms = int(float(ts_raw))
-                open_ = float(item["open"])
-                high = float(item["high"])
-                low = float(item["low"])
-                close = float(item["close"])
-                base_vol = float(item.get("baseVol", item.get("baseVolume", 0.0)))
-            else:
-                # ожидаемый формат: [ts, open, high, low, close, baseVol, quoteVol, usdtVol]
-                if len(item) < 6:
-                    logger.warning(f"Bitget candles: unexpected array length={len(item)}: {item}")
-                    continue
-                ts_ms = int(float(item[0]))
-                open_ = float(item[1])
-                high = float(item[2])
-                low = float(item[3])
-                close = float(item[4])
-                base_vol = float(item[5])
-
-            ts = datetime.utcfromtimestamp(ts_ms / 1000.0)
-
-            rows.append(
-                {
-                    "open_time": ts,
-                    "open": open_,
-                    "high": high,
-                    "low": low,
-                    "close": close,
-                    "volume": base_vol,
-                    "taker_buy_base": 0.0,
-                    "funding_rate": 0.0,
-                    "imbalance": 0.0,
-                }
-            )
+        # Колонночный разбор вместо dict на свечу: формат строк определяем один раз.
+        if isinstance(data[0], dict):
+            n = len(data)
+            ts = np.fromiter((int(float(x["ts"])) for x in data), dtype=np.int64, count=n)
 
-        if not rows:
-            return pd.DataFrame(
-                columns=[
-                    "open",
-                    "high",
-                    "low",
-                    "close",
-                    "volume",
-                    "taker_buy_base",
-                    "funding_rate",
-                    "imbalance",
-                ]
-            )
+            def _col(key: str) -> np.ndarray:
+                return np.fromiter((float(x[key]) for x in data), dtype=np.float64, count=n)
 
-        df = pd.DataFrame(rows)
-        df.sort_values("open_time", inplace=True)
-        df.set_index("open_time", inplace=True)
-
-        return df[
-            [
-                "open",
-                "high",
-                "low",
-                "close",
-                "volume",
-                "taker_buy_base",
-                "funding_rate",
-                "imbalance",
-            ]
-        ]
+            o, h, l, c = _col("open"), _col("high"), _col("low"), _col("close")
+            vol = np.fromiter(
+                (float(x.get("baseVol", x.get("baseVolume", 0.0))) for x in data),
+                dtype=np.float64,
+                count=n,
+            )
+        else:
+            # ожидаемый формат: [ts, open, high, low, close, baseVol, quoteVol, usdtVol]
+            rows = data
+            if any(len(item) < 6 for item in data):
+                rows = [item for item in data if len(item) >= 6]
+                logger.warning(
+                    "Bitget candles: skipped %d rows with unexpected array length",
+                    len(data) - len(rows),
+                )
+                if not rows:
+                    return pd.DataFrame(columns=_KLINE_COLUMNS)
+            arr = np.asarray([item[:6] for item in rows], dtype=np.float64)
+            ts = arr[:, 0].astype(np.int64)
+            o, h, l, c, vol = arr[:, 1], arr[:, 2], arr[:, 3], arr[:, 4], arr[:, 5]
+
+        # Bitget обычно отдаёт свечи по возрастанию — тогда сортировка не нужна
+        if ts.size > 1 and not bool(np.all(np.diff(ts) >= 0)):
+            order = np.argsort(ts, kind="stable")
+            ts, o, h, l, c, vol = ts[order], o[order], h[order], l[order], c[order], vol[order]
+
+        zeros = np.zeros(ts.size, dtype=np.float64)
+        idx = pd.to_datetime(ts, unit="ms")
+        idx.name = "open_time"
+
+        return pd.DataFrame(
+            {
+                "open": o,
+                "high": h,
+                "low": l,
+                "close": c,
+                "volume": vol,
+                "taker_buy_base": zeros,
+                "funding_rate": zeros.copy(),
+                "imbalance": zeros.copy(),
+            },
+            index=idx,
+        )
 
     async def get_current_price(self, symbol: str) -> float:
         bg_symbol = self._to_bitget_symbol(symbol)
+
+        cached = self._price_cache.get(bg_symbol)
+        if cached is not None and time.monotonic() - cached[1] < self._price_ttl_s:
+            return cached[0]
+
         params = {"symbol": bg_symbol}
 
         data = await self._request(
@@ -487,13 +643,66 @@ class BitgetBroker(BrokerAPI):
         last_pr = ticker.get("lastPr", "0")
         if not last_pr:
             raise RuntimeError(f"Bitget ticker missing lastPr for symbol={bg_symbol}")
-        
-        return float(last_pr)
+
+        price = float(last_pr)
+        self._price_cache[bg_symbol] = (price, time.monotonic())
+        return price
+
+    async def _fetch_all_tickers(self) -> Dict[str, float]:
+        """Все спот-тикеры одним запросом → {bg_symbol: lastPr}; заодно обновляет _price_cache."""
+        tickers = await self._request("GET", "/api/v2/spot/market/tickers", signed=False)
+        now = time.monotonic()
+        cache = self._price_cache
+        out: Dict[str, float] = {}
+        for t in tickers or ():
+            sym = t.get("symbol")
+            px = _to_float(t.get("lastPr"))
+            if sym and px > 0:
+                out[sym] = px
+                cache[sym] = (px, now)
+        return out
+
+    async def get_current_prices(self, symbols: List[str]) -> Dict[str, float]:
+        """Несколько цен: свежие — из _price_cache, остальные одним запросом всех тикеров (один символ — обычный тикер)."""
+        wanted = {self._to_bitget_symbol(s): s for s in symbols}
+
+        now = time.monotonic()
+        ttl = self._price_ttl_s
+        out: Dict[str, float] = {}
+        missing: Dict[str, str] = {}
+        for bg_symbol, sym in wanted.items():
+            cached = self._price_cache.get(bg_symbol)
+            if cached is not None and now - cached[1] < ttl:
+                out[sym] = cached[0]
+            else:
+                missing[bg_symbol] = sym
+        if len(missing) <= 1:
+            for sym in missing.values():
+                out[sym] = await self.get_current_price(sym)
+            return out
+
+        prices = await self._fetch_all_tickers()
+        # чего нет в общем списке — добираем поштучно (с прежними ошибками)
+        for bg_symbol, sym in missing.items():
+            px = prices.get(bg_symbol)
+            out[sym] = px if px is not None else await self.get_current_price(sym)
+        return out
 
     # ------------------------------------------------------------------
     # BrokerAPI: ACCOUNT / PORTFOLIO
     # ------------------------------------------------------------------
 
+    @staticmethod
+    def _parse_assets(data: List[Dict[str, Any]]):
+        """Разбор /account/assets: (coin, available, frozen, total) для записей с coin."""
+        for asset in data:
+            coin = asset.get("coin")
+            if not coin:
+                continue
+            available = float(asset.get("available", 0))
+            frozen = float(asset.get("frozen", 0))
+            yield coin, available, frozen, available + frozen
+
     async def get_account_state(self) -> AccountState:
         """
         Упрощённо считаем equity по USDT.
@@ -515,44 +724,29 @@ class BitgetBroker(BrokerAPI):
                 broker=self.name,
             )
 
-        details: Dict[str, Dict[str, float]] = {}
         usdt_total = 0.0
+        coins: List[tuple[str, float]] = []  # (coin, total) для ненулевых не-USDT монет
 
-        for asset in data:
-            coin = asset.get("coin")
-            if not coin:
-                continue
-
-            available = float(asset.get("available", 0))
-            frozen = float(asset.get("frozen", 0))
-            total = available + frozen
-
-            details[coin] = {
-                "available": available,
-                "total": total,
-            }
-
-            # FIX: USDT берём здесь, внутри цикла
+        # Один проход: и USDT, и список монет для оценки
+        for coin, _available, _frozen, total in self._parse_assets(data):
             if coin == "USDT":
                 usdt_total = total
+            elif total > 0:
+                coins.append((coin, total))
 
         # NEW: считаем equity как USDT + оценка монет в USDT
         equity_total = float(usdt_total)
 
-        for coin, st in details.items():
-            if coin == "USDT":
-                continue
-            qty = float((st or {}).get("total", 0.0) or 0.0)
-            if qty <= 0:
-                continue
-
-            sym = f"{coin}USDT"
+        if coins:
+            # Один запрос всех тикеров вместо N запросов по монетам
             try:
-                px = float(await self.get_current_price(sym))
-            except Exception:
-                continue
+                price_by_sym = await self._fetch_all_tickers()
+            except Exception as e:
+                logger.warning("Bitget tickers fetch failed, equity counts USDT only: %s", e)
+                price_by_sym = {}
 
-            equity_total += qty * px
+            for coin, qty in coins:
+                equity_total += qty * price_by_sym.get(f"{coin}USDT", 0.0)
 
         return AccountState(
             equity=equity_total,
@@ -577,16 +771,8 @@ class BitgetBroker(BrokerAPI):
             return []
 
         positions: List[Position] = []
-        for asset in data:
-            coin = asset.get("coin")
-            if not coin or coin == "USDT":
-                continue
-                
-            available = float(asset.get("available", 0))
-            frozen = float(asset.get("frozen", 0))
-            total = available + frozen
-            
-            if total <= 0:
+        for coin, _available, _frozen, total in self._parse_assets(data):
+            if coin == "USDT" or total <= 0:
                 continue
 
             positions.append(
@@ -607,14 +793,13 @@ class BitgetBroker(BrokerAPI):
 
     async def place_order(self, order: OrderRequest) -> OrderResult:
         endpoint = "/api/v2/spot/trade/place-order"
-
-        side_map: Dict[str, str] = {"buy": "buy", "sell": "sell"}
-        type_map: Dict[str, str] = {"limit": "limit", "market": "market"}
+        self._maybe_refresh_symbol_rules()
+        bg_symbol = self._to_bitget_symbol(order.symbol)
 
         payload: Dict[str, Any] = {
-            "symbol": self._to_bitget_symbol(order.symbol),
-            "side": side_map.get(order.side, "buy"),
-            "orderType": type_map.get(order.order_type, "limit"),
+            "symbol": bg_symbol,
+            "side": _SIDE_MAP.get(order.side, "buy"),
+            "orderType": _ORDER_TYPE_MAP.get(order.order_type, "limit"),
         }
 
         # size:
@@ -625,7 +810,7 @@ class BitgetBroker(BrokerAPI):
             quote_size = float(order.quantity) * px
             payload["size"] = str(round(quote_size, 6))
         else:
-            payload["size"] = self._qty_str(order.symbol, float(order.quantity))
+            payload["size"] = self._qty_str_bg(bg_symbol, float(order.quantity))
 
         if order.order_type == "limit":
             payload["force"] = "gtc"
@@ -633,7 +818,7 @@ class BitgetBroker(BrokerAPI):
         if order.order_type == "limit":
             if order.price is None:
                 raise ValueError("BitgetBroker.place_order: price required for limit order.")
-            payload["price"] = self._price_str(order.symbol, float(order.price))
+            payload["price"] = self._price_str_bg(bg_symbol, float(order.price))
 
         client_oid = order.client_id or None
         if client_oid:
@@ -652,44 +837,15 @@ class BitgetBroker(BrokerAPI):
 
         def _order_result_from_info(info: dict) -> OrderResult:
             st = (str(info.get("status") or "")).lower()
-            if st == "filled":
-                norm_status = "filled"
-            elif st in {"cancelled", "canceled"}:
-                norm_status = "canceled"
-            elif st == "rejected":
-                norm_status = "rejected"
-            elif st in {"live", "partially_filled"}:
-                norm_status = "submitted"
-            else:
-                norm_status = st or "submitted"
-
-            avg = 0.0
-            try:
-                if str(info.get("priceAvg") or "").strip():
-                    avg = float(info.get("priceAvg") or 0.0)
-            except Exception:
-                avg = 0.0
+            norm_status = _STATUS_NORM.get(st, st or "submitted")
 
-            px = avg
+            g = info.get
+            px = _to_float(g("priceAvg"))
             if px <= 0:
-                try:
-                    px = float(info.get("price") or 0.0)
-                except Exception:
-                    px = 0.0
-
-            qty_exec = 0.0
-            try:
-                if str(info.get("baseVolume") or "").strip():
-                    qty_exec = float(info.get("baseVolume") or 0.0)
-            except Exception:
-                qty_exec = 0.0
+                px = _to_float(g("price"))
 
-            qty_req = 0.0
-            try:
-                if str(info.get("size") or "").strip():
-                    qty_req = float(info.get("size") or 0.0)
-            except Exception:
-                qty_req = 0.0
+            qty_exec = _to_float(g("baseVolume"))
+            qty_req = _to_float(g("size"))
 
             qty = qty_exec if qty_exec > 0 else (order.quantity if order.quantity > 0 else qty_req)
 
@@ -705,7 +861,6 @@ class BitgetBroker(BrokerAPI):
 
         # --- ambiguity-safe retry loop ---
         max_retries = int(getattr(self, "http_max_retries", 4) or 4)
-        retryable_http = {408, 425, 429, 500, 502, 503, 504}
 
         last_err: Exception | None = None
 
@@ -713,7 +868,8 @@ class BitgetBroker(BrokerAPI):
             try:
                 await self._inflight.acquire()
                 try:
-                    await self._rl.acquire()  # <= тот же “глушитель 429”, что и в _request()
+                    if not self._rl.try_acquire():
+                        await self._rl.acquire()  # <= тот же “глушитель 429”, что и в _request()
                     env = await self._raw_request_once("POST", endpoint, data=payload, signed=True)
                 finally:
                     self._inflight.release()
@@ -749,7 +905,7 @@ class BitgetBroker(BrokerAPI):
 
             except BitgetHTTPError as e:
                 last_err = e
-                if e.status in retryable_http and attempt < max_retries:
+                if e.status in _RETRYABLE_HTTP and attempt < max_retries:
                     existing = await _try_lookup_existing()
                     if existing:
                         return _order_result_from_info(existing)
@@ -815,66 +971,75 @@ class BitgetBroker(BrokerAPI):
         symbol: str | None = None,
         timeout_s: float = 30.0,
         poll_s: float = 0.5,
+    ) -> OrderResult:
+        """
+        Ждёт финального статуса ордера.
+        Параллельные ожидания одного и того же ордера делят один polling-таск
+        (таймаут/интервал берутся у первого вызвавшего).
+        """
+        key = (order_id or "", client_id or "", symbol or "")
+        task = self._wait_tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(
+                self._poll_order_final(
+                    order_id=order_id,
+                    client_id=client_id,
+                    symbol=symbol,
+                    timeout_s=timeout_s,
+                    poll_s=poll_s,
+                )
+            )
+            self._wait_tasks[key] = task
+            task.add_done_callback(lambda _t, k=key: self._wait_tasks.pop(k, None))
+        # shield: отмена одного ожидающего не должна обрывать общий опрос
+        return await asyncio.shield(task)
+
+    async def _poll_order_final(
+        self,
+        *,
+        order_id: str | None,
+        client_id: str | None,
+        symbol: str | None,
+        timeout_s: float,
+        poll_s: float,
     ) -> OrderResult:
         deadline = time.time() + float(timeout_s)
         last: dict = {}
+        base_poll = float(poll_s)
+        cur_poll = base_poll
+        last_status: str | None = None
 
         while time.time() < deadline:
             try:
                 last = await self.get_order_info(order_id=order_id, client_id=client_id, symbol=symbol)
                 st = str(last.get("status") or "").lower()
-                if st in {"filled", "cancelled", "canceled", "rejected"}:
+                if st in _FINAL_ORDER_STATUSES:
                     break
+                # статус не меняется (висит live) — опрашиваем реже, экономя лимит API
+                if st == last_status:
+                    cur_poll = min(cur_poll * 1.5, max(base_poll, 5.0))
+                else:
+                    cur_poll = base_poll
+                last_status = st
             except Exception:
                 pass
-            await asyncio.sleep(float(poll_s))
+            await asyncio.sleep(max(0.0, min(cur_poll, deadline - time.time())))
 
         status = str(last.get("status") or "").lower() or "unknown"
 
-        if status == "filled":
-            norm_status = "filled"
-        elif status in {"cancelled", "canceled"}:
-            norm_status = "canceled"
-        elif status == "rejected":
-            norm_status = "rejected"
-        elif status in {"live", "partially_filled"}:
-            norm_status = "submitted"
-        else:
-            norm_status = status
+        norm_status = _STATUS_NORM.get(status, status)
 
         oid = str(last.get("orderId") or (order_id or ""))
         side_raw = str(last.get("side") or "").lower()
         side = "buy" if side_raw == "buy" else "sell" if side_raw == "sell" else "buy"
 
-        avg = 0.0
-        try:
-            if str(last.get("priceAvg") or "").strip():
-                avg = float(last.get("priceAvg") or 0.0)
-        except Exception:
-            avg = 0.0
-
-        qty_exec = 0.0
-        try:
-            if str(last.get("baseVolume") or "").strip():
-                qty_exec = float(last.get("baseVolume") or 0.0)
-        except Exception:
-            qty_exec = 0.0
-
-        qty_req = 0.0
-        try:
-            if str(last.get("size") or "").strip():
-                qty_req = float(last.get("size") or 0.0)
-        except Exception:
-            qty_req = 0.0
-
-        qty = qty_exec if qty_exec > 0 else qty_req
+        g = last.get
+        qty_exec = _to_float(g("baseVolume"))
+        qty = qty_exec if qty_exec > 0 else _to_float(g("size"))
 
-        price = avg
+        price = _to_float(g("priceAvg"))
         if price <= 0:
-            try:
-                price = float(last.get("price") or 0.0)
-            except Exception:
-                price = 0.0
+            price = _to_float(g("price"))
 
         return OrderResult(
             order_id=oid,
@@ -911,17 +1076,19 @@ class BitgetBroker(BrokerAPI):
         client_oid: str | None = None,
     ) -> dict:
         endpoint = "/api/v2/spot/trade/place-plan-order"
+        self._maybe_refresh_symbol_rules()
+        bg_symbol = self._to_bitget_symbol(symbol)
         payload = {
-            "symbol": self._to_bitget_symbol(symbol),
+            "symbol": bg_symbol,
             "side": side,  # buy/sell
-            "triggerPrice": self._price_str(symbol, trigger_price),
+            "triggerPrice": self._price_str_bg(bg_symbol, trigger_price),
             "orderType": order_type,          # limit/market
             "triggerType": trigger_type,      # fill_price/mark_price
             "planType": "amount",             # size в base coin (нам это нужно для закрытия позиции)
-            "size": self._qty_str(symbol, size),
+            "size": self._qty_str_bg(bg_symbol, size),
         }
         if execute_price is not None:
-            payload["executePrice"] = self._price_str(symbol, execute_price)
+            payload["executePrice"] = self._price_str_bg(bg_symbol, execute_price)
         if client_oid:
             payload["clientOid"] = client_oid
 
@@ -945,31 +1112,52 @@ class BitgetBroker(BrokerAPI):
         Возвращает структуру, которую ожидает AsyncStrategyRunner:
           {"sl": {"order_id": ...}, "tp": {"order_id": ...}}
         """
-        out: dict = {}
-
-        if sl_price:
-            r_sl = await self.place_plan_order(
-                symbol=symbol,
-                side="sell",
-                trigger_price=float(sl_price),
-                size=float(qty),
-                order_type="market",
-                trigger_type=trigger_type,
-                client_oid=sl_client_oid,
-            )
-            out["sl"] = {"order_id": (r_sl or {}).get("orderId")}
+        legs = [
+            (tag, price, oid)
+            for tag, price, oid in (("sl", sl_price, sl_client_oid), ("tp", tp_price, tp_client_oid))
+            if price
+        ]
+        # SL и TP независимы → отправляем параллельно: 1·RTT вместо 2·RTT
+        results = await asyncio.gather(
+            *(
+                self.place_plan_order(
+                    symbol=symbol,
+                    side="sell",
+                    trigger_price=float(price),
+                    size=float(qty),
+                    order_type="market",
+                    trigger_type=trigger_type,
+                    client_oid=oid,
+                )
+                for _, price, oid in legs
+            ),
+            return_exceptions=True,
+        )
 
-        if tp_price:
-            r_tp = await self.place_plan_order(
-                symbol=symbol,
-                side="sell",
-                trigger_price=float(tp_price),
-                size=float(qty),
-                order_type="market",
-                trigger_type=trigger_type,
-                client_oid=tp_client_oid,
+        out: dict = {}
+        for (tag, _, _), r in zip(legs, results):
+            if isinstance(r, BaseException):
+                # пустой order_id runner сам считает провалом защиты
+                logger.warning("Bitget %s plan order failed for %s: %s", tag.upper(), symbol, r)
+                out[tag] = {"order_id": None, "error": str(r)}
+                continue
+            out[tag] = {"order_id": (r or {}).get("orderId")}
+
+        # частичный провал: поставленную ногу снимаем, иначе на бирже остаётся живой sell plan
+        # для позиции, которую runner закроет или переведёт в synthetic
+        if any(not leg.get("order_id") for leg in out.values()):
+            placed = [(tag, leg["order_id"]) for tag, leg in out.items() if leg.get("order_id")]
+            cancels = await asyncio.gather(
+                *(self.cancel_plan_order(order_id=str(oid)) for _, oid in placed),
+                return_exceptions=True,
             )
-            out["tp"] = {"order_id": (r_tp or {}).get("orderId")}
+            for (tag, oid), c in zip(placed, cancels):
+                if isinstance(c, BaseException):
+                    # order_id оставляем: runner повторит отмену сам
+                    logger.warning("Bitget %s plan order %s cancel failed for %s: %s", tag.upper(), oid, symbol, c)
+                    out[tag]["cancel_error"] = str(c)
+                else:
+                    out[tag] = {"order_id": None, "cancelled": oid}
 
         return out
 
@@ -996,6 +1184,47 @@ class BitgetBroker(BrokerAPI):
         }
         await self._request("POST", endpoint, data=payload, signed=True)
 
+    def _parse_open_orders(self, data: List[Dict[str, Any]], symbol: str) -> List[OrderResult]:
+        """Список unfilled-orders -> OrderResult; битые записи пропускаем с предупреждением."""
+        OR = OrderResult
+        to_float = _to_float
+        to_dt = _ms_to_datetime
+        map_status = _OPEN_ORDER_STATUS_MAP.get
+        name = self.name
+
+        def build(oid, side, size, price_avg, price, status, c_time) -> OrderResult:
+            # поля — в порядке _OPEN_ORDER_FIELDS
+            return OR(
+                order_id=oid,
+                symbol=symbol,
+                side="buy" if side.lower() == "buy" else "sell",
+                quantity=to_float(size),
+                price=to_float(price_avg) or to_float(price),
+                status=map_status(status, "open"),
+                broker=name,
+                create_time=to_dt(int(to_float(c_time))),
+            )
+
+        try:
+            # штатный путь: все поля на месте — один itemgetter на запись, без try на каждую
+            return [build(*fields) for fields in map(_OPEN_ORDER_FIELDS, data)]
+        except Exception:
+            pass  # нет поля / битое значение — разбираем поштучно с дефолтами
+
+        results: List[OrderResult] = []
+        for item in data:
+            g = item.get
+            try:
+                results.append(
+                    build(
+                        g("orderId", ""), g("side", "buy"), g("size"), g("priceAvg"),
+                        g("price"), g("status", "open"), g("cTime"),
+                    )
+                )
+            except Exception as e:
+                logger.warning(f"BitgetBroker.get_open_orders: skip bad item {item}: {e}")
+        return results
+
     async def get_open_orders_legacy(self, symbol: str) -> List[OrderResult]:
         params = {"symbol": self._to_bitget_symbol(symbol)}
         data = await self._request(
@@ -1008,45 +1237,7 @@ class BitgetBroker(BrokerAPI):
         if not data or (isinstance(data, list) and len(data) == 0):
             return []
 
-        results: List[OrderResult] = []
-        for item in data:
-            try:
-                ord_id = item.get("orderId", "")
-                side_str = item.get("side", "buy").lower()
-                side: Literal["buy", "sell"] = "buy" if side_str == "buy" else "sell"
-
-                qty = float(item.get("size", 0))
-                price = float(item.get("priceAvg", item.get("price", 0)))
-                status = item.get("status", "open")
-
-                status_map = {
-                    "new": "new",
-                    "partially_filled": "partial",
-                    "filled": "filled",
-                    "cancelled": "canceled",
-                }
-                internal_status = status_map.get(status, "open")
-
-                ts_ms = int(item.get("cTime", 0))
-                create_time = datetime.fromtimestamp(ts_ms / 1000.0) if ts_ms > 0 else None
-
-                results.append(
-                    OrderResult(
-                        order_id=ord_id,
-                        symbol=symbol,
-                        side=side,
-                        quantity=qty,
-                        price=price,
-                        status=internal_status,
-                        broker=self.name,
-                        create_time=create_time,
-                    )
-                )
-            except Exception as e:
-                logger.warning(f"BitgetBroker.get_open_orders: skip bad item {item}: {e}")
-                continue
-
-        return results
+        return self._parse_open_orders(data, symbol)
 
 
     async def cancel_plan_order(self, *, order_id: str | None = None, client_oid: str | None = None) -> None:
@@ -1093,72 +1284,41 @@ class BitgetBroker(BrokerAPI):
         if not data or (isinstance(data, list) and len(data) == 0):
             return []
 
-        results: List[OrderResult] = []
-        for item in data:
-            try:
-                ord_id = item.get("orderId", "")
-                side_str = item.get("side", "buy").lower()
-                side: Literal["buy", "sell"] = "buy" if side_str == "buy" else "sell"
-
-                qty = float(item.get("size", 0))
-                price = float(item.get("priceAvg", item.get("price", 0)))
-                status = item.get("status", "open")
-
-                # Приводим статус Bitget к внутреннему представлению
-                status_map = {
-                    "new": "new",
-                    "partially_filled": "partial",
-                    "filled": "filled",
-                    "cancelled": "canceled",
-                }
-                internal_status = status_map.get(status, "open")
-
-                # Получаем timestamp создания ордера
-                ts_ms = int(item.get("cTime", 0))
-                create_time = datetime.fromtimestamp(ts_ms / 1000.0) if ts_ms > 0 else None
-
-                results.append(
-                    OrderResult(
-                        order_id=ord_id,
-                        symbol=symbol,
-                        side=side,
-                        quantity=qty,
-                        price=price,
-                        status=internal_status,
-                        broker=self.name,
-                        create_time=create_time,
-                    )
-                )
-            except Exception as e:
-                logger.warning(f"BitgetBroker.get_open_orders: skip bad item {item}: {e}")
-                continue
-
-        return results
+        return self._parse_open_orders(data, symbol)
     
     def _q_str(self, value: float, precision: int) -> str:
-        q = Decimal(10) ** (-precision)
+        q = _QUANT_CACHE.get(precision)
+        if q is None:
+            q = _QUANT_CACHE.setdefault(precision, Decimal(1).scaleb(-precision))
+        return self._quantize_str(value, q)
+
+    @staticmethod
+    def _quantize_str(value: float, q: Decimal) -> str:
         d = Decimal(str(value)).quantize(q, rounding=ROUND_DOWN)
         return format(d, "f")  # без scientific notation
 
     def normalize_qty(self, symbol: str, qty: float, price: float | None = None) -> float:
-        bg_symbol = self._to_bitget_symbol(symbol)
-        precision = int(self._symbol_rules.get(bg_symbol, 4) or 4)
-        return float(self._q_str(float(qty), precision))
+        q = self._qty_q.get(self._to_bitget_symbol(symbol), _DEFAULT_QTY_Q)
+        return float(self._quantize_str(float(qty), q))
 
     def normalize_price(self, symbol: str, price: float) -> float:
-        bg_symbol = self._to_bitget_symbol(symbol)
-        precision = int(self._price_rules.get(bg_symbol, 6) or 6)
-        return float(self._q_str(float(price), precision))
+        q = self._px_q.get(self._to_bitget_symbol(symbol), _DEFAULT_PX_Q)
+        return float(self._quantize_str(float(price), q))
 
     def _qty_str(self, symbol: str, qty: float) -> str:
-        bg_symbol = self._to_bitget_symbol(symbol)
-        precision = int(self._symbol_rules.get(bg_symbol, 4) or 4)
-        return self._q_str(float(qty), precision)
+        self._maybe_refresh_symbol_rules()
+        return self._qty_str_bg(self._to_bitget_symbol(symbol), qty)
 
     def _price_str(self, symbol: str, price: float) -> str:
-        bg_symbol = self._to_bitget_symbol(symbol)
-        precision = int(self._price_rules.get(bg_symbol, 6) or 6)
-        return self._q_str(float(price), precision)
+        self._maybe_refresh_symbol_rules()
+        return self._price_str_bg(self._to_bitget_symbol(symbol), price)
+
+    # варианты для уже нормализованного биржевого тикера (внутри одного ордера)
+    def _qty_str_bg(self, bg_symbol: str, qty: float) -> str:
+        return self._quantize_str(float(qty), self._qty_q.get(bg_symbol, _DEFAULT_QTY_Q))
+
+    def _price_str_bg(self, bg_symbol: str, price: float) -> str:
+        return self._quantize_str(float(price), self._px_q.get(bg_symbol, _DEFAULT_PX_Q))
 
     async def close_position(self, symbol: str, reason: str = "") -> None:
         # P0: spot close = SELL доступного количества монеты (base asset)
@@ -5,15 +5,54 @@ from dataclasses import dataclass
 from datetime import datetime
 from typing import Dict, List
 import asyncio
-import random
+import time
 import json             # <--- Добавлено
 import os               # <--- Добавлено
+import numpy as np
 import pandas as pd
 from config import Config
+from state_store import atomic_write_bytes, encode_json
 from .base import BrokerAPI, OrderRequest, OrderResult, Position, AccountState
 
+try:
+    from numba import njit
+except ImportError:  # без numba — та же функция в чистом Python
+    def njit(*_args, **_kwargs):
+        def _wrap(fn):
+            return fn
+        return _wrap
 
-@dataclass
+
+@njit("UniTuple(float64, 3)(float64, float64, float64, float64)", cache=True)
+def _update_position(old_qty, old_avg, signed_qty, trade_price):
+    """
+    Арифметика позиции после сделки: (new_qty, new_avg, realized_pnl).
+    Усреднение в ту же сторону, закрытие / разворот с фиксацией PnL.
+    """
+    if old_qty == 0.0:
+        return signed_qty, trade_price, 0.0
+
+    if (old_qty > 0 and signed_qty > 0) or (old_qty < 0 and signed_qty < 0):
+        # Усреднение
+        new_qty = old_qty + signed_qty
+        if new_qty == 0.0:
+            return 0.0, 0.0, 0.0
+        return new_qty, (old_avg * old_qty + trade_price * signed_qty) / new_qty, 0.0
+
+    # Закрытие / Разворот
+    closing_qty = min(abs(old_qty), abs(signed_qty))
+    if old_qty > 0:
+        realized = (trade_price - old_avg) * closing_qty
+    else:
+        realized = (old_avg - trade_price) * closing_qty
+
+    new_qty = old_qty + signed_qty
+    if new_qty == 0.0:
+        return 0.0, 0.0, realized
+    return new_qty, trade_price, realized  # Хвост по новой цене
+
+
+@dataclass(slots=True)
 class _SimPositionState:
     """
     Внутреннее состояние позиции для симулятора.
@@ -45,6 +84,11 @@ class SimulatedBroker(BrokerAPI):
         self.name = f"{name}_sim"
         self._underlying = data_broker
         self._currency = currency
+        # bound-методы брокера данных — один раз, а не поиском атрибута на каждую цену
+        self._fetch_price = data_broker.get_current_price
+        self._fetch_prices = data_broker.get_current_prices
+        # проскальзывание market-ордеров: берём из конфига (или дефолт 0.1%) при создании/initialize
+        self._slippage = float(getattr(Config, "SLIPPAGE", 0.001))
 
         # Начальный капитал, реализованный PnL и позиции
         self._starting_equity = float(starting_equity)
@@ -53,6 +97,24 @@ class SimulatedBroker(BrokerAPI):
 
         # Простая генерация ID ордеров
         self._order_seq = 0
+        # База ID на сессию (мс старта << 20): ID уникальны между перезапусками,
+        # даже если последний order_seq не успел попасть на диск при отложенной записи
+        self._order_seq_base = (time.time_ns() // 1_000_000) << 20
+        self._order_id_prefix = f"{self.name}-ord-"
+
+        # Эмуляция сетевой задержки: в paper — по умолчанию включена, в backtest — нет
+        mode_obj = getattr(Config, "EXECUTION_MODE", "backtest")
+        mode = str(getattr(mode_obj, "value", mode_obj)).lower()
+        self._latency_enabled = bool(getattr(Config, "SIM_LATENCY_ENABLED", mode == "paper"))
+        # задержки сэмплируем пачкой один раз и ходим по кольцу
+        self._latency_buf: List[float] = (
+            np.random.uniform(0.05, 0.3, 4096).tolist() if self._latency_enabled else []
+        )
+        self._lat_idx = 0
+
+        # Короткий кэш цен: повторные чтения в пределах одного бара не ходят к брокеру данных
+        self._price_ttl_s = float(getattr(Config, "SIM_PRICE_TTL_S", 0.05) or 0.0)
+        self._price_cache: Dict[str, tuple[float, float]] = {}  # symbol -> (price, monotonic ts)
         
         # --- [NEW] Persistence ---
         # Файл состояния, чтобы выжить после перезагрузки
@@ -61,26 +123,59 @@ class SimulatedBroker(BrokerAPI):
             os.makedirs("state", exist_ok=True)
         self._load_state()  # Пробуем восстановиться при старте
 
+        # Отложенная запись: сделки только ставят флаг, фон пишет не чаще раза в интервал
+        self._state_dirty = False
+        self._state_flush_s = float(getattr(Config, "SIM_STATE_FLUSH_S", 0.5) or 0.5)
+        self._state_flush_task: asyncio.Task | None = None
+
     # ------------------------------------------------------------------
     # PERSISTENCE (Сохранение/Загрузка)
     # ------------------------------------------------------------------
-    def _save_state(self):
-        """Сохраняем Equity, Позиции и (ВАЖНО!) счетчик ордеров."""
+    def _state_snapshot(self) -> bytes:
+        """Снимок Equity, Позиций и (ВАЖНО!) счетчика ордеров — компактный JSON."""
         data = {
             "equity": self._starting_equity,
             "realized_pnl": self._realized_pnl,
             "order_seq": self._order_seq,  # <--- Чтобы не было дублей ID
             "positions": {
                 sym: {"qty": p.quantity, "avg": p.avg_price}
-                for sym, p in self._positions.items() if p.quantity != 0
+                for sym, p in self._positions.items()
             }
         }
+        return encode_json(data, indent=None)
+
+    def _save_state(self):
+        """Синхронная запись состояния (атомарно через tmp + replace)."""
         try:
-            with open(self.state_file, 'w') as f:
-                json.dump(data, f, indent=2)
+            atomic_write_bytes(self.state_file, self._state_snapshot())
+            self._state_dirty = False
         except Exception as e:
             print(f"[SIM] ⚠️ Failed to save state: {e}")
 
+    def _mark_state_dirty(self) -> None:
+        self._state_dirty = True
+        task = self._state_flush_task
+        if task is None or task.done():
+            try:
+                self._state_flush_task = asyncio.get_running_loop().create_task(self._state_flush_loop())
+            except RuntimeError:
+                # вне event loop — пишем сразу, как раньше
+                self._save_state()
+
+    async def _state_flush_loop(self) -> None:
+        """Фоновая запись: снимок берём в loop, диск (и fsync) — в отдельном потоке."""
+        while True:
+            await asyncio.sleep(self._state_flush_s)
+            if not self._state_dirty:
+                continue
+            self._state_dirty = False
+            data = self._state_snapshot()
+            try:
+                await asyncio.to_thread(atomic_write_bytes, self.state_file, data)
+            except Exception as e:
+                self._state_dirty = True
+                print(f"[SIM] ⚠️ Failed to save state: {e}")
+
     def _load_state(self):
         """Восстанавливаем состояние."""
         if not os.path.exists(self.state_file):
@@ -96,6 +191,8 @@ class SimulatedBroker(BrokerAPI):
             loaded_pos = data.get("positions", {})
             self._positions = {}
             for sym, p_data in loaded_pos.items():
+                if not p_data.get("qty"):
+                    continue
                 self._positions[sym] = _SimPositionState(
                     quantity=p_data["qty"],
                     avg_price=p_data["avg"]
@@ -112,8 +209,26 @@ class SimulatedBroker(BrokerAPI):
         # пробрасываем инициализацию вниз, если нужно
         if hasattr(self._underlying, "initialize"):
             await self._underlying.initialize()
+        self._slippage = float(getattr(Config, "SLIPPAGE", 0.001))  # подхватываем runtime-настройки
+        if self._state_flush_task is None or self._state_flush_task.done():
+            self._state_flush_task = asyncio.create_task(self._state_flush_loop())
 
     async def close(self) -> None:
+        task, self._state_flush_task = self._state_flush_task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        if self._state_dirty:
+            # финальный снимок — в loop, запись — в потоке
+            data = self._state_snapshot()
+            try:
+                await asyncio.to_thread(atomic_write_bytes, self.state_file, data)
+                self._state_dirty = False
+            except Exception as e:
+                print(f"[SIM] ⚠️ Failed to save state: {e}")
         if hasattr(self._underlying, "close"):
             await self._underlying.close()
 
@@ -135,8 +250,36 @@ class SimulatedBroker(BrokerAPI):
             end=end,
         )
 
+    def _cached_price(self, symbol: str, now: float) -> float | None:
+        hit = self._price_cache.get(symbol)
+        if hit is not None and now - hit[1] < self._price_ttl_s:
+            return hit[0]
+        return None
+
     async def get_current_price(self, symbol: str) -> float:
-        return await self._underlying.get_current_price(symbol)
+        px = self._cached_price(symbol, time.monotonic())
+        if px is None:
+            px = await self._fetch_price(symbol)
+            self._price_cache[symbol] = (px, time.monotonic())
+        return px
+
+    async def get_current_prices(self, symbols: List[str]) -> Dict[str, float]:
+        now = time.monotonic()
+        out: Dict[str, float] = {}
+        missing: List[str] = []
+        for s in symbols:
+            px = self._cached_price(s, now)
+            if px is None:
+                missing.append(s)
+            else:
+                out[s] = px
+        if missing:
+            fresh = await self._fetch_prices(missing)
+            now = time.monotonic()
+            for s, px in fresh.items():
+                self._price_cache[s] = (px, now)
+            out.update(fresh)
+        return out
 
     # ------------------------------------------------------------------
     # Вспомогательное: переоценка позиций
@@ -149,11 +292,15 @@ class SimulatedBroker(BrokerAPI):
         """
         result: Dict[str, Position] = {}
 
-        for symbol, state in self._positions.items():
-            if state.quantity == 0:
-                continue
+        open_pos = list(self._positions.items())  # снимок: за время await позиции могут поменяться
+        if not open_pos:
+            return result
 
-            last_price = await self.get_current_price(symbol)
+        # Все цены разом (батч у брокера данных или параллельные запросы), а не по одной
+        prices = await self.get_current_prices([symbol for symbol, _ in open_pos])
+
+        for symbol, state in open_pos:
+            last_price = prices[symbol]
             qty = state.quantity
             avg = state.avg_price
 
@@ -204,13 +351,23 @@ class SimulatedBroker(BrokerAPI):
         positions = await self._revalue_positions()
         return list(positions.values())
 
+    async def _current_equity(self) -> float:
+        """Equity без сборки Position: баланс + плавающий PnL по (кэшированным) ценам."""
+        balance = self._starting_equity + self._realized_pnl
+        open_pos = list(self._positions.items())
+        if not open_pos:
+            return balance
+        prices = await self.get_current_prices([s for s, _ in open_pos])
+        # и для long, и для short: (last - avg) * signed_qty
+        return balance + sum((prices[s] - st.avg_price) * st.quantity for s, st in open_pos)
+
     # ------------------------------------------------------------------
     # TRADING LOGIC (упрощённый каркас)
     # ------------------------------------------------------------------
 
     def _next_order_id(self) -> str:
         self._order_seq += 1
-        return f"{self.name}-ord-{self._order_seq}"
+        return self._order_id_prefix + str(self._order_seq_base + self._order_seq)
 
     async def place_order(self, order: OrderRequest) -> OrderResult:
         """
@@ -218,15 +375,18 @@ class SimulatedBroker(BrokerAPI):
           1. Задержка сети (latency)
           2. Проскальзывание (slippage) для Market-ордеров
           3. Margin Call проверка
-          4. Сохранение состояния на диск
+          4. Сохранение состояния на диск (отложенно, не блокируя event loop)
         """
         # 0. Margin Call Check
-        acc = await self.get_account_state()
-        if acc.equity <= 0:
-             raise RuntimeError(f"GAME OVER: Equity is {acc.equity}. Margin Call.")
+        equity = await self._current_equity()
+        if equity <= 0:
+             raise RuntimeError(f"GAME OVER: Equity is {equity}. Margin Call.")
 
-        # 1. Latency simulation (50ms - 300ms)
-        await asyncio.sleep(random.uniform(0.05, 0.3))
+        # 1. Latency simulation (50ms - 300ms), если включена
+        if self._latency_enabled:
+            i = self._lat_idx
+            self._lat_idx = (i + 1) & 4095
+            await asyncio.sleep(self._latency_buf[i])
 
         symbol = order.symbol
         side = order.side
@@ -236,16 +396,14 @@ class SimulatedBroker(BrokerAPI):
             raise ValueError("SimulatedBroker: quantity must be > 0")
 
         # 2. Price & Slippage simulation
-        current_market_price = float(await self.get_current_price(symbol))
-        
         if order.price is not None:
             # Limit order - исполняем по заявленной (упрощение)
             trade_price = float(order.price)
         else:
-            # Market order - добавляем Slippage
-            # Берем настройку из конфига или дефолт 0.1%
-            slippage_pct = getattr(Config, 'SLIPPAGE', 0.001) 
-            
+            # Market order - добавляем Slippage (рыночная цена нужна только здесь)
+            current_market_price = float(await self.get_current_price(symbol))
+            slippage_pct = self._slippage
+
             # Эмуляция: покупка всегда чуть дороже, продажа чуть дешевле
             if side == "buy":
                 trade_price = current_market_price * (1 + slippage_pct)
@@ -253,43 +411,30 @@ class SimulatedBroker(BrokerAPI):
                 trade_price = current_market_price * (1 - slippage_pct)
 
         # 3. Update Position Logic
-        state = self._positions.get(symbol, _SimPositionState())
+        state = self._positions.get(symbol)
         signed_qty = qty if side == "buy" else -qty
 
-        if state.quantity == 0:
-            state.quantity = signed_qty
-            state.avg_price = trade_price
+        if state is None:
+            new_qty, new_avg, realized = signed_qty, float(trade_price), 0.0
         else:
-            old_qty = state.quantity
-            old_avg = state.avg_price
-
-            if (old_qty > 0 and signed_qty > 0) or (old_qty < 0 and signed_qty < 0):
-                # Усреднение
-                new_qty = old_qty + signed_qty
-                if new_qty == 0:
-                    state.quantity = 0.0; state.avg_price = 0.0
-                else:
-                    state.avg_price = (old_avg * old_qty + trade_price * signed_qty) / new_qty
-                    state.quantity = new_qty
-            else:
-                # Закрытие / Разворот
-                closing_qty = min(abs(old_qty), abs(signed_qty))
-                realized = (trade_price - old_avg) * closing_qty if old_qty > 0 else (old_avg - trade_price) * closing_qty
-                
-                self._realized_pnl += realized
-
-                new_qty = old_qty + signed_qty
-                if new_qty == 0:
-                    state.quantity = 0.0; state.avg_price = 0.0
-                else:
-                    state.quantity = new_qty
-                    state.avg_price = trade_price # Хвост по новой цене
-
-        self._positions[symbol] = state
-        
+            new_qty, new_avg, realized = _update_position(
+                float(state.quantity), float(state.avg_price), signed_qty, float(trade_price)
+            )
+        self._realized_pnl += realized
+
+        # В _positions — только ненулевые позиции; существующий объект правим на месте
+        if new_qty == 0.0:
+            if state is not None:
+                del self._positions[symbol]
+        elif state is None:
+            self._positions[symbol] = _SimPositionState(quantity=new_qty, avg_price=new_avg)
+        else:
+            state.quantity = new_qty
+            state.avg_price = new_avg
+
         # 4. Generate ID & SAVE STATE
         order_id = self._next_order_id()
-        self._save_state()  # <--- ВАЖНО: Сохраняем сразу после сделки
+        self._mark_state_dirty()  # <--- ВАЖНО: сохраняем после сделки (фоном, с коалесцированием)
 
         return OrderResult(
             order_id=order_id,
@@ -3,11 +3,37 @@ from enum import Enum
 from dotenv import load_dotenv
 import os, json
 from enum import Enum
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+_log_listener = None  # QueueListener после setup_logging()
+
+
+class _CurrentStderrHandler(logging.StreamHandler):
+    """Консольный handler, который пишет в ТЕКУЩИЙ sys.stderr (GUI подменяет его на QtLogger)."""
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
 
 def setup_logging():
-    """Настройка ротации логов."""
+    """
+    Настройка ротации логов (идемпотентно).
+    Вызывающий код только кладёт запись в очередь (QueueHandler),
+    форматирование и запись в файл/консоль — в фоновом потоке QueueListener.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+
     log_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
     root_logger = logging.getLogger()
     root_logger.setLevel(logging.INFO)
@@ -15,12 +41,16 @@ def setup_logging():
     # Файл с ротацией (макс 10 МБ, храним 5 файлов)
     file_handler = RotatingFileHandler("trade_bot.log", maxBytes=10*1024*1024, backupCount=5, encoding='utf-8')
     file_handler.setFormatter(log_formatter)
-    root_logger.addHandler(file_handler)
 
     # Консоль
-    console_handler = logging.StreamHandler()
+    console_handler = _CurrentStderrHandler()
     console_handler.setFormatter(log_formatter)
-    root_logger.addHandler(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    root_logger.addHandler(QueueHandler(log_queue))
+    _log_listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
 
     # Заглушаем болтливые библиотеки
     logging.getLogger("urllib3").setLevel(logging.WARNING)
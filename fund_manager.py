@@ -27,7 +27,7 @@ from PyQt5.QtGui import (
 from async_strategy_runner import AsyncStrategyRunner
 
 # --- ИМПОРТЫ ЛОГИКИ ПРОЕКТА ---
-from config import Config, UniverseMode, get_assets_for_universe
+from config import Config, UniverseMode, get_assets_for_universe, setup_logging
 from data_loader import DataLoader
 from indicators import FeatureEngineer
 from execution_router import ExecutionRouter
@@ -3303,6 +3303,8 @@ class FundManagerWindow(QMainWindow):
 
 if __name__ == "__main__":
     os.environ["QT_AUTO_SCREEN_SCALE_FACTOR"] = "1"
+    # раннер сам логирование не настраивает — включаем его на точке входа GUI
+    setup_logging()
     app = QApplication(sys.argv)
     app.setStyle(BlackIndicatorStyle("Fusion"))
     font = QFont("Segoe UI", 10)
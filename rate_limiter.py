@@ -10,6 +10,16 @@ class AsyncTokenBucket:
         self.updated = time.monotonic()
         self._lock = asyncio.Lock()
 
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Синхронно забирает токен, если он есть (без await/lock: в секции нет точек переключения)."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
     async def acquire(self, tokens: float = 1.0) -> None:
         while True:
             async with self._lock:
@@ -24,4 +34,5 @@ class AsyncTokenBucket:
 
                 deficit = tokens - self.tokens
                 wait_s = deficit / self.rate if self.rate > 0 else 1.0
-            await asyncio.sleep(max(0.0, wait_s))
+            # ожидание < 1 мс — просто уступаем циклу, не заводя таймер
+            await asyncio.sleep(wait_s if wait_s >= 0.001 else 0)
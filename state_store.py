@@ -7,8 +7,15 @@ import pickle
 import tempfile
 from typing import Any, TypeVar
 
+try:
+    import orjson  # опционально: Rust-энкодер, в разы быстрее stdlib json
+except ImportError:
+    orjson = None
+
 T = TypeVar("T")
 
+_ORJSON_OPTS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson is not None else 0
+
 
 def _ensure_dir(path: str) -> str:
     d = os.path.dirname(path) or "."
@@ -16,15 +23,16 @@ def _ensure_dir(path: str) -> str:
     return d
 
 
-def atomic_write_bytes(path: str, data: bytes) -> None:
-    """Write bytes atomically: write to temp file, fsync, then replace."""
+def atomic_write_bytes(path: str, data: bytes, *, fsync: bool = True) -> None:
+    """Write bytes atomically: write to temp file, fsync (optional), then replace."""
     d = _ensure_dir(path)
     fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", dir=d)
     try:
         with os.fdopen(fd, "wb") as f:
             f.write(data)
-            f.flush()
-            os.fsync(f.fileno())
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
         os.replace(tmp_path, path)
     finally:
         try:
@@ -34,14 +42,39 @@ def atomic_write_bytes(path: str, data: bytes) -> None:
             pass
 
 
-def atomic_write_json(path: str, obj: Any, *, indent: int = 2) -> None:
-    atomic_write_bytes(path, json.dumps(obj, ensure_ascii=False, indent=indent).encode("utf-8"))
+def _dumps_json(obj: Any, indent: int | None) -> bytes:
+    # orjson умеет только indent=2 или компактно; остальное (и то, что orjson не сериализует) — stdlib
+    if orjson is not None and indent in (None, 0, 2):
+        opts = _ORJSON_OPTS | (orjson.OPT_INDENT_2 if indent == 2 else 0)
+        try:
+            return orjson.dumps(obj, option=opts)
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, indent=indent).encode("utf-8")
+
+
+def _loads_json(data: bytes) -> Any:
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except ValueError:
+            pass  # напр. NaN/Infinity из файлов, записанных stdlib json
+    return json.loads(data.decode("utf-8"))
+
+
+def encode_json(obj: Any, *, indent: int | None = 2) -> bytes:
+    """Сериализация отдельно от записи: снимок можно снять в одном потоке, а писать в другом."""
+    return _dumps_json(obj, indent)
+
+
+def atomic_write_json(path: str, obj: Any, *, indent: int = 2, fsync: bool = True) -> None:
+    atomic_write_bytes(path, _dumps_json(obj, indent), fsync=fsync)
 
 
 def atomic_read_json(path: str, default: T) -> T:
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(path, "rb") as f:
+            return _loads_json(f.read())
     except Exception:
         return default
 
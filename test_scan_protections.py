@@ -0,0 +1,87 @@
+# test_scan_protections.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from config import Config
+from brokers.base import Position
+from async_strategy_runner import AsyncStrategyRunner, _new_protection
+
+
+class _FakeBroker:
+    name = "fake"
+
+    def __init__(self, price: float):
+        self.price = price
+
+    async def get_current_price(self, symbol: str) -> float:
+        return self.price
+
+
+class _FakeRouter:
+    """Минимальный роутер: одна позиция, один брокер, execute_order записывает вызовы."""
+
+    def __init__(self, symbol: str, qty: float, price: float):
+        self._positions = [Position(symbol=symbol, quantity=qty, avg_price=price, unrealized_pnl=0.0, broker="fake")]
+        self.broker = _FakeBroker(price)
+        self._active_positions = {}
+        self.orders: list[dict] = []
+
+    async def list_all_positions(self):
+        return list(self._positions)
+
+    async def get_broker_for_symbol(self, symbol: str):
+        return self.broker
+
+    async def execute_order(self, *, symbol, side, quantity, order_type, client_id=None):
+        self.orders.append({"symbol": symbol, "side": side, "quantity": quantity, "client_id": client_id})
+        return SimpleNamespace(order_id=f"ord-{len(self.orders)}", status="filled", price=self.broker.price)
+
+
+def _make_runner(tmp_path, monkeypatch, router: _FakeRouter) -> AsyncStrategyRunner:
+    # всё состояние раннера (и heartbeat через STATE_DIR) — в tmp_path; monkeypatch вернёт Config после теста
+    monkeypatch.setattr(Config, "STATE_DIR", str(tmp_path))
+    monkeypatch.setattr(Config, "RUNNER_STATE_FILE", str(tmp_path / "runner_state.json"))
+    monkeypatch.setattr(Config, "PROTECTIONS_FILE", str(tmp_path / "protections.json"))
+    monkeypatch.setattr(Config, "TRADE_DB_FILE", str(tmp_path / "trades.sqlite"))
+    return AsyncStrategyRunner(router=router, signals_file=str(tmp_path / "signals.pkl"))
+
+
+def _synthetic(symbol: str, *, sl: float, tp: float, qty: float, last_price: float) -> dict:
+    return _new_protection(
+        "synthetic", "fake", None, "sig-1",
+        last_price=last_price, qty=qty, sl=sl, tp=tp, sl_client_id=None, tp_client_id=None,
+    )
+
+
+def _scan_once(tmp_path, monkeypatch, price: float) -> tuple[dict, _FakeRouter]:
+    """Один проход _scan_protections по одной synthetic-защите; возвращает protections после прохода."""
+    symbol = "BTCUSDT"
+    router = _FakeRouter(symbol, qty=0.5, price=price)
+    runner = _make_runner(tmp_path, monkeypatch, router)
+    try:
+        runner._protections = {symbol: _synthetic(symbol, sl=90.0, tp=120.0, qty=0.5, last_price=100.0)}
+        asyncio.run(runner._scan_protections())
+        return dict(runner._protections), router
+    finally:
+        runner.ledger.close()
+
+
+def test_scan_protections_keeps_protection_inside_range(tmp_path, monkeypatch):
+    protections, router = _scan_once(tmp_path, monkeypatch, 100.5)
+    prot = protections.get("BTCUSDT")
+    assert prot is not None, "protection не должна сниматься, пока цена между SL и TP"
+    assert prot["last_price"] == 100.5
+    assert router.orders == []
+
+
+def test_scan_protections_sl_hit_closes_position(tmp_path, monkeypatch):
+    protections, router = _scan_once(tmp_path, monkeypatch, 89.0)
+    assert "BTCUSDT" not in protections
+    assert len(router.orders) == 1
+    assert router.orders[0]["side"] == "sell" and router.orders[0]["quantity"] == 0.5
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
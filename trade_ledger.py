@@ -1,10 +1,14 @@
 # trade_ledger.py
 from __future__ import annotations
 
+import asyncio
+import functools
 import json
 import os
 import sqlite3
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime
 from typing import Optional, List, Dict, Any
@@ -29,21 +33,100 @@ class TradeLedger:
     Минимальный прод-леджер (SQLite):
     - orders: идемпотентность по client_id (PRIMARY KEY)
     - trades: контекст сделки, чтобы после рестарта знать: почему мы в позиции
+
+    Из async-кода: записи через run_write (один writer-поток, порядок сохраняется),
+    чтения через run_read (to_thread) — event loop не ждёт commit/fsync.
     """
 
+    _DEFERRABLE = frozenset(("mark_order_submitted", "mark_order_final", "set_trade_entry", "close_trade", "abort_trade"))
+
     def __init__(self, db_path: str):
         self.db_path = db_path
         os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
         self._lock = threading.Lock()
-        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5.0)
         self._conn.row_factory = sqlite3.Row
+        self._configure_connection()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ledger-writer")
+        self._pending_lock = threading.Lock()
+        self._pending: List[tuple] = []
+
+    def _configure_connection(self) -> None:
+        # WAL: читатели не блокируют писателя; synchronous=NORMAL — fsync на checkpoint, а не на каждый commit
+        try:
+            self._conn.execute("PRAGMA journal_mode=WAL;")
+            self._conn.execute("PRAGMA synchronous=NORMAL;")
+            self._conn.execute("PRAGMA busy_timeout=5000;")
+        except sqlite3.DatabaseError:
+            pass
 
     def close(self) -> None:
+        try:
+            self._writer.shutdown(wait=True)
+        except Exception:
+            pass
+        try:
+            self.flush_pending()
+        except Exception:
+            pass
         try:
             self._conn.close()
         except Exception:
             pass
 
+    # ---------------- Deferred writes (fire-and-forget) ----------------
+
+    def submit(self, method: str, *args, **kwargs) -> int:
+        """
+        Отложенная запись без ожидания commit: mark_order_submitted / mark_order_final /
+        set_trade_entry / close_trade / abort_trade.
+        Применяется пачкой (один commit) в flush_pending() или перед ЛЮБЫМ следующим вызовом леджера,
+        так что чтения и reserve_order видят записи в порядке вызова.
+        Возвращает размер очереди.
+        """
+        if method not in self._DEFERRABLE:
+            raise ValueError(f"submit: method {method!r} cannot be deferred")
+        with self._pending_lock:
+            self._pending.append((method, args, kwargs))
+            return len(self._pending)
+
+    def flush_pending(self) -> None:
+        with self._locked():
+            pass
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            self._apply_pending_locked()
+            yield
+
+    def _apply_pending_locked(self) -> None:
+        with self._pending_lock:
+            if not self._pending:
+                return
+            ops, self._pending = self._pending, []
+
+        now = self._now()
+        for method, args, kwargs in ops:
+            try:
+                getattr(self, f"_{method}_locked")(now, *args, **kwargs)
+            except Exception as e:
+                # как и при прямом вызове в try/except: одна битая запись не валит остальные
+                print(f"[LEDGER] deferred {method} failed: {e}")
+        self._conn.commit()
+
+    async def run_write(self, fn, /, *args, **kwargs):
+        """
+        Выполнить мутирующий метод леджера (reserve_order / mark_order_* / close_trade / ...)
+        в единственном writer-потоке. Записи сериализуются в порядке вызова.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, functools.partial(fn, *args, **kwargs))
+
+    async def run_read(self, fn, /, *args, **kwargs):
+        """Выполнить читающий метод леджера (list_open_trades / get_open_trade / ...) вне event loop."""
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
     def initialize(self) -> None:
         with self._lock:
             cur = self._conn.cursor()
@@ -112,7 +195,7 @@ class TradeLedger:
         new_payload: dict = dict(payload or {})
         payload_s = json.dumps(new_payload, ensure_ascii=False)
 
-        with self._lock:
+        with self._locked():
             cur = self._conn.cursor()
 
             row = cur.execute(
@@ -162,82 +245,96 @@ class TradeLedger:
             self._conn.commit()
             return True
 
-    def mark_order_submitted(self, client_id: str, order_id: str, payload: Optional[dict] = None) -> None:
-            now = self._now()
-            new_payload = dict(payload or {})
-
-            with self._lock:
-                row = self._conn.execute(
-                    "SELECT payload FROM orders WHERE client_id=?",
-                    (client_id,),
-                ).fetchone()
+    def _merged_payload_locked(self, client_id: str, payload: Optional[dict], event: str, now: str, where: str) -> str:
+        """
+        merge payload: old + new (new overrides old). Вызывать под self._lock.
+        """
+        row = self._conn.execute(
+            "SELECT payload FROM orders WHERE client_id=?",
+            (client_id,),
+        ).fetchone()
 
-                if not row:
-                    raise KeyError(f"mark_order_submitted: order not found for client_id={client_id}")
+        if not row:
+            raise KeyError(f"{where}: order not found for client_id={client_id}")
 
-                # merge payload: old + new (new overrides old)
-                try:
-                    prev = json.loads(row["payload"] or "{}")
-                except Exception:
-                    prev = {}
+        try:
+            prev = json.loads(row["payload"] or "{}")
+        except Exception:
+            prev = {}
 
-                if not isinstance(prev, dict):
-                    prev = {"_prev_payload_raw": prev}
+        if not isinstance(prev, dict):
+            prev = {"_prev_payload_raw": prev}
 
-                merged = dict(prev)
-                merged.update(new_payload)
-                merged["_updated_at"] = now
-                merged["_event"] = "submitted"
+        merged = dict(prev)
+        merged.update(dict(payload or {}))
+        merged["_updated_at"] = now
+        merged["_event"] = event
 
-                payload_s = json.dumps(merged, ensure_ascii=False)
+        return json.dumps(merged, ensure_ascii=False)
 
-                self._conn.execute(
-                    "UPDATE orders SET status=?, order_id=?, payload=?, updated_at=? WHERE client_id=?",
-                    ("submitted", str(order_id), payload_s, now, client_id),
-                )
-                self._conn.commit()
+    def _mark_order_submitted_locked(self, now: str, client_id: str, order_id: str, payload: Optional[dict] = None) -> None:
+        payload_s = self._merged_payload_locked(client_id, payload, "submitted", now, "mark_order_submitted")
+        self._conn.execute(
+            "UPDATE orders SET status=?, order_id=?, payload=?, updated_at=? WHERE client_id=?",
+            ("submitted", str(order_id), payload_s, now, client_id),
+        )
 
-    def mark_order_final(self, client_id: str, status: str, payload: Optional[dict] = None) -> None:
-            now = self._now()
-            new_payload = dict(payload or {})
+    def _mark_order_final_locked(self, now: str, client_id: str, status: str, payload: Optional[dict] = None) -> None:
+        payload_s = self._merged_payload_locked(client_id, payload, f"final:{status}", now, "mark_order_final")
+        self._conn.execute(
+            "UPDATE orders SET status=?, payload=?, updated_at=? WHERE client_id=?",
+            (str(status), payload_s, now, client_id),
+        )
 
-            with self._lock:
-                row = self._conn.execute(
-                    "SELECT payload FROM orders WHERE client_id=?",
-                    (client_id,),
-                ).fetchone()
-
-                if not row:
-                    raise KeyError(f"mark_order_final: order not found for client_id={client_id}")
-
-                # merge payload: old + new (new overrides old)
-                try:
-                    prev = json.loads(row["payload"] or "{}")
-                except Exception:
-                    prev = {}
-
-                if not isinstance(prev, dict):
-                    prev = {"_prev_payload_raw": prev}
+    def mark_order_submitted(self, client_id: str, order_id: str, payload: Optional[dict] = None) -> None:
+        now = self._now()
+        with self._locked():
+            self._mark_order_submitted_locked(now, client_id, order_id, payload)
+            self._conn.commit()
 
-                merged = dict(prev)
-                merged.update(new_payload)
-                merged["_updated_at"] = now
-                merged["_event"] = f"final:{status}"
+    def mark_order_final(self, client_id: str, status: str, payload: Optional[dict] = None) -> None:
+        now = self._now()
+        with self._locked():
+            self._mark_order_final_locked(now, client_id, status, payload)
+            self._conn.commit()
 
-                payload_s = json.dumps(merged, ensure_ascii=False)
+    def record_order_result(
+        self,
+        client_id: str,
+        order_id: str,
+        *,
+        submitted_payload: Optional[dict] = None,
+        final_status: Optional[str] = None,
+        final_payload: Optional[dict] = None,
+        close_trade_id: Optional[str] = None,
+        exit_price: Optional[float] = None,
+        exit_reason: str = "",
+    ) -> None:
+        """
+        Итог отправки ордера одной транзакцией (один commit вместо 2-3):
+          submitted -> [final_status] -> [close_trade, если передан close_trade_id]
 
-                self._conn.execute(
-                    "UPDATE orders SET status=?, payload=?, updated_at=? WHERE client_id=?",
-                    (str(status), payload_s, now, client_id),
-                )
+        reserve_order сюда НЕ входит: он обязан закоммититься ДО отправки ордера (идемпотентность).
+        """
+        now = self._now()
+        with self._locked():
+            try:
+                self._mark_order_submitted_locked(now, client_id, order_id, submitted_payload)
+                if final_status:
+                    self._mark_order_final_locked(now, client_id, final_status, final_payload)
+                if close_trade_id:
+                    self._close_trade_locked(now, close_trade_id, float(exit_price or 0.0), exit_reason)
                 self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
 
     def get_trade_entry_price(self, trade_id: str) -> Optional[float]:
         """
         Возвращает entry_price для указанного trade_id.
         Используется в trailing логике для расчёта breakeven.
         """
-        with self._lock:
+        with self._locked():
             row = self._conn.execute(
                 "SELECT entry_price FROM trades WHERE trade_id = ?",
                 (trade_id,),
@@ -247,12 +344,12 @@ class TradeLedger:
             return None
 
     def get_order(self, client_id: str) -> Optional[Dict[str, Any]]:
-        with self._lock:
+        with self._locked():
             row = self._conn.execute("SELECT * FROM orders WHERE client_id=?", (client_id,)).fetchone()
             return dict(row) if row else None
 
     def list_reserved_orders(self, broker: str) -> List[OrderRecord]:
-        with self._lock:
+        with self._locked():
             rows = self._conn.execute(
                 "SELECT * FROM orders WHERE broker=? AND status='reserved' ORDER BY created_at ASC",
                 (broker,),
@@ -289,7 +386,7 @@ class TradeLedger:
         entry_client_id: str,
     ) -> None:
         now = self._now()
-        with self._lock:
+        with self._locked():
             cur = self._conn.cursor()
             row = cur.execute("SELECT trade_id FROM trades WHERE trade_id=?", (trade_id,)).fetchone()
             if row:
@@ -302,35 +399,44 @@ class TradeLedger:
                 )
             self._conn.commit()
 
+    def _set_trade_entry_locked(self, now: str, trade_id: str, entry_price: float, entry_qty: float) -> None:
+        self._conn.execute(
+            "UPDATE trades SET entry_price=?, entry_qty=?, updated_at=? WHERE trade_id=?",
+            (float(entry_price), float(entry_qty), now, trade_id),
+        )
+
+    def _close_trade_locked(self, now: str, trade_id: str, exit_price: float, reason: str) -> None:
+        self._conn.execute(
+            "UPDATE trades SET status='closed', exit_price=?, exit_reason=?, updated_at=? WHERE trade_id=?",
+            (float(exit_price), reason, now, trade_id),
+        )
+
+    def _abort_trade_locked(self, now: str, trade_id: str, reason: str) -> None:
+        self._conn.execute(
+            "UPDATE trades SET status='aborted', exit_reason=?, updated_at=? WHERE trade_id=?",
+            (reason, now, trade_id),
+        )
+
     def set_trade_entry(self, trade_id: str, entry_price: float, entry_qty: float) -> None:
         now = self._now()
-        with self._lock:
-            self._conn.execute(
-                "UPDATE trades SET entry_price=?, entry_qty=?, updated_at=? WHERE trade_id=?",
-                (float(entry_price), float(entry_qty), now, trade_id),
-            )
+        with self._locked():
+            self._set_trade_entry_locked(now, trade_id, entry_price, entry_qty)
             self._conn.commit()
 
     def close_trade(self, trade_id: str, exit_price: float, reason: str) -> None:
         now = self._now()
-        with self._lock:
-            self._conn.execute(
-                "UPDATE trades SET status='closed', exit_price=?, exit_reason=?, updated_at=? WHERE trade_id=?",
-                (float(exit_price), reason, now, trade_id),
-            )
+        with self._locked():
+            self._close_trade_locked(now, trade_id, exit_price, reason)
             self._conn.commit()
 
     def abort_trade(self, trade_id: str, reason: str) -> None:
         now = self._now()
-        with self._lock:
-            self._conn.execute(
-                "UPDATE trades SET status='aborted', exit_reason=?, updated_at=? WHERE trade_id=?",
-                (reason, now, trade_id),
-            )
+        with self._locked():
+            self._abort_trade_locked(now, trade_id, reason)
             self._conn.commit()
 
     def get_open_trade(self, broker: str, symbol: str) -> Optional[Dict[str, Any]]:
-        with self._lock:
+        with self._locked():
             row = self._conn.execute(
                 "SELECT * FROM trades WHERE broker=? AND symbol=? AND status='open' ORDER BY created_at DESC LIMIT 1",
                 (broker, symbol),
@@ -338,7 +444,7 @@ class TradeLedger:
             return dict(row) if row else None
 
     def list_open_trades(self, broker: str | None = None) -> List[Dict[str, Any]]:
-        with self._lock:
+        with self._locked():
             if broker:
                 rows = self._conn.execute(
                     "SELECT * FROM trades WHERE broker=? AND status='open' ORDER BY created_at DESC",
@@ -351,7 +457,7 @@ class TradeLedger:
         return [dict(r) for r in rows]
 
     def has_open_trade(self, broker: str, symbol: str) -> bool:
-        with self._lock:
+        with self._locked():
             row = self._conn.execute(
                 "SELECT 1 FROM trades WHERE broker=? AND symbol=? AND status='open' LIMIT 1",
                 (broker, symbol),
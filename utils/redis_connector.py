@@ -8,12 +8,18 @@ class RedisSignalBus:
     def __init__(self, host='localhost', port=6379, db=0):
         self.r = redis.Redis(host=host, port=port, db=db, decode_responses=False)
         self.key = "trade_signals:latest"
+        # монотонный счётчик публикаций: раннер сверяет его вместо перечитывания сигналов
+        self.version_key = "trade_signals:version"
+        self._version_error_reported = False  # ошибку чтения версии печатаем один раз за сбой
 
     def publish_signals(self, signals_dict):
         """Pickle dump и запись в Redis с TTL 300 сек"""
         try:
             packed = pickle.dumps(signals_dict)
-            self.r.set(self.key, packed, ex=300)
+            pipe = self.r.pipeline()
+            pipe.set(self.key, packed, ex=300)
+            pipe.incr(self.version_key)
+            pipe.execute()
             print(f"[Redis] Published signals for {len(signals_dict)} keys")
         except Exception as e:
             print(f"[Redis] Publish ERROR: {e}")
@@ -26,4 +32,20 @@ class RedisSignalBus:
                 return pickle.loads(data)
         except Exception as e:
              print(f"[Redis] Read ERROR: {e}")
-        return {}
\ No newline at end of file
+        return {}
+
+    def get_version(self):
+        """Текущая версия сигналов (None, если счётчика нет или Redis недоступен)"""
+        try:
+            v = self.r.get(self.version_key)
+            v = int(v) if v is not None else None
+        except Exception as e:
+            # раннер опрашивает версию каждые пару секунд — без флага лог забился бы на всё время сбоя
+            if not self._version_error_reported:
+                self._version_error_reported = True
+                print(f"[Redis] Version read ERROR (повторы до восстановления не печатаем): {e}")
+            return None
+        if self._version_error_reported:
+            self._version_error_reported = False
+            print("[Redis] Version read restored")
+        return v